@@ -0,0 +1,73 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from catalogue.cache import get_catalogue_version
+from maxboom.settings import CATALOGUE_CACHE_TIMEOUT
+
+
+class PrerenderedResponse(Response):
+    """Ответ с содержимым, отрисованным ранее и взятым из кэша."""
+
+    def __init__(self, data, content, **kwargs):
+        super().__init__(data, **kwargs)
+        self.prerendered_content = content
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = self.accepted_renderer.media_type
+        return self.prerendered_content
+
+
+class CatalogueCacheMixin:
+    """
+    Кэширование ответов list и retrieve по версии каталога.
+    Версия увеличивается при изменении категорий, производителей
+    и товаров, поэтому закэшированный ответ не устаревает.
+    JSON хранится в кэше отрисованным и отдается с ETag,
+    при совпадении If-None-Match возвращается ответ 304.
+    """
+    cache_timeout = CATALOGUE_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request):
+        query = sorted(request.query_params.lists())
+        request_key = hashlib.md5(
+            f'{request.get_host()}:{self.kwargs}:{query}'.encode()
+        ).hexdigest()
+        return (f'catalogue:{get_catalogue_version()}:'
+                f'{type(self).__name__}:{self.action}:{request_key}')
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            etag = quote_etag(hashlib.md5(content).hexdigest())
+            cached = (response.data, content, etag)
+            cache.set(key, cached, self.cache_timeout)
+        data, content, etag = cached
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        return PrerenderedResponse(data, content, headers={'ETag': etag})
@@ -1,7 +1,18 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import Exists, F, Q
 from django_filters.rest_framework import ModelMultipleChoiceFilter, FilterSet
 
 from rest_framework import filters
-from catalogue.models import Category, Product
+from catalogue.models import Category, CategoryClosure, Product
+from catalogue.search import SEARCH_CONFIG
+from maxboom.settings import CATALOGUE_SEARCH_BACKEND
+
+# Вес совпадений в описании относительно совпадений в названии и коде.
+DESCRIPTION_RANK_WEIGHT = 0.2
 
 
 class CustomProductSearchFilter(filters.SearchFilter):
@@ -9,17 +20,83 @@ class CustomProductSearchFilter(filters.SearchFilter):
     Поиск по имени и описанию продукта, если параметр в запросе
     description=True.
     Поиск по имени по умолчанию.
+    При CATALOGUE_SEARCH_BACKEND='postgres' и базе PostgreSQL
+    используется полнотекстовый поиск по поисковым векторам товара
+    с сортировкой по релевантности и триграммным поиском по названию,
+    если полнотекстовый поиск ничего не нашел (порог сходства задается
+    параметром pg_trgm.similarity_threshold).
     """
 
-    def get_search_fields(self, view, request):
+    def is_description_search(self, request):
         description = request.query_params.get('description', False)
-        if (
+        return (
             type(description) is str
             and description.upper() == 'TRUE'
-        ):
+        )
+
+    def get_search_fields(self, view, request):
+        if self.is_description_search(request):
             return ('name', 'category__name', 'description', 'code')
         return ('name', 'category__name', 'code')
 
+    def use_full_text_search(self):
+        return (
+            CATALOGUE_SEARCH_BACKEND == 'postgres'
+            and connection.vendor == 'postgresql'
+        )
+
+    def get_search_query(self, request):
+        """
+        Запрос с префиксным совпадением каждого слова из параметра
+        поиска, слова объединяются через И.
+        """
+        words = re.findall(
+            r'\w+', request.query_params.get(self.search_param, '')
+        )
+        if not words:
+            return None
+        return SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            config=SEARCH_CONFIG,
+            search_type='raw'
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        if not self.use_full_text_search():
+            return super().filter_queryset(request, queryset, view)
+        query = self.get_search_query(request)
+        if query is None:
+            return queryset
+        rank = SearchRank(F('search_vector'), query)
+        condition = Q(search_vector=query) | Q(
+            category__in=Category.objects.annotate(
+                search=SearchVector('name', config=SEARCH_CONFIG)
+            ).filter(search=query).values('id')
+        )
+        if self.is_description_search(request):
+            rank = rank + DESCRIPTION_RANK_WEIGHT * SearchRank(
+                F('description_vector'), query
+            )
+            condition |= Q(description_vector=query)
+        ordered = not request.query_params.get(
+            filters.OrderingFilter.ordering_param
+        )
+        # Триграммный поиск включается условием в том же запросе, если
+        # полнотекстовый ничего не нашел: PostgreSQL вычисляет
+        # некоррелированный EXISTS один раз, отдельного запроса нет.
+        search = request.query_params.get(self.search_param)
+        result = queryset.filter(
+            condition | Q(
+                ~Exists(queryset.filter(condition)),
+                name__trigram_similar=search
+            )
+        )
+        if ordered:
+            result = result.annotate(
+                rank=rank, similarity=TrigramSimilarity('name', search)
+            ).order_by('-rank', '-similarity', 'id')
+        return result
+
 
 class ProductFilterSet(FilterSet):
     """
@@ -36,6 +113,7 @@ class ProductFilterSet(FilterSet):
 
     def filter_category_in(self, queryset, name, value):
         if value:
+            self.request.filtered_categories = value
             sub_category = self.request.query_params.get(
                 'sub_category', True)
             if (
@@ -46,22 +124,14 @@ class ProductFilterSet(FilterSet):
             else:
                 sub_category = True
             if sub_category:
-                category_list = []
-                for category in value:
-                    self.category_add(
-                        category=category, category_list=category_list)
-                return queryset.filter(category__in=category_list)
+                return queryset.filter(
+                    category__in=CategoryClosure.objects.filter(
+                        ancestor__in=value
+                    ).values('descendant')
+                )
             return queryset.filter(category__in=value)
         return queryset
 
-    def category_add(self, category, category_list):
-        if type(category) is Category:
-            category_list.append(category)
-            if category.branches:
-                for item in category.branches.all():
-                    self.category_add(
-                        category=item, category_list=category_list)
-
     class Meta:
         model = Product
         fields = (
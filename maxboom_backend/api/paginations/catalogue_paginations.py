@@ -1,14 +1,28 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import OrderedDict
 
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from catalogue.cache import get_catalogue_version
 from catalogue.models import Category
+from maxboom.settings import CATALOGUE_CACHE_TIMEOUT, CATALOGUE_KEYSET_COUNT
 
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
     def get_category_name(self):
         category = int(self.request.query_params.get('category', False))
         if category:
+            for item in getattr(self.request, 'filtered_categories', ()):
+                if item.pk == category:
+                    return item.name
             return Category.objects.get(pk=category).name
         return category
 
@@ -28,3 +42,131 @@ class CustomLimitOffsetPagination(LimitOffsetPagination):
             ('previous', self.get_previous_link()),
             ('results', data)
         ]))
+
+
+class KeysetLimitOffsetPagination(CustomLimitOffsetPagination):
+    """
+    Постраничный вывод по ключу, если в запросе есть параметр cursor
+    (пустой для первой страницы), иначе по limit и offset.
+    Страница выбирается условием по полю сортировки из ordering_fields
+    представления и id вместо OFFSET, поэтому скорость не зависит
+    от номера страницы. Курсор непрозрачный, содержит значения ключа
+    последнего (первого для предыдущей страницы) товара.
+    Общее количество кэшируется по версии каталога и набору фильтров,
+    при CATALOGUE_KEYSET_COUNT=False не считается.
+    """
+    cursor_query_param = 'cursor'
+    default_ordering = 'name'
+    invalid_cursor_message = 'Неверный курсор'
+    count_params_ignored = ('cursor', 'limit', 'offset', 'ordering')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            self.limit = self.default_limit
+        self.field, self.descending = self.get_ordering(request, view)
+        cursor = self.decode_cursor(request, queryset.model)
+        self.reverse = bool(cursor and cursor.get('r'))
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(
+            f'{prefix}{self.field}', f'{prefix}id'
+        )
+        self.count = self.get_cached_count(queryset, request)
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': cursor['v']}) | Q(**{
+                    self.field: cursor['v'], f'id__{lookup}': cursor['id']
+                })
+            )
+        page = list(queryset[:self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if self.reverse:
+            page.reverse()
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page = page
+        return page
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get('ordering', '')
+        fields = getattr(view, 'ordering_fields', ())
+        for term in ordering.split(','):
+            term = term.strip()
+            if term.lstrip('-') in fields:
+                return term.lstrip('-'), term.startswith('-')
+        return self.default_ordering, False
+
+    def decode_cursor(self, request, model):
+        """
+        Курсор из запроса или None для первой страницы. Значение ключа
+        приводится к типу поля сортировки, поэтому подделанный курсор
+        дает 404, а не ошибку при построении запроса.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if not {'v', 'id'} <= set(cursor) <= {'v', 'id', 'r'}:
+                raise ValueError
+            if cursor['v'] is None or isinstance(cursor['v'], (list, dict)):
+                raise ValueError
+            field = model._meta.get_field(self.field)
+            cursor['v'] = field.to_python(cursor['v'])
+            cursor['id'] = int(cursor['id'])
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse=False):
+        cursor = {'v': getattr(instance, self.field), 'id': instance.pk}
+        if reverse:
+            cursor['r'] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(cursor, default=str).encode()
+        ).decode('ascii')
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_cached_count(self, queryset, request):
+        if not CATALOGUE_KEYSET_COUNT:
+            return None
+        params = sorted(
+            (key, value) for key, value in request.query_params.lists()
+            if key not in self.count_params_ignored
+        )
+        key = 'catalogue:{}:count:{}'.format(
+            get_catalogue_version(),
+            hashlib.md5(str(params).encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, CATALOGUE_CACHE_TIMEOUT)
+        return count
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
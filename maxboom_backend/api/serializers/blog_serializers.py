@@ -56,15 +56,15 @@ class PostLightSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_author(self, obj):
-        if obj.author:
+        if obj.author_id:
             return 'Администратор'
 
     def get_comments_quantity(self, obj):
-        comments = Comments.objects.filter(
-            post=obj,
-            is_published=True
-        )
-        return comments.count()
+        # Количество аннотируется в queryset постов категории.
+        quantity = getattr(obj, 'published_comments_count', None)
+        if quantity is None:
+            quantity = obj.comments.filter(is_published=True).count()
+        return quantity
 
 
 class PostSerializer(serializers.ModelSerializer):
@@ -95,7 +95,7 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_author(self, obj):
-        if obj.author:
+        if obj.author_id:
             return 'Администратор'
 
 
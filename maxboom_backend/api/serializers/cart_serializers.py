@@ -1,3 +1,5 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from drf_spectacular.utils import (
     extend_schema_serializer, extend_schema_field,
@@ -6,6 +8,7 @@ from rest_framework.exceptions import ValidationError
 
 from api.serializers.catalogue import ProductSerializer
 from cart.models import Cart, ProductCart
+from catalogue.models import Product
 
 
 class ProductCartListSerializer(serializers.ModelSerializer):
@@ -28,6 +31,22 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ('id', 'products', 'user',
                   'cart_full_price', 'cart_full_weight')
 
+    def to_representation(self, instance):
+        if instance.pk is None:
+            # Корзина ещё не создана, товаров в ней нет.
+            return super().to_representation(instance)
+        # Товары корзины с категориями, производителями и изображениями
+        # загружаются двумя запросами независимо от числа товаров.
+        prefetch_related_objects([instance], Prefetch(
+            'productcart_set',
+            queryset=ProductCart.objects.select_related(
+                'product__category', 'product__brand'
+            ).prefetch_related('product__images').defer(
+                'product__search_vector', 'product__description_vector'
+            )
+        ))
+        return super().to_representation(instance)
+
 
 class ProductCartCreateSerializer(serializers.ModelSerializer):
 
@@ -38,21 +57,59 @@ class ProductCartCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Обрабатывает POST и PUT методы вьюсета корзины."""
         action = self.context['request'].method
-        if products := ProductCart.objects.filter(
-                cart=validated_data['cart'],
-                product=validated_data['product']
-        ):
-            product = products[0]
-            if action == 'PUT':
-                product.amount = validated_data['amount']
-            elif action == 'POST':
-                product.amount += validated_data['amount']
-            else:
-                raise ValidationError("Неподдерживаемый метод.")
-            product.save()
-            return product
+        if action == 'PUT':
+            amount = validated_data['amount']
+        elif action == 'POST':
+            # Количество увеличивается в базе одним UPDATE, поэтому
+            # одновременные добавления товара не теряются.
+            amount = F('amount') + validated_data['amount']
         else:
-            return super().create(validated_data)
+            raise ValidationError("Неподдерживаемый метод.")
+        products = ProductCart.objects.filter(
+            cart=validated_data['cart'],
+            product=validated_data['product']
+        )
+        if products.update(amount=amount):
+            return products.get()
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            # Товар добавлен в корзину параллельным запросом.
+            products.update(amount=amount)
+            return products.get()
+
+
+class ProductCartBatchItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    amount = serializers.IntegerField()
+
+
+class ProductCartBatchSerializer(serializers.Serializer):
+    """
+    Пакет изменений товаров корзины. POST прибавляет amount
+    к количеству товара (отрицательное значение уменьшает его),
+    PUT устанавливает количество. Товары с количеством
+    не больше нуля удаляются из корзины.
+    """
+    products = ProductCartBatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_products(self, value):
+        product_ids = [item['product'] for item in value]
+        if len(set(product_ids)) != len(product_ids):
+            raise ValidationError('Товары в пакете повторяются.')
+        found = set(Product.objects.filter(
+            pk__in=product_ids
+        ).values_list('pk', flat=True))
+        if missing := [pk for pk in product_ids if pk not in found]:
+            raise ValidationError(
+                f'Товары не найдены: {", ".join(map(str, missing))}.'
+            )
+        if self.context['request'].method == 'PUT' and any(
+                item['amount'] < 0 for item in value
+        ):
+            raise ValidationError('Количество не может быть отрицательным.')
+        return value
 
 
 @extend_schema_serializer(
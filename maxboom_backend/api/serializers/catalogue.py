@@ -1,14 +1,51 @@
 from rest_framework import serializers
 
-from catalogue.models import Brand, Category, Product, ProductImage
-from maxboom.settings import DISCOUNT_ANONYM, DISCOUNT_USER
+from catalogue.models import (Brand, CatalogueSyncPhase, CatalogueUpdateJob,
+                              Category, Product, ProductImage)
+from catalogue.pricing import get_product_price, get_user_tier
 
 
 class ImageThumbnailSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор изображения товара с миниатюрами: renditions - ссылки
+    на миниатюры по размерам, srcset - значения атрибута srcset
+    по форматам. Для изображений без миниатюр оба поля пустые.
+    """
+    renditions = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ('image',)
+        fields = ('image', 'renditions', 'srcset')
+
+    def get_url(self, name):
+        url = ProductImage._meta.get_field('image').storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_renditions(self, obj):
+        return {
+            size: {
+                'width': rendition['width'],
+                'height': rendition['height'],
+                **{ext: self.get_url(name)
+                   for ext, name in rendition['files'].items()},
+            }
+            for size, rendition in obj.renditions.items()
+        }
+
+    def get_srcset(self, obj):
+        srcset = {}
+        for rendition in sorted(
+            obj.renditions.values(), key=lambda item: item['width']
+        ):
+            for ext, name in rendition['files'].items():
+                srcset.setdefault(ext, []).append(
+                    f'{self.get_url(name)} {rendition["width"]}w'
+                )
+        return {ext: ', '.join(items) for ext, items in srcset.items()}
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -21,13 +58,22 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         # fields = ('__all__')
-        exclude = ('vendor_code', 'imt_id')
+        exclude = (
+            'vendor_code', 'imt_id', 'search_vector', 'description_vector'
+        )
 
     def get_price(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated and user.userprofile.is_vendor:
-            return round(obj.price * DISCOUNT_USER, 2)
-        return round(obj.price * DISCOUNT_ANONYM, 2)
+        tier = self.context.get('price_tier')
+        if tier is None:
+            tier = get_user_tier(self.context['request'].user)
+        return get_product_price(obj, tier)
+
+
+class ProductListSerializer(ProductSerializer):
+    """Сериализатор для списка товаров, без описания товара."""
+
+    class Meta(ProductSerializer.Meta):
+        exclude = ProductSerializer.Meta.exclude + ('description',)
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -47,13 +93,12 @@ class FilterBranchesCategorySerializer(serializers.ListSerializer):
     """
 
     def to_representation(self, data):
-        data = data.filter(is_prohibited=False)
+        data = [item for item in data.all() if not item.is_prohibited]
         return super().to_representation(data)
 
 
 class BranchSerializer(serializers.ModelSerializer):
     """Сериализатор для подкатегорий"""
-    products_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
@@ -69,9 +114,6 @@ class BranchSerializer(serializers.ModelSerializer):
             read_only=True, many=True,)
         return super().to_representation(instance)
 
-    def get_products_count(self, obj):
-        return obj.products.count()
-
 
 class CategorySerializer(serializers.ModelSerializer):
     """Сериализатор для категорий"""
@@ -119,7 +161,9 @@ class CategoryTreeSerializer(CategorySerializer):
 
     branches = BranchSerializer(many=True, read_only=True)
     root = RootSerializer(read_only=True)
-    total_count = serializers.SerializerMethodField()
+    total_count = serializers.IntegerField(
+        source='subtree_products_count', read_only=True
+    )
 
     class Meta:
         list_serializer_class = FilterRootCategorySerializer
@@ -134,13 +178,32 @@ class CategoryTreeSerializer(CategorySerializer):
         )
         read_only_fields = ('branches', 'root')
 
-    def get_total_count(self, obj):
-        total_count = obj.products.count()
-        query_categories = Category.objects.all().prefetch_related(
-            'root', 'root__root', 'root__root__root',
-            'branches__branches__branches',
-            'branches__branches', 'branches',).filter(is_prohibited=False
-                                                      ).filter(root=obj)
-        for category in query_categories:
-            total_count += category.products.count()
-        return total_count
+
+class CatalogueSyncPhaseSerializer(serializers.ModelSerializer):
+    """Сериализатор этапа загрузки каталога."""
+    items_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = CatalogueSyncPhase
+        fields = ('name', 'seconds', 'items', 'calls', 'items_per_second')
+
+
+class CatalogueUpdateJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор задачи обновления каталога с временем этапов
+    и скоростью загрузки в карточках в секунду.
+    """
+    status_display = serializers.CharField(
+        source='get_status_display', read_only=True
+    )
+    duration = serializers.FloatField(read_only=True)
+    cards_per_second = serializers.FloatField(read_only=True)
+    phases = CatalogueSyncPhaseSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = CatalogueUpdateJob
+        fields = (
+            'id', 'status', 'status_display', 'full', 'created_at',
+            'started_at', 'finished_at', 'heartbeat_at', 'phase',
+            'processed', 'error', 'duration', 'cards_per_second', 'phases'
+        )
@@ -1,10 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
 from cart.utils import get_cart
 from catalogue.models import Product
+from catalogue.pricing import get_owner_tier, get_tier_price
 from order.models import (
     Commodity, CommodityRefund, Order, OrderRefund, OrderReturn
 )
@@ -12,6 +14,22 @@ from order.models import (
 User = get_user_model()
 
 
+def get_order_prefetches():
+    """
+    Связанные объекты заказа для сериализации без запросов
+    на каждый товар: платежи, товары с изображениями и возвратами.
+    """
+    return (
+        'payments',
+        Prefetch(
+            'commodities',
+            queryset=Commodity.objects.select_related(
+                'product'
+            ).prefetch_related('product__images', 'refunds')
+        ),
+    )
+
+
 class ReturnSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -83,9 +101,9 @@ class CommodityListSerializer(serializers.ModelSerializer):
 
     def get_image(self, obj):
         request = self.context.get('request')
-        if obj.product.images.all().exists():
-            image = obj.product.images.all()[0].image.url
-            return request.build_absolute_uri(image)
+        images = obj.product.images.all()
+        if images:
+            return request.build_absolute_uri(images[0].image.url)
         return None
 
     def get_price(self, obj):
@@ -117,9 +135,9 @@ class CommodityRefundListSerializer(serializers.ModelSerializer):
 
     def get_image(self, obj):
         request = self.context.get('request')
-        if obj.commodity.product.images.all().exists():
-            image = obj.commodity.product.images.all()[0].image.url
-            return request.build_absolute_uri(image)
+        images = obj.commodity.product.images.all()
+        if images:
+            return request.build_absolute_uri(images[0].image.url)
         return None
 
     def get_price(self, obj):
@@ -205,15 +223,25 @@ class OrderSerializer(serializers.ModelSerializer):
             validated_data.pop('commodities')
         order = Order.objects.create(**validated_data)
         cart = get_cart(self.context.get('request'))
-        for obj in cart.products.all():
+        # Товары корзины загружаются одним запросом, уровень цен
+        # покупателя определяется один раз на заказ. Товары в корзине
+        # уникальны, поэтому проверки уникальности и внешних ключей
+        # в базе не нужны: поля проверяются в памяти, товары заказа
+        # создаются одним запросом.
+        tier = get_owner_tier(order)
+        commodities = []
+        for line in cart.productcart_set.select_related('product'):
             commodity = Commodity(
-                product=obj,
-                order=order, quantity=obj.productcart_set.get(cart=cart).amount
+                product=line.product, order=order, quantity=line.amount,
+                price=get_tier_price(line.product.price, tier)
             )
             try:
-                commodity.full_clean()
+                commodity.full_clean(
+                    exclude=('product', 'order'), validate_unique=False
+                )
             except Exception as e:
                 raise serializers.ValidationError(f'{e}')
-            else:
-                commodity.save()
+            commodities.append(commodity)
+        Commodity.objects.bulk_create(commodities)
+        prefetch_related_objects([order], *get_order_prefetches())
         return order
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from catalogue.pricing import format_price
 from maxboom.settings import VAT_CODE
 from order.models import Order
 from payment.models import OrderPayment, Repayment
@@ -8,12 +9,15 @@ from payment.models import OrderPayment, Repayment
 class DataRepaymentSerializer(serializers.BaseSerializer):
     def to_representation(self, obj):
         items = []
-        for item in obj.order_refund.commodities.all():
+        commodities = obj.order_refund.commodities.select_related(
+            'commodity__product'
+        )
+        for item in commodities:
             items.append({
                 'description': item.commodity.product.name,
                 'quantity': str(item.quantity),
                 'amount': {
-                    'value': str(item.commodity.price),
+                    'value': format_price(item.commodity.price),
                     'currency': 'RUB'
                 },
                 'vat_code': int(VAT_CODE),
@@ -23,7 +27,7 @@ class DataRepaymentSerializer(serializers.BaseSerializer):
         return {
             'payment_id': str(obj.payment.payment_id),
             'amount': {
-                'value': str(obj.value),
+                'value': format_price(obj.value),
                 'currency': 'RUB'
             },
             'description': str(obj.order_refund),
@@ -43,12 +47,12 @@ class DataRepaymentSerializer(serializers.BaseSerializer):
 class DataSerializer(serializers.BaseSerializer):
     def to_representation(self, obj):
         items = []
-        for item in obj.order.commodities.all():
+        for item in obj.order.commodities.select_related('product'):
             items.append({
                 'description': item.product.name,
                 'quantity': str(item.quantity),
                 'amount': {
-                    'value': str(item.price),
+                    'value': format_price(item.price),
                     'currency': 'RUB'
                 },
                 'vat_code': int(VAT_CODE),
@@ -57,7 +61,7 @@ class DataSerializer(serializers.BaseSerializer):
             })
         return {
             'amount': {
-                'value': str(obj.order.value),
+                'value': format_price(obj.order.value),
                 'currency': 'RUB'
             },
             'confirmation': {
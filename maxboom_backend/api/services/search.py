@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from rest_framework.exceptions import APIException
+
+from maxboom.settings import CATALOGUE_SEARCH_CONCURRENT
+
+
+class SearchService:
+    """
+    Поиск по нескольким разделам каталога за один проход запроса.
+    Для каждого раздела создается представление без повторной
+    диспетчеризации: аутентификация, проверка прав и разбор параметров
+    выполняются один раз для исходного запроса, а разделы только
+    фильтруют, разбивают на страницы и сериализуют свои queryset.
+    При concurrent=True разделы выполняются параллельно в потоках,
+    каждый со своим соединением с базой данных.
+    """
+    concurrent = CATALOGUE_SEARCH_CONCURRENT
+
+    def __init__(self, request, sections, concurrent=None):
+        self.request = request
+        self.sections = sections
+        if concurrent is not None:
+            self.concurrent = concurrent
+
+    def get_view(self, view_class):
+        view = view_class(
+            request=self.request,
+            args=(),
+            kwargs={},
+            format_kwarg=None,
+            action='list',
+        )
+        view.headers = {}
+        return view
+
+    def search_section(self, view_class):
+        """
+        Данные раздела или None, если параметры запроса неверны:
+        ошибка фильтрации или пагинации (например, подделанный курсор)
+        одного раздела не должна прерывать поиск в остальных.
+        """
+        view = self.get_view(view_class)
+        try:
+            queryset = view.filter_queryset(view.get_queryset())
+            page = view.paginate_queryset(queryset)
+        except APIException:
+            return None
+        if page is not None:
+            serializer = view.get_serializer(page, many=True)
+            return view.get_paginated_response(serializer.data).data
+        return view.get_serializer(queryset, many=True).data
+
+    def search_section_in_thread(self, view_class):
+        try:
+            return self.search_section(view_class)
+        finally:
+            connection.close()
+
+    def search(self):
+        """
+        Словарь с результатами по разделам, None для разделов
+        с неверными параметрами запроса.
+        """
+        if not self.concurrent or len(self.sections) < 2:
+            return {
+                name: self.search_section(view_class)
+                for name, view_class in self.sections.items()
+            }
+        with ThreadPoolExecutor(max_workers=len(self.sections)) as executor:
+            futures = {
+                name: executor.submit(
+                    self.search_section_in_thread, view_class
+                )
+                for name, view_class in self.sections.items()
+            }
+            return {
+                name: future.result() for name, future in futures.items()
+            }
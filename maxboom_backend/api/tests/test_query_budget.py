@@ -0,0 +1,492 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.tests.utils import QueryBudgetMixin
+from blog.models import Category as PostCategory
+from blog.models import Comments, Post, Tag
+from cart.models import Cart, ProductCart
+from catalogue.models import Brand, Category, Product, ProductImage
+from core.models import (About, AdditionalLogo, Contacts, DeliveryInformation,
+                         Footer, Header, MailContactForm, MainLogo, MainShop,
+                         OurShop, Privacy, Requisite, Support, Terms)
+from news.models import News
+from order.models import Commodity, CommodityRefund, Order, OrderRefund
+from payment.models import OrderPayment
+from shop_reviews.models import ReplayToReview, ShopReviews
+from stories.models import Picture, Story
+
+User = get_user_model()
+
+
+def create_product(number, category=None, brand=None):
+    product = Product.objects.create(
+        name=f'Товар {number}',
+        description='Описание товара',
+        price=100 + number,
+        brand=brand,
+        category=category,
+        code=100000 + number,
+        vendor_code=f'артикул {number}',
+        wb_urls=f'https://www.wildberries.ru/catalog/{number}/',
+    )
+    ProductImage.objects.create(
+        product=product, image=f'product-images/{number}.jpg'
+    )
+    return product
+
+
+class CatalogueQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = Category.objects.create(
+            name='Категория бюджет', wb_category_id=900001
+        )
+        cls.brand = Brand.objects.create(name='Бренд бюджет')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_products(self, start, stop):
+        for number in range(start, stop):
+            create_product(
+                number, CatalogueQueryBudgetTests.category,
+                CatalogueQueryBudgetTests.brand
+            )
+
+    def create_categories(self, start, stop):
+        for number in range(start, stop):
+            branch = Category.objects.create(
+                name=f'Подкатегория {number}',
+                root=CatalogueQueryBudgetTests.category,
+                wb_category_id=910000 + number
+            )
+            Category.objects.create(
+                name=f'Вложенная категория {number}',
+                root=branch,
+                wb_category_id=920000 + number
+            )
+
+    def test_product_list(self):
+        '''список товаров'''
+        self.assertQueryBudget(
+            self.client, '/api/catalogue/?limit=100', 3,
+            self.create_products
+        )
+
+    def test_product_list_by_cursor(self):
+        '''список товаров по курсору в категории'''
+        self.assertQueryBudget(
+            self.client,
+            '/api/catalogue/?cursor=&limit=100'
+            f'&category={CatalogueQueryBudgetTests.category.pk}',
+            4, self.create_products
+        )
+
+    def test_product_detail(self):
+        '''товар с изображениями'''
+        product = create_product(0, CatalogueQueryBudgetTests.category)
+
+        def create_images(start, stop):
+            for number in range(start, stop):
+                ProductImage.objects.create(
+                    product=product, image=f'product-images/{number}.png'
+                )
+
+        self.assertQueryBudget(
+            self.client, f'/api/catalogue/{product.slug}/', 2,
+            create_images
+        )
+
+    def test_search(self):
+        '''поиск в категориях и товарах'''
+        self.assertQueryBudget(
+            self.client, '/api/search/?search=Товар&limit=100', 4,
+            self.create_products
+        )
+
+    def test_category_list(self):
+        '''список категорий'''
+        self.assertQueryBudget(
+            self.client, '/api/catalogue/category/', 6,
+            self.create_categories
+        )
+
+    def test_category_tree(self):
+        '''дерево категорий'''
+        self.assertQueryBudget(
+            self.client, '/api/catalogue/category/?category_tree=true', 4,
+            self.create_categories
+        )
+
+    def test_category_detail(self):
+        '''категория с подкатегориями'''
+        slug = CatalogueQueryBudgetTests.category.slug
+        self.assertQueryBudget(
+            self.client, f'/api/catalogue/category/{slug}/', 4,
+            self.create_categories
+        )
+
+    def test_brand_list(self):
+        '''список производителей'''
+
+        def create_brands(start, stop):
+            for number in range(start, stop):
+                Brand.objects.create(name=f'Производитель {number}')
+
+        self.assertQueryBudget(
+            self.client, '/api/catalogue/brand/', 1, create_brands
+        )
+
+    def test_brand_detail(self):
+        '''производитель'''
+        self.assertQueryBudget(
+            self.client,
+            f'/api/catalogue/brand/{CatalogueQueryBudgetTests.brand.slug}/',
+            1, self.create_products
+        )
+
+
+class BlogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_superuser(
+            'blog_admin@example.com', 'test_pass'
+        )
+        cls.category = PostCategory.objects.create(
+            title='Категория блога', slug='blog-category'
+        )
+        cls.tags = [Tag.objects.create(name=f'Тег {i}') for i in range(2)]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_posts(self, start, stop):
+        for number in range(start, stop):
+            post = Post.objects.create(
+                title=f'Пост {number}',
+                text='Текст поста',
+                author=BlogQueryBudgetTests.author,
+                category=BlogQueryBudgetTests.category,
+                slug=f'post-{number}',
+            )
+            post.tags.set(BlogQueryBudgetTests.tags)
+            Comments.objects.create(
+                author='Читатель', post=post, text='Комментарий',
+                is_published=True
+            )
+
+    def test_post_list(self):
+        '''список постов'''
+        self.assertQueryBudget(
+            self.client, '/api/shopblog/posts/', 3, self.create_posts
+        )
+
+    def test_post_detail(self):
+        '''пост'''
+        self.create_posts(0, 1)
+
+        def create_tags(start, stop):
+            post = Post.objects.get(slug='post-0')
+            post.tags.add(*(
+                Tag.objects.create(name=f'Тег поста {number}')
+                for number in range(start, stop)
+            ))
+
+        self.assertQueryBudget(
+            self.client, '/api/shopblog/posts/post-0/', 4, create_tags
+        )
+
+    def test_category_list(self):
+        '''список категорий блога'''
+
+        def create_categories(start, stop):
+            for number in range(start, stop):
+                PostCategory.objects.create(
+                    title=f'Категория {number}', slug=f'category-{number}'
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/shopblog/categories/', 2, create_categories
+        )
+
+    def test_category_detail(self):
+        '''категория блога с постами'''
+        self.assertQueryBudget(
+            self.client, '/api/shopblog/categories/blog-category/', 3,
+            self.create_posts
+        )
+
+    def test_comment_list(self):
+        '''комментарии к посту'''
+        self.create_posts(0, 1)
+        post = Post.objects.get(slug='post-0')
+
+        def create_comments(start, stop):
+            for number in range(start, stop):
+                Comments.objects.create(
+                    author=f'Читатель {number}', post=post,
+                    text='Комментарий', is_published=True
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/shopblog/posts/post-0/comments/', 2,
+            create_comments
+        )
+
+
+class ContentQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_news(self):
+        '''список новостей и новость'''
+
+        def create_news(start, stop):
+            for number in range(start, stop):
+                News.objects.create(
+                    title=f'Новость {number}', text='Текст новости',
+                    slug=f'news-{number}'
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/shopnews/', 2, create_news
+        )
+        self.assertQueryBudget(
+            self.client, '/api/shopnews/news-0/', 1, lambda *rows: None
+        )
+
+    def test_story_list(self):
+        '''истории с картинками'''
+
+        def create_stories(start, stop):
+            for number in range(start, stop):
+                story = Story.objects.create(
+                    name=f'История {number}', show=True
+                )
+                story.pictures.set(
+                    Picture.objects.create(
+                        name=f'Картинка {number}-{i}',
+                        image=f'story_pictures/{number}-{i}.jpg'
+                    )
+                    for i in range(2)
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/stories/', 3, create_stories
+        )
+
+    def test_shop_review_list(self):
+        '''отзывы о магазине с ответами'''
+
+        def create_reviews(start, stop):
+            for number in range(start, stop):
+                review = ShopReviews.objects.create(
+                    text=f'Отзыв {number}', author_name='Покупатель',
+                    delivery_speed_score=5, quality_score=4, price_score=3,
+                    is_published=True
+                )
+                ReplayToReview.objects.create(
+                    text='Ответ', review_id=review
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/store-reviews/', 3, create_reviews
+        )
+        review = ShopReviews.objects.first()
+        self.assertQueryBudget(
+            self.client, f'/api/store-reviews/{review.pk}/', 2,
+            lambda *rows: None
+        )
+
+    def test_info_pages(self):
+        '''информационные страницы'''
+        for model, url in (
+            (About, '/api/core/about/'),
+            (DeliveryInformation, '/api/core/information/'),
+            (Privacy, '/api/core/privacy/'),
+            (Terms, '/api/core/terms/'),
+        ):
+
+            def create_pages(start, stop):
+                for number in range(start, stop):
+                    model.objects.create(
+                        headline=f'Страница {number}', text='Текст'
+                    )
+
+            self.assertQueryBudget(self.client, url, 1, create_pages)
+
+    def test_contacts(self):
+        '''контакты с магазинами и реквизитами'''
+        contacts = Contacts.objects.create(headline='Контакты')
+        MainShop.objects.create(
+            name='Магазин', comment='Ежедневно', phone_number='1',
+            email='shop@example.com', location='Адрес', main_page=contacts
+        )
+        MailContactForm.objects.create(
+            headline='Обращение', ask_name='Имя', ask_email='Почта',
+            ask_message='Сообщение', send_button_text='Отправить',
+            main_page=contacts
+        )
+
+        def create_shops(start, stop):
+            for number in range(start, stop):
+                OurShop.objects.create(
+                    name=f'Магазин {number}', comment='Ежедневно',
+                    phone_number='1', photo='core/news/shop.jpg',
+                    is_main_shop=False, main_page=contacts
+                )
+                Requisite.objects.create(
+                    requisite_name=f'Реквизит {number}',
+                    requisite_description='1', main_page=contacts
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/core/contacts/', 5, create_shops
+        )
+
+    def test_base_elements(self):
+        '''хэдер и футер с логотипами'''
+        header = Header.objects.create()
+        footer = Footer.objects.create(
+            company_info='Компания', disclaimer='Авторство',
+            support_work_time='Ежедневно'
+        )
+        MainLogo.objects.create(
+            image='core/logos/main.png', url='https://example.com/',
+            header=header, footer=footer
+        )
+        Support.objects.create(
+            name='Поддержка', phone_number='1', header=header, footer=footer
+        )
+
+        def create_logos(start, stop):
+            for number in range(start, stop):
+                AdditionalLogo.objects.create(
+                    image=f'core/logos/{number}.png',
+                    url='https://example.com/', footer=footer
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/core/base/', 7, create_logos
+        )
+
+    def test_user_list(self):
+        '''пользователи с профилями'''
+
+        def create_users(start, stop):
+            for number in range(start, stop):
+                User.objects.create_user(
+                    f'user{number}@example.com', 'test_pass'
+                )
+
+        self.assertQueryBudget(self.client, '/api/users/', 2, create_users)
+
+
+class OrderQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            'order_user@example.com', 'test_pass'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(OrderQueryBudgetTests.user)
+        self.products = []
+
+    def get_product(self, number):
+        while len(self.products) <= number:
+            self.products.append(create_product(len(self.products)))
+        return self.products[number]
+
+    def create_order(self, commodities=1):
+        order = Order.objects.create(user=OrderQueryBudgetTests.user)
+        for number in range(commodities):
+            Commodity.objects.create(
+                product=self.get_product(number), order=order, quantity=2
+            )
+        return order
+
+    def create_orders(self, start, stop):
+        for number in range(start, stop):
+            order = self.create_order()
+            OrderPayment.objects.create(
+                order=order, payment_id=f'payment-{number}',
+                status='succeeded'
+            )
+
+    def test_order_list(self):
+        '''заказы с товарами и оплатами'''
+        self.assertQueryBudget(
+            self.client, '/api/order/', 6, self.create_orders
+        )
+
+    def test_order_detail(self):
+        '''заказ с товарами'''
+        order = self.create_order()
+
+        def create_commodities(start, stop):
+            for number in range(max(start, 1), stop):
+                Commodity.objects.create(
+                    product=self.get_product(number), order=order,
+                    quantity=1
+                )
+
+        self.assertQueryBudget(
+            self.client, f'/api/order/{order.pk}/', 7, create_commodities
+        )
+
+    def test_refund_list(self):
+        '''возвраты заказа с товарами'''
+        order = self.create_order(commodities=3)
+        commodities = list(order.commodities.all())
+
+        def create_refunds(start, stop):
+            for number in range(start, stop):
+                refund = OrderRefund.objects.create(order=order)
+                CommodityRefund.objects.create(
+                    commodity=commodities[number % 3], refund=refund,
+                    quantity=0
+                )
+
+        self.assertQueryBudget(
+            self.client, f'/api/order/{order.pk}/refund/', 5, create_refunds
+        )
+
+    def test_payment_list(self):
+        '''платежи заказа'''
+        order = self.create_order()
+
+        def create_payments(start, stop):
+            for number in range(start, stop):
+                OrderPayment.objects.create(
+                    order=order, payment_id=f'payment-{number}',
+                    status='succeeded'
+                )
+
+        self.assertQueryBudget(
+            self.client, f'/api/order/{order.pk}/payment/', 4,
+            create_payments
+        )
+
+    def test_cart(self):
+        '''корзина с товарами'''
+        cart = Cart.objects.create(
+            user=OrderQueryBudgetTests.user, is_active=True
+        )
+
+        def create_cart_products(start, stop):
+            for number in range(start, stop):
+                ProductCart.objects.create(
+                    cart=cart, product=self.get_product(number), amount=1
+                )
+
+        self.assertQueryBudget(
+            self.client, '/api/cart/', 4, create_cart_products
+        )
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from http import HTTPStatus
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+# Число строк в базе, при котором проверяется бюджет запросов.
+ROW_COUNTS = (1, 10, 100)
+
+
+class QueryBudgetMixin:
+    """
+    Проверка верхней границы числа SQL-запросов эндпоинта при разном
+    числе строк в базе. Бюджет не зависит от числа строк, поэтому
+    запросы в цикле по строкам (N+1) превышают его уже на 10 строках.
+    """
+    row_counts = ROW_COUNTS
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            self.fail(
+                f'Выполнено запросов: {len(context)}, бюджет: {budget}\n'
+                + '\n'.join(
+                    f'{number}. {query["sql"]}' for number, query
+                    in enumerate(context.captured_queries, start=1)
+                )
+            )
+
+    def assertQueryBudget(self, client, url, budget, create_rows,
+                          status_code=HTTPStatus.OK):
+        """
+        Запрос GET url клиентом client при каждом числе строк
+        из row_counts. create_rows(start, stop) добавляет строки
+        с номерами от start до stop, строки создаются один раз
+        и дополняются до следующего числа.
+        """
+        created = 0
+        for rows in self.row_counts:
+            create_rows(created, rows)
+            created = rows
+            with self.subTest(url=url, rows=rows):
+                with self.assertMaxQueries(budget):
+                    response = client.get(url)
+                self.assertEqual(response.status_code, status_code)
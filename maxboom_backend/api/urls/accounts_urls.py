@@ -1,7 +1,12 @@
 from django.urls import path, include
+from rest_framework.routers import DefaultRouter
 
 
-from api.views.accounts_views import ActivateUser, UserProfileUpdateView
+from api.views.accounts_views import (ActivateUser, UserProfileUpdateView,
+                                      UserViewSet)
+
+router = DefaultRouter()
+router.register('users', UserViewSet)
 
 urlpatterns = [
     path(
@@ -14,6 +19,6 @@ urlpatterns = [
         UserProfileUpdateView.as_view(),
         name='update-profile'
     ),
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
     path('', include('djoser.urls.authtoken')),
 ]
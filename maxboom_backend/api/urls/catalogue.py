@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views.catalogue import (BrandViewSet, CategoryViewSet, ProductViewSet,
-                                 search, update)
+                                 search, update, update_runs,
+                                 update_status)
 
 app_name = 'catalogue'
 
@@ -17,5 +18,9 @@ urlpatterns = [
     path('search/', search,
          name='search'),
     path('update/', update,
-         name='update')
+         name='update'),
+    path('update/status/', update_status,
+         name='update-status'),
+    path('update/runs/', update_runs,
+         name='update-runs')
 ]
@@ -8,6 +8,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
+from djoser.views import UserViewSet as DjoserUserViewSet
 from drf_spectacular.utils import extend_schema
 
 from accounts.models import User
@@ -69,3 +70,10 @@ class UserProfileUpdateView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UserViewSet(DjoserUserViewSet):
+    """Пользователи djoser, профили загружаются вместе с пользователями."""
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('userprofile')
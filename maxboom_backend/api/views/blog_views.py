@@ -1,5 +1,6 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 
@@ -65,7 +66,9 @@ class PostViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        return Post.objects.all().order_by('-pub_date')
+        return Post.objects.select_related('category').prefetch_related(
+            'tags'
+        ).order_by('-pub_date')
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -129,7 +132,17 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         return CategoryListSerializer
 
     def get_queryset(self):
-        return Category.objects.all().order_by('title')
+        queryset = Category.objects.all().order_by('title')
+        if 'slug' in self.kwargs:
+            queryset = queryset.prefetch_related(Prefetch(
+                'posts',
+                queryset=Post.objects.prefetch_related('tags').annotate(
+                    published_comments_count=Count(
+                        'comments', filter=Q(comments__is_published=True)
+                    )
+                )
+            ))
+        return queryset
 
 
 @extend_schema(
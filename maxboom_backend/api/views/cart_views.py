@@ -7,11 +7,11 @@ from drf_spectacular.utils import (
 
 from cart.models import Cart
 from cart.utils import (
-    get_cart, change_product_cart_amount,
-    list_cart_product, process_cart_product
+    get_cart, delete_cart, change_product_cart_amount,
+    list_cart_product, process_cart_batch, process_cart_product
 )
 from api.serializers.cart_serializers import (
-    CartSerializer, ProductCartCreateSerializer,
+    CartSerializer, ProductCartBatchSerializer, ProductCartCreateSerializer,
     ProductCartListSerializer, ProductCartChangeSerializer
 )
 
@@ -83,8 +83,7 @@ class CartViewSet(mixins.ListModelMixin,
         )
 
     def destroy(self, request, *args, **kwargs):
-        cart = get_cart(request)
-        cart.delete()
+        delete_cart(request)
         return Response(
             status=status.HTTP_204_NO_CONTENT
         )
@@ -129,3 +128,18 @@ class CartViewSet(mixins.ListModelMixin,
         product = change_product_cart_amount(request)
         context = self.get_serializer_context()
         return list_cart_product(product, context)
+
+    @extend_schema(
+        summary="Пакетное изменение товаров корзины",
+        description="""Изменение нескольких товаров корзины в одной
+        транзакции. POST прибавляет amount к количеству товаров
+        (отрицательное значение уменьшает его), PUT устанавливает
+        количество. Товары с количеством не больше нуля удаляются.
+        """,
+        request=ProductCartBatchSerializer,
+        responses={status.HTTP_206_PARTIAL_CONTENT: CartSerializer},
+    )
+    @action(methods=['post', 'put'], url_path='batch', detail=False)
+    def batch_product_cart(self, request):
+        """Отдельный эндпоинт для изменения нескольких товаров корзины."""
+        return process_cart_batch(request, self.get_serializer_context())
@@ -1,20 +1,29 @@
-import os
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import OpenApiParameter  # OpenApiExample
 from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
 
+from api.caches.catalogue_caches import CatalogueCacheMixin
 from api.filters.catalogue import CustomProductSearchFilter, ProductFilterSet
-from api.paginations.catalogue_paginations import CustomLimitOffsetPagination
-from api.serializers.catalogue import (BrandSerializer, CategorySerializer,
+from api.paginations.catalogue_paginations import KeysetLimitOffsetPagination
+from api.serializers.catalogue import (BrandSerializer,
+                                       CatalogueUpdateJobSerializer,
+                                       CategorySerializer,
                                        CategoryTreeSerializer,
+                                       ProductListSerializer,
                                        ProductSerializer)
-from catalogue.models import Brand, Category, Product
-from maxboom.settings import MEDIA_ROOT
+from api.services.search import SearchService
+from catalogue.models import Brand, CatalogueUpdateJob, Category, Product
+from catalogue.pricing import annotate_prices, get_user_tier
+
+# Количество задач в истории обновлений каталога
+UPDATE_RUNS_LIMIT = 20
+UPDATE_RUNS_MAX_LIMIT = 100
 
 
 @extend_schema(
@@ -89,7 +98,7 @@ from maxboom.settings import MEDIA_ROOT
         ]
     )
 )
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     lookup_field = 'slug'
     queryset = Category.objects.all().prefetch_related(
         'root', 'root__root', 'root__root__root',
@@ -159,7 +168,7 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         ]
     )
 )
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     lookup_field = 'slug'
     queryset = Brand.objects.all().filter(
         is_prohibited=False)
@@ -280,12 +289,13 @@ class BrandViewSet(viewsets.ReadOnlyModelViewSet):
 )
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_field = 'slug'
-    queryset = Product.objects.all().prefetch_related(
-        'category', 'category__branches',
-        'category__branches__branches', 'images',
-    ).filter(is_deleted=False, category__is_prohibited=False)
+    queryset = Product.objects.select_related(
+        'category', 'brand'
+    ).prefetch_related('images').filter(
+        is_deleted=False, category__is_prohibited=False
+    ).defer('search_vector', 'description_vector')
     serializer_class = ProductSerializer
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = KeysetLimitOffsetPagination
     filter_backends = (
         filters.OrderingFilter,
         DjangoFilterBackend,
@@ -294,6 +304,24 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = ProductFilterSet
     ordering_fields = ('name', 'code', 'price')
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Описание в списке не выводится, поиск по описанию
+            # выполняется в базе данных без загрузки поля.
+            queryset = queryset.defer('description')
+        return annotate_prices(queryset)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductListSerializer
+        return ProductSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['price_tier'] = get_user_tier(self.request.user)
+        return context
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -310,12 +338,26 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
                 required=False,
                 type=bool
             ),
+            OpenApiParameter(
+                name='cursor',
+                location=OpenApiParameter.QUERY,
+                description=('постраничный вывод по курсору, '
+                             'пустое значение для первой страницы'),
+                required=False,
+                type=str
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
 
+SEARCH_SECTIONS = {
+    'category': CategoryViewSet,
+    'product': ProductViewSet,
+}
+
+
 @extend_schema(
     tags=["Каталог"],
     summary='Поиск в категориях и товарах',
@@ -393,26 +435,13 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
 )
 @api_view(('GET',))
 def search(request, *args, **kwargs):
-    resp_category = CategoryViewSet.as_view(
-        actions={'get': 'list'},
-    )(request=request._request, *args, **kwargs)
-    resp_product = ProductViewSet.as_view(
-        actions={'get': 'list'},
-    )(request=request._request, *args, **kwargs)
-    data = {}
-    if (
-        resp_category.status_code == status.HTTP_400_BAD_REQUEST
-        and resp_product.status_code == status.HTTP_400_BAD_REQUEST
-    ):
+    data = SearchService(request, SEARCH_SECTIONS).search()
+    if all(result is None for result in data.values()):
         return Response(
             'Поиск не возможен', status=status.HTTP_400_BAD_REQUEST)
-    if (resp_category.status_code == status.HTTP_200_OK):
-        data['category'] = resp_category.render().data
-    else:
+    if data['category'] is None:
         data['category'] = []
-    if (resp_product.status_code == status.HTTP_200_OK):
-        data['product'] = resp_product.render().data
-    else:
+    if data['product'] is None:
         data['product'] = {
             'count': 0,
             'next': None,
@@ -425,28 +454,94 @@ def search(request, *args, **kwargs):
 @extend_schema(
     tags=["Каталог"],
     summary='Обновление каталога с WB',
+    description="""Постановка задачи обновления каталога в очередь,
+    задачу выполняет обработчик run_catalogue_worker.
+    Параметр full=true запускает полную загрузку каталога.
+    Запрос GET устарел и оставлен для совместимости,
+    используйте POST.""",
+    parameters=[
+        OpenApiParameter(
+            name='full',
+            location=OpenApiParameter.QUERY,
+            description='полная загрузка каталога',
+            required=False,
+            type=bool
+        ),
+    ]
 )
-@api_view(('GET',))
+@extend_schema(methods=('GET',), deprecated=True)
+@api_view(('GET', 'POST'))
 @permission_classes((IsAdminUser,))
 def update(request, *args, **kwargs):
-    check_possibility_start_update()
+    full = request.query_params.get('full', '').lower() in ('true', '1')
+    job = CatalogueUpdateJob.objects.enqueue(user=request.user, full=full)
+    if job is None:
+        raise ValidationError(
+            'Обновление запущено, дождитесь окончания запущенного процесса.')
     return Response(
-        data={'обновление': 'будет запущено в ближайшее время'},
+        data={
+            'обновление': 'будет запущено в ближайшее время',
+            'job': CatalogueUpdateJobSerializer(job).data
+        },
         status=status.HTTP_200_OK,
     )
 
 
-def check_possibility_start_update():
-    if not os.path.exists(os.path.join(MEDIA_ROOT)):
-        os.mkdir(os.path.join(MEDIA_ROOT))
-    if not os.path.exists(os.path.join(MEDIA_ROOT, 'update')):
-        os.mkdir(os.path.join(MEDIA_ROOT, 'update'))
-    if (
-        os.path.exists(os.path.join(MEDIA_ROOT, 'update', 'realization'))
-        or os.path.exists(os.path.join(MEDIA_ROOT, 'update', 'start'))
-    ):
-        raise ValidationError(
-            'Обновление запущено, дождитесь окончания запущенного процесса.')
-    file = os.path.join(MEDIA_ROOT, 'update', 'start')
-    with open(file=file, mode='w'):
-        pass
+@extend_schema(
+    tags=["Каталог"],
+    summary='Состояние обновления каталога с WB',
+    description="""Состояние задачи обновления каталога: статус,
+    этап и число обработанных карточек. Без параметра id
+    возвращается последняя задача.""",
+    parameters=[
+        OpenApiParameter(
+            name='id',
+            location=OpenApiParameter.QUERY,
+            description='id задачи',
+            required=False,
+            type=int
+        ),
+    ],
+    responses=CatalogueUpdateJobSerializer
+)
+@api_view(('GET',))
+@permission_classes((IsAdminUser,))
+def update_status(request, *args, **kwargs):
+    jobs = CatalogueUpdateJob.objects.prefetch_related('phases')
+    job_id = request.query_params.get('id')
+    if job_id is not None:
+        if not job_id.isdigit():
+            raise ValidationError('Неверный id задачи')
+        jobs = jobs.filter(pk=job_id)
+    job = jobs.first()
+    if job is None:
+        raise NotFound('Задача обновления не найдена')
+    return Response(CatalogueUpdateJobSerializer(job).data)
+
+
+@extend_schema(
+    tags=["Каталог"],
+    summary='История обновлений каталога с WB',
+    description="""Последние задачи обновления каталога с временем
+    этапов загрузки, для сравнения скорости загрузки между запусками.""",
+    parameters=[
+        OpenApiParameter(
+            name='limit',
+            location=OpenApiParameter.QUERY,
+            description='количество задач, по умолчанию 20',
+            required=False,
+            type=int
+        ),
+    ],
+    responses=CatalogueUpdateJobSerializer(many=True)
+)
+@api_view(('GET',))
+@permission_classes((IsAdminUser,))
+def update_runs(request, *args, **kwargs):
+    limit = request.query_params.get('limit', str(UPDATE_RUNS_LIMIT))
+    if not limit.isdigit():
+        raise ValidationError('Неверное количество задач')
+    jobs = CatalogueUpdateJob.objects.prefetch_related('phases')[
+        :min(int(limit), UPDATE_RUNS_MAX_LIMIT)
+    ]
+    return Response(CatalogueUpdateJobSerializer(jobs, many=True).data)
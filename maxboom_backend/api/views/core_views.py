@@ -87,7 +87,9 @@ class ContactsViewSet(BaseInfoViewSet):
     Страница "Контакты".
     """
 
-    queryset = Contacts.objects.all()
+    queryset = Contacts.objects.prefetch_related(
+        'main_shop', 'requisites', 'mail_form', 'our_shops'
+    )
     serializer_class = ContactsSerializer
 
     # Отдельный эндпоинт позволяет по get-запросу получить
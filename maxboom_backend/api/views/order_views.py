@@ -1,5 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import (OpenApiParameter, extend_schema,
                                    extend_schema_view)
@@ -11,8 +12,9 @@ from api.permissions.order_permissions import (IsOwnerOrAdmin,
 from api.serializers.order_serializers import (CommodityRefundSerializer,
                                                OrderRefundSerializer,
                                                OrderSerializer,
-                                               ReturnSerializer)
-from cart.utils import get_cart
+                                               ReturnSerializer,
+                                               get_order_prefetches)
+from cart.utils import delete_cart, get_cart
 from order.models import CommodityRefund, Order, OrderRefund
 
 
@@ -225,7 +227,12 @@ class OrderRefundViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         order = get_object_or_404(Order, pk=self.kwargs.get('order'))
         self.check_object_permissions_custom(self.request, obj=order)
-        return order.refunds.all()
+        return order.refunds.prefetch_related(Prefetch(
+            'commodities',
+            queryset=CommodityRefund.objects.select_related(
+                'commodity__product'
+            ).prefetch_related('commodity__product__images')
+        ))
 
     def check_object_permissions_custom(self, request, obj):
         """
@@ -277,6 +284,9 @@ class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = (IsOwnerOrAdmin,)
 
     def get_queryset(self):
+        return self.get_orders().prefetch_related(*get_order_prefetches())
+
+    def get_orders(self):
         user = self.request.user
         if user.is_authenticated:
             if user.is_staff:
@@ -285,6 +295,9 @@ class OrderViewSet(viewsets.ModelViewSet):
             if order.exists():
                 return order
         session_id = self.request.session.get('anonymous_id')
+        if session_id is None:
+            # Сессия без корзины не оформляла заказов.
+            return Order.objects.none()
         return Order.objects.filter(session_id=session_id)
 
     def create(self, request, *args, **kwargs):
@@ -299,7 +312,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         user = self.request.user
         cart = get_cart(self.request)
-        if not cart.products.all():
+        if cart.pk is None or not cart.products.exists():
             raise serializers.ValidationError('Добавьте товары в корзину')
         if user.is_authenticated:
             serializer.save(
@@ -311,4 +324,4 @@ class OrderViewSet(viewsets.ModelViewSet):
                 session_id=str(cart.session_id),
                 is_active=False,
             )
-        cart.delete()
+        delete_cart(self.request)
@@ -4,5 +4,5 @@ from api.serializers.stories_serializers import StorySerializer
 
 
 class StoryViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
-    queryset = Story.objects.all().filter(show=True)
+    queryset = Story.objects.filter(show=True).prefetch_related('pictures')
     serializer_class = StorySerializer
@@ -11,6 +11,7 @@ class ProductCartInline(admin.StackedInline):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     inlines = [ProductCartInline, ]
+    list_display = ('id', 'user', 'is_active', 'created', 'updated')
 
 
 @admin.register(ProductCart)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from cart.models import Cart
+from maxboom.settings import CART_ANONYMOUS_TTL_DAYS, CART_CLEANUP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Удаление неавторизованных корзин, которые не изменялись '
+            'дольше заданного числа дней')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=CART_ANONYMOUS_TTL_DAYS,
+            help='срок хранения неизменяемой корзины, дней'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=CART_CLEANUP_BATCH_SIZE,
+            help='число корзин, удаляемых в одной транзакции'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только подсчитать корзины, которые будут удалены'
+        )
+
+    def handle(self, *args, **options):
+        report = Cart.objects.delete_expired(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        prefix = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{prefix} корзин: {report["carts"]}, '
+            f'товаров в них: {report["products"]}'
+        )
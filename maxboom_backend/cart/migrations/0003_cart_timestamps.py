@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_auto_20231029_1731'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Создана'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменена'),
+        ),
+    ]
@@ -1,12 +1,61 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from catalogue.models import Product
-from maxboom.settings import DISCOUNT_ANONYM, DISCOUNT_USER
+from catalogue.pricing import (get_owner_tier, get_tier_price,
+                               tier_price_expression)
+from maxboom.settings import CART_ANONYMOUS_TTL_DAYS, CART_CLEANUP_BATCH_SIZE
 
 User = get_user_model()
 
 
+class CartManager(models.Manager):
+    """Удаление устаревших неавторизованных корзин."""
+
+    def expired(self, days=CART_ANONYMOUS_TTL_DAYS):
+        """Неавторизованные корзины без изменений дольше days дней."""
+        cutoff = timezone.now() - timedelta(days=days)
+        return self.filter(user__isnull=True, updated__lt=cutoff)
+
+    def delete_expired(self, days=CART_ANONYMOUS_TTL_DAYS,
+                       batch_size=CART_CLEANUP_BATCH_SIZE, dry_run=False):
+        """
+        Удаляет устаревшие корзины с товарами пакетами по batch_size
+        корзин, каждый пакет в отдельной транзакции, чтобы не держать
+        долгих блокировок. Возвращает число удалённых корзин и товаров
+        в них, при dry_run только подсчитывает их.
+        """
+        queryset = self.expired(days)
+        if dry_run:
+            return {
+                'carts': queryset.count(),
+                'products': ProductCart.objects.filter(
+                    cart__in=queryset
+                ).count(),
+            }
+        report = {'carts': 0, 'products': 0}
+        last_pk = 0
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            with transaction.atomic():
+                # Условие устаревания проверяется повторно: корзину
+                # могли изменить после выборки пакета.
+                _, deleted = queryset.filter(pk__in=pks).delete()
+            report['carts'] += deleted.get(self.model._meta.label, 0)
+            report['products'] += deleted.get(ProductCart._meta.label, 0)
+        return report
+
+
 class Cart(models.Model):
     user = models.OneToOneField(
         User,
@@ -25,29 +74,59 @@ class Cart(models.Model):
         blank=True,
     )
     is_active = models.BooleanField(default=False)
+    created = models.DateTimeField(
+        verbose_name='Создана',
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Изменена',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = CartManager()
 
     class Meta:
         ordering = ['id']
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
 
+    def touch(self):
+        """Отмечает изменение товаров корзины."""
+        self.updated = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(updated=self.updated)
+
+    @cached_property
+    def totals(self):
+        """
+        Стоимость и вес корзины одним агрегирующим запросом. Цена
+        товара вычисляется в базе для уровня покупателя корзины
+        с тем же округлением, что и у ProductCart.price_with_discount.
+        """
+        if self.pk is None:
+            return {'full_price': 0, 'full_weight': 0}
+        price = tier_price_expression(get_owner_tier(self), 'product__price')
+        totals = self.productcart_set.aggregate(
+            full_price=Sum(ExpressionWrapper(
+                F('amount') * price,
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )),
+            full_weight=Sum(ExpressionWrapper(
+                F('amount') * F('product__weight'),
+                output_field=DecimalField(max_digits=14, decimal_places=3)
+            )),
+        )
+        return {key: value or 0 for key, value in totals.items()}
+
     @property
     def cart_full_price(self):
         """Высчитывает полную стоимость корзины."""
-        products = self.products.through.objects.filter(cart=self)
-        prices = [
-            round(product.full_price, 2) for product in products
-        ]
-        return round(sum(prices), 2)
+        return self.totals['full_price']
 
     @property
     def cart_full_weight(self):
         """Высчитывает полный вес корзины."""
-        products = self.products.through.objects.filter(cart=self)
-        weights = [
-            round(product.full_weight, 2) for product in products
-        ]
-        return sum(weights)
+        return self.totals['full_weight']
 
     def __str__(self):
         return f"Корзина пользователя: {self.user}"
@@ -77,11 +156,7 @@ class ProductCart(models.Model):
 
     @property
     def price_with_discount(self):
-        if self.cart.is_active and self.cart.user.userprofile.is_vendor:
-            discount = DISCOUNT_USER
-        else:
-            discount = DISCOUNT_ANONYM
-        return round(self.product.price * discount, 2)
+        return get_tier_price(self.product.price, get_owner_tier(self.cart))
 
     @property
     def full_price(self):
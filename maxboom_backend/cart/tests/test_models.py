@@ -3,16 +3,22 @@ import tempfile
 import shutil
 import uuid
 
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction, IntegrityError
 from django.test import TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
 
+from accounts.models import UserProfile
 from catalogue.models import Product, ProductImage, Brand, Category
 from cart.models import Cart, ProductCart
-from maxboom.settings import DISCOUNT_ANONYM, DISCOUNT_USER
+from maxboom.settings import (CART_ANONYMOUS_TTL_DAYS, DISCOUNT_ANONYM,
+                              DISCOUNT_USER)
 
 
 User = get_user_model()
@@ -129,6 +135,29 @@ class CartTestCase(TestCase):
         expected_full_weight = product_weight * product_amount
         self.assertEqual(cart.cart_full_weight, expected_full_weight)
 
+    def test_cart_totals_single_query(self):
+        cart = Cart.objects.select_related('user__userprofile').get(
+            pk=CartTestCase.cart.pk
+        )
+        with self.assertNumQueries(1):
+            cart.cart_full_price
+            cart.cart_full_weight
+
+    def test_cart_totals_wholesale(self):
+        UserProfile.objects.filter(user=CartTestCase.user).update(
+            is_vendor=True
+        )
+        cart = Cart.objects.get(pk=CartTestCase.cart.pk)
+        expected_full_price = round(100 * DISCOUNT_USER * 10, 2)
+        self.assertEqual(cart.cart_full_price, expected_full_price)
+        line = cart.productcart_set.get()
+        self.assertEqual(cart.cart_full_price, line.full_price)
+
+    def test_empty_cart_totals(self):
+        cart = Cart.objects.create(session_id=str(uuid.uuid4()))
+        self.assertEqual(cart.cart_full_price, 0)
+        self.assertEqual(cart.cart_full_weight, 0)
+
     @classmethod
     def tearDownClass(cls):
         super().tearDownClass()
@@ -275,3 +304,65 @@ class ProductCartTestCase(TestCase):
     def tearDownClass(cls):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+class ExpiredCartsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            email='test_example@test', password='testpassword1'
+        )
+        cls.product = Product.objects.create(
+            name='test_product_1',
+            price=100,
+            code=123456789,
+            vendor_code='article_1',
+            wb_urls='https://www.test_url.test',
+        )
+        cls.user_cart = Cart.objects.create(user=cls.user, is_active=True)
+        cls.fresh_cart = Cart.objects.create(session_id=str(uuid.uuid4()))
+        cls.expired_carts = [
+            Cart.objects.create(session_id=str(uuid.uuid4()))
+            for _ in range(3)
+        ]
+        for cart in (cls.user_cart, cls.fresh_cart, *cls.expired_carts):
+            ProductCart.objects.create(
+                cart=cart, product=cls.product, amount=1
+            )
+        old = timezone.now() - timedelta(days=CART_ANONYMOUS_TTL_DAYS + 1)
+        Cart.objects.exclude(pk=cls.fresh_cart.pk).update(updated=old)
+
+    def test_expired(self):
+        self.assertQuerysetEqual(
+            Cart.objects.expired(), ExpiredCartsTestCase.expired_carts,
+            transform=lambda cart: cart, ordered=False
+        )
+        self.assertFalse(
+            Cart.objects.expired(days=CART_ANONYMOUS_TTL_DAYS + 2).exists()
+        )
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('delete_expired_carts', '--dry-run', stdout=out)
+        self.assertIn('Будет удалено корзин: 3, товаров в них: 3',
+                      out.getvalue())
+        self.assertEqual(Cart.objects.count(), 5)
+
+    def test_delete_expired_in_batches(self):
+        out = StringIO()
+        call_command('delete_expired_carts', '--batch-size', '2', stdout=out)
+        self.assertIn('Удалено корзин: 3, товаров в них: 3', out.getvalue())
+        self.assertQuerysetEqual(
+            Cart.objects.all(),
+            [ExpiredCartsTestCase.user_cart, ExpiredCartsTestCase.fresh_cart],
+            transform=lambda cart: cart
+        )
+        self.assertEqual(ProductCart.objects.count(), 2)
+
+    def test_touch(self):
+        cart = ExpiredCartsTestCase.expired_carts[0]
+        cart.touch()
+        self.assertNotIn(cart, Cart.objects.expired())
+
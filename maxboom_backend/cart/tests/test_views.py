@@ -1,16 +1,24 @@
 # flake8: noqa
 import tempfile
 import shutil
+from datetime import timedelta
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
 
 from catalogue.models import Product, ProductImage, Brand, Category
 from cart.models import Cart, ProductCart
+from cart.utils import CART_SESSION_KEY, get_cart, lock_cart_lines
 
 
 User = get_user_model()
@@ -106,9 +114,10 @@ class CartViewsTestCase(TestCase):
 
     def test_get_cart_anonymous_viewset(self):
         url = '/api/cart/'
-        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
         expected_data = {
-            'id': 3,
+            'id': None,
             'products': [],
             'user': None,
             'cart_full_price': 0,
@@ -116,6 +125,52 @@ class CartViewsTestCase(TestCase):
         }
         response_data = response.data
         self.assertEqual(response_data, expected_data)
+        carts_count = Cart.objects.count()
+        expected_count = 2
+        self.assertEqual(carts_count, expected_count)
+
+    def test_anonymous_cart_id_in_session(self):
+        url = '/api/cart/'
+        data = {
+            'product': 1,
+            'amount': 10,
+        }
+        self.client.post(url, data)
+        cart = Cart.objects.get(user=None)
+        self.assertEqual(self.client.session[CART_SESSION_KEY], cart.id)
+        Cart.objects.filter(pk=cart.pk).update(session_id=None)
+        response = self.client.get(url)
+        self.assertEqual(response.data['id'], cart.id)
+        self.client.delete(f'{url}{cart.id}/')
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+        self.assertFalse(Cart.objects.filter(pk=cart.pk).exists())
+
+    def test_anonymous_cart_moves_to_user(self):
+        url = '/api/cart/'
+        data = {
+            'product': 1,
+            'amount': 10,
+        }
+        self.client.post(url, data)
+        cart = Cart.objects.get(user=None)
+        user = User.objects.create_user(email='new@test', password='pass')
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.data['id'], cart.id)
+        self.assertEqual(response.data['user'], user.id)
+        request = RequestFactory().get(url)
+        request.session = self.client.session
+        request.user = AnonymousUser()
+        self.assertIsNone(get_cart(request).pk)
+
+    def test_get_cart_once_per_request(self):
+        request = RequestFactory().get('/api/cart/')
+        request.session = SessionStore()
+        request.user = CartViewsTestCase.user
+        with self.assertNumQueries(1):
+            cart = get_cart(request)
+            self.assertIs(get_cart(request), cart)
+        self.assertEqual(cart, CartViewsTestCase.cart)
 
     def test_get_cart_authorized_viewset(self):
         url = '/api/cart/'
@@ -132,7 +187,9 @@ class CartViewsTestCase(TestCase):
                         'brand': 'test_brand_1',
                         'images': [
                             {
-                                'image': image_url + image
+                                'image': image_url + image,
+                                'renditions': {},
+                                'srcset': {}
                             }
                         ],
                         'price': 80.0,
@@ -247,7 +304,9 @@ class CartViewsTestCase(TestCase):
                         'brand': 'test_brand_1',
                         'images': [
                             {
-                                'image':  image_url + image
+                                'image': image_url + image,
+                                'renditions': {},
+                                'srcset': {}
                             }
                         ],
                         'price': 80.0,
@@ -294,7 +353,9 @@ class CartViewsTestCase(TestCase):
                         'brand': 'test_brand_1',
                         'images': [
                             {
-                                'image':  image_url + image
+                                'image': image_url + image,
+                                'renditions': {},
+                                'srcset': {}
                             }
                         ],
                         'price': 80.0,
@@ -321,6 +382,170 @@ class CartViewsTestCase(TestCase):
         }
         self.assertEqual(response.data, expected_data)
 
+    def test_increase_product_single_update(self):
+        data = {
+            'product': 1,
+        }
+        with CaptureQueriesContext(connection) as context:
+            self.admin_client.put('/api/cart/add/', data)
+        updates = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "cart_productcart"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"amount" + 1', updates[0])
+        self.product_2_cart.refresh_from_db()
+        self.assertEqual(self.product_2_cart.amount, 11)
+
+    def test_cart_write_updates_timestamp(self):
+        old = timezone.now() - timedelta(days=1)
+        Cart.objects.filter(pk=self.cart_2.pk).update(updated=old)
+        self.admin_client.get('/api/cart/')
+        self.cart_2.refresh_from_db()
+        self.assertEqual(self.cart_2.updated, old)
+        self.admin_client.put('/api/cart/add/', {'product': 1})
+        self.cart_2.refresh_from_db()
+        self.assertGreater(self.cart_2.updated, old)
+
+    def test_decrease_product_to_zero(self):
+        ProductCart.objects.filter(pk=self.product_2_cart.pk).update(amount=1)
+        response = self.admin_client.put('/api/cart/subtract/', {'product': 1})
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertFalse(
+            ProductCart.objects.filter(pk=self.product_2_cart.pk).exists()
+        )
+        response = self.admin_client.put('/api/cart/subtract/', {'product': 1})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def create_product_2(self):
+        return Product.objects.create(
+            name='test_product_2',
+            price=200,
+            category=self.cat_1,
+            code=987654321,
+            vendor_code='article_2',
+            wb_urls='https://www.test_url.test',
+            weight=2
+        )
+
+    def test_batch_post(self):
+        product_2 = self.create_product_2()
+        data = {
+            'products': [
+                {'product': 1, 'amount': -4},
+                {'product': product_2.id, 'amount': 3},
+            ]
+        }
+        response = self.admin_client.post(
+            '/api/cart/batch/', data, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        amounts = dict(
+            self.cart_2.productcart_set.values_list('product', 'amount')
+        )
+        self.assertEqual(amounts, {1: 6, product_2.id: 3})
+        self.assertEqual(response.data['cart_full_price'], 6 * 80 + 3 * 160)
+        self.assertEqual(len(response.data['products']), 2)
+        data = {
+            'products': [
+                {'product': 1, 'amount': -6},
+            ]
+        }
+        self.admin_client.post('/api/cart/batch/', data, format='json')
+        amounts = dict(
+            self.cart_2.productcart_set.values_list('product', 'amount')
+        )
+        self.assertEqual(amounts, {product_2.id: 3})
+
+    def test_batch_put(self):
+        product_2 = self.create_product_2()
+        data = {
+            'products': [
+                {'product': 1, 'amount': 2},
+                {'product': product_2.id, 'amount': 0},
+            ]
+        }
+        response = self.admin_client.put(
+            '/api/cart/batch/', data, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        amounts = dict(
+            self.cart_2.productcart_set.values_list('product', 'amount')
+        )
+        self.assertEqual(amounts, {1: 2})
+        data['products'][0]['amount'] = 0
+        self.admin_client.put('/api/cart/batch/', data, format='json')
+        self.assertFalse(self.cart_2.productcart_set.exists())
+
+    def test_batch_concurrent_insert(self):
+        """товар, добавленный параллельным запросом, обновляется"""
+        product_2 = self.create_product_2()
+        data = {'products': [{'product': product_2.id, 'amount': 3}]}
+        for method, expected in (('post', 5), ('put', 3)):
+            with self.subTest(method=method):
+                ProductCart.objects.filter(product=product_2).delete()
+                calls = []
+
+                def lock_after_insert(cart, product_ids):
+                    # Первое чтение не видит строку, добавленную
+                    # параллельным запросом.
+                    calls.append(product_ids)
+                    if len(calls) == 1:
+                        ProductCart.objects.create(
+                            cart=cart, product=product_2, amount=2
+                        )
+                        return {}
+                    return lock_cart_lines(cart, product_ids)
+
+                with mock.patch(
+                    'cart.utils.lock_cart_lines', lock_after_insert
+                ):
+                    response = getattr(self.admin_client, method)(
+                        '/api/cart/batch/', data, format='json'
+                    )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT
+                )
+                self.assertEqual(len(calls), 2)
+                self.assertEqual(
+                    self.cart_2.productcart_set.get(
+                        product=product_2
+                    ).amount,
+                    expected
+                )
+
+    def test_batch_anonymous_creates_cart(self):
+        data = {
+            'products': [
+                {'product': 1, 'amount': 5},
+            ]
+        }
+        response = self.client.post('/api/cart/batch/', data, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        cart = Cart.objects.get(user=None)
+        self.assertEqual(response.data['id'], cart.id)
+        self.assertEqual(cart.productcart_set.get().amount, 5)
+
+    def test_batch_invalid(self):
+        invalid_products = (
+            [],
+            [{'product': 1, 'amount': 1}, {'product': 1, 'amount': 2}],
+            [{'product': 1, 'amount': 1}, {'product': 999, 'amount': 1}],
+        )
+        for products in invalid_products:
+            with self.subTest(products=products):
+                response = self.admin_client.post(
+                    '/api/cart/batch/', {'products': products}, format='json'
+                )
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.admin_client.put(
+            '/api/cart/batch/',
+            {'products': [{'product': 1, 'amount': -1}]}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.product_2_cart.refresh_from_db()
+        self.assertEqual(self.product_2_cart.amount, 10)
+
     def tearDown(self):
         super().tearDown()
 
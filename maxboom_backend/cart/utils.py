@@ -2,12 +2,15 @@ import uuid
 from typing import Optional
 
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, QuerySet
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.request import Request
 from rest_framework.response import Response
 
 from api.serializers.cart_serializers import (
+    CartSerializer, ProductCartBatchSerializer,
     ProductCartListSerializer, ProductCartCreateSerializer
 )
 from cart.models import Cart, ProductCart
@@ -15,6 +18,9 @@ from cart.models import Cart, ProductCart
 
 User = get_user_model()
 
+# Ключ сессии с id корзины
+CART_SESSION_KEY = 'cart_id'
+
 
 def get_session(request: Request) -> str:
     """Получить или присвоить сессии UUID."""
@@ -50,37 +56,74 @@ def update_user_cart(cart: Cart, request: Request) -> Cart:
     return cart
 
 
-def get_cart(request: Request) -> Cart:
+def find_session_cart(request: Request, carts: QuerySet) -> Optional[Cart]:
     """
-    Получает нужную корзину, создает новую или
-    переносит из неавторизованной сессии в авторизованную.
+    Неавторизованная корзина сессии: по id из сессии, затем по UUID
+    сессии. Корзина, перенесённая в аккаунт, по id не находится.
+    """
+    if cart_id := request.session.get(CART_SESSION_KEY):
+        if cart := carts.filter(pk=cart_id, user=None).first():
+            return cart
+        del request.session[CART_SESSION_KEY]
+    if session := request.session.get('anonymous_id'):
+        return carts.filter(session_id=session).first()
+    return None
+
+
+def find_cart(request: Request, create: bool) -> Cart:
     """
-    if isinstance(request.user, User):
+    Находит корзину пользователя или сессии. Новая корзина создаётся
+    только при create, иначе возвращается несохранённая пустая корзина.
+    """
+    is_user = isinstance(request.user, User)
+    # Профиль нужен для уровня цен и загружается вместе с корзиной.
+    carts = Cart.objects.select_related('user__userprofile')
+    if is_user:
         # Механизм либо сразу находит корзину пользователя, либо ищет по
         # сессии, либо создаёт новую. Во всех случаях корзины становятся
         # активными и session_id у них становится None, чтобы к ним
         # не было доступа по сессии у неавторизованных пользователей.
-        if carts := Cart.objects.filter(
-                user=request.user
-        ):
-            cart = carts[0]
+        if cart := carts.filter(user=request.user).first():
             return cart
-        elif carts := Cart.objects.filter(
-                session_id=get_session(request)
-        ):
-            cart = carts[0]
+        if cart := find_session_cart(request, carts):
             return update_user_cart(cart, request)
-        else:
-            return create_cart(request, active=True)
     # Неавторизованная корзина ищется по сессии, так как подразумевается,
     # что любая авторизованная корзина сессии не имеет.
-    if carts := Cart.objects.filter(
-            session_id=get_session(request)
-    ):
-        cart = carts[0]
+    elif cart := find_session_cart(request, carts):
         return cart
-    else:
-        return create_cart(request)
+    if create:
+        return create_cart(request, active=is_user)
+    return Cart(user=request.user if is_user else None, is_active=is_user)
+
+
+def get_cart(request: Request, create: bool = False) -> Cart:
+    """
+    Получает нужную корзину, создает новую или
+    переносит из неавторизованной сессии в авторизованную.
+    Корзина ищется один раз за запрос. Без create корзина
+    не создаётся, чтобы просмотр сайта не добавлял в базу
+    пустые корзины.
+    """
+    cart = getattr(request, '_cart', None)
+    if cart is None or (create and cart.pk is None):
+        cart = find_cart(request, create)
+        request._cart = cart
+        # id неавторизованной корзины запоминается в сессии: поиск
+        # по первичному ключу вместо UUID сессии. Корзина пользователя
+        # находится по уникальному user_id и в сессию не пишется.
+        if cart.pk and cart.user_id is None:
+            if request.session.get(CART_SESSION_KEY) != cart.pk:
+                request.session[CART_SESSION_KEY] = cart.pk
+    return cart
+
+
+def delete_cart(request: Request) -> None:
+    """Удаляет корзину запроса и забывает её id в сессии."""
+    cart = get_cart(request)
+    if cart.pk:
+        cart.delete()
+    request.session.pop(CART_SESSION_KEY, None)
+    request._cart = None
 
 
 def process_cart_product(
@@ -93,7 +136,7 @@ def process_cart_product(
         'POST': status.HTTP_201_CREATED,
         'PUT': status.HTTP_206_PARTIAL_CONTENT
     }
-    cart = get_cart(request)
+    cart = get_cart(request, create=True)
     product = int(request.data.get('product'))
     amount = int(request.data.get('amount'))
     serializer = ProductCartCreateSerializer(
@@ -106,37 +149,125 @@ def process_cart_product(
     )
     serializer.is_valid(raise_exception=True)
     serializer.save()
+    cart.touch()
     return Response(
         serializer.data,
         status=action_responses[action]
     )
 
 
+def lock_cart_lines(cart: Cart, product_ids: list) -> dict:
+    """Строки корзины с товарами product_ids, заблокированные до конца
+    транзакции, по id товара."""
+    return {
+        line.product_id: line
+        for line in ProductCart.objects.select_for_update().filter(
+            cart=cart, product__in=product_ids
+        )
+    }
+
+
+def create_cart_lines(cart: Cart, lines: list, is_put: bool) -> None:
+    """Создает строки корзины одним запросом. Если товар добавлен
+    в корзину параллельным запросом, количество в его строке
+    устанавливается (PUT) или увеличивается (POST)."""
+    while lines:
+        try:
+            with transaction.atomic():
+                ProductCart.objects.bulk_create(lines)
+            return
+        except IntegrityError:
+            existing = lock_cart_lines(
+                cart, [line.product_id for line in lines]
+            )
+            if not existing:
+                raise
+        for line in lines:
+            if existing_line := existing.get(line.product_id):
+                if is_put:
+                    existing_line.amount = line.amount
+                else:
+                    existing_line.amount += line.amount
+        ProductCart.objects.bulk_update(existing.values(), ['amount'])
+        lines = [line for line in lines if line.product_id not in existing]
+
+
+def process_cart_batch(request: Request, context: dict) -> Response:
+    """
+    Применяет пакет изменений товаров корзины в одной транзакции:
+    строки корзины блокируются и читаются одним запросом, изменения
+    записываются по одному запросу на создание, обновление и удаление.
+    """
+    serializer = ProductCartBatchSerializer(
+        data=request.data, context=context
+    )
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data['products']
+    is_put = request.method == 'PUT'
+    with transaction.atomic():
+        cart = get_cart(request, create=True)
+        lines = lock_cart_lines(cart, [item['product'] for item in items])
+        created, updated, deleted = [], [], []
+        for item in items:
+            line = lines.get(item['product'])
+            amount = item['amount']
+            if line and not is_put:
+                amount += line.amount
+            if amount <= 0:
+                if line:
+                    deleted.append(line.pk)
+            elif line:
+                line.amount = amount
+                updated.append(line)
+            else:
+                created.append(ProductCart(
+                    cart=cart, product_id=item['product'], amount=amount
+                ))
+        if deleted:
+            ProductCart.objects.filter(pk__in=deleted).delete()
+        if updated:
+            ProductCart.objects.bulk_update(updated, ['amount'])
+        create_cart_lines(cart, created, is_put)
+        cart.touch()
+    return Response(
+        CartSerializer(cart, context=context).data,
+        status=status.HTTP_206_PARTIAL_CONTENT
+    )
+
+
 def change_product_cart_amount(request) -> Optional[ProductCart]:
     """Изменяет количество товара в корзине на единицу.
-    Удаляет товар из корзины, если его количество станет нулевым."""
+    Удаляет товар из корзины, если его количество станет нулевым.
+    Количество меняется в базе одним UPDATE без чтения строки,
+    поэтому одновременные изменения не теряются."""
     cart = get_cart(request)
     product_id = int(request.data.get('product'))
-    if products := ProductCart.objects.filter(
-            product=product_id,
-            cart=cart,
-    ):
-        product = products[0]
-        action = request.path.split('/')[3]
+    products = ProductCart.objects.filter(
+        product=product_id,
+        cart=cart,
+    )
+    action = request.path.split('/')[3]
+    if cart.pk:
         if action == 'add':
-            product.amount += 1
+            changed = products.update(amount=F('amount') + 1)
         elif action == 'subtract':
-            if product.amount == 1:
-                product.delete()
+            changed = products.filter(amount__gt=1).update(
+                amount=F('amount') - 1
+            )
+            if not changed and products.filter(amount__lte=1).delete()[0]:
+                cart.touch()
                 return None
-            product.amount -= 1
         else:
-            product.delete()
-            return None
-        product.save()
-        return product
-    else:
-        raise ValidationError("Товар отсутствует в корзине!")
+            if products.delete()[0]:
+                cart.touch()
+                return None
+            changed = 0
+        if changed:
+            cart.touch()
+            product = products.select_related('product').get()
+            product.cart = cart
+            return product
+    raise ValidationError("Товар отсутствует в корзине!")
 
 
 def list_cart_product(product: ProductCart, context: dict) -> Response:
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from sorl.thumbnail.admin import AdminImageMixin
 
-from .models import Brand, Category, Product, ProductImage
+from .models import (Brand, CatalogueSyncPhase, CatalogueUpdateJob, Category,
+                     Product, ProductImage)
 
 
 @admin.register(ProductImage)
@@ -118,3 +119,29 @@ class ProductAdmin(admin.ModelAdmin):
     )
     empty_value_display = '-пусто-'
     list_per_page = 10
+
+
+class CatalogueSyncPhaseInline(admin.TabularInline):
+    """Время этапов загрузки в админке задач обновления каталога"""
+    model = CatalogueSyncPhase
+    fields = ('name', 'seconds', 'items', 'calls')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(CatalogueUpdateJob)
+class CatalogueUpdateJobAdmin(admin.ModelAdmin):
+    """Админка задач обновления каталога"""
+    list_display = (
+        'id', 'status', 'full', 'created_at', 'started_at', 'finished_at',
+        'phase', 'processed', 'worker'
+    )
+    list_filter = ('status', 'full')
+    readonly_fields = (
+        'created_at', 'started_at', 'finished_at', 'heartbeat_at', 'worker',
+        'phase', 'processed', 'log_file', 'error'
+    )
+    inlines = (
+        CatalogueSyncPhaseInline,
+    )
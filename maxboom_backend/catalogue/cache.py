@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+
+_batch = threading.local()
+
+
+def get_catalogue_version():
+    """Текущая версия каталога, входит в ключи кэша ответов каталога."""
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        # Начальная версия по времени не совпадает с версиями,
+        # которые могли остаться в кэше после вытеснения счетчика.
+        cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def _incr_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        get_catalogue_version()
+
+
+def bump_catalogue_version():
+    """
+    Увеличивает версию каталога сразу и после фиксации транзакции:
+    ответы, закэшированные до фиксации изменений, не будут отданы.
+    Внутри catalogue_version_batch версия увеличивается один раз
+    при выходе из блока.
+    """
+    if getattr(_batch, 'depth', 0):
+        _batch.changed = True
+        return
+    _incr_catalogue_version()
+    transaction.on_commit(_incr_catalogue_version)
+
+
+@contextmanager
+def catalogue_version_batch():
+    """
+    Пакет изменений каталога, например страница карточек при
+    загрузке: вместо увеличения версии при каждом сохранении объекта
+    версия увеличивается один раз после пакета.
+    """
+    depth = getattr(_batch, 'depth', 0)
+    if not depth:
+        _batch.changed = False
+    _batch.depth = depth + 1
+    try:
+        yield
+    finally:
+        _batch.depth = depth
+        if not depth and _batch.changed:
+            bump_catalogue_version()
@@ -0,0 +1,102 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from api.services.search import SearchService
+from api.views.catalogue import CategoryViewSet, ProductViewSet, search
+from maxboom.settings import ALLOWED_HOSTS
+
+
+class LegacyCategoryViewSet(CategoryViewSet):
+    """Представление категорий без кэширования ответов."""
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+
+def dispatch_viewsets(request):
+    """
+    Прежняя реализация /api/search/: повторная диспетчеризация запроса
+    через представления категорий и товаров и отрисовка их ответов.
+    """
+    resp_category = LegacyCategoryViewSet.as_view(
+        actions={'get': 'list'},
+    )(request=request)
+    resp_product = ProductViewSet.as_view(
+        actions={'get': 'list'},
+    )(request=request)
+    data = {'category': [], 'product': {}}
+    if resp_category.status_code == status.HTTP_200_OK:
+        data['category'] = resp_category.render().data
+    if resp_product.status_code == status.HTTP_200_OK:
+        data['product'] = resp_product.render().data
+    return data
+
+
+def search_service(request):
+    response = search(request)
+    response.render()
+    return response.data
+
+
+class Command(BaseCommand):
+    help = ('Сравнение времени и количества запросов к базе данных '
+            'прежнего и нового поиска по каталогу')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'query', nargs='?', default='а',
+            help='строка поиска'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='количество повторов каждого варианта'
+        )
+        parser.add_argument(
+            '--description', action='store_true',
+            help='искать в описаниях товаров'
+        )
+        parser.add_argument(
+            '--concurrent', action='store_true',
+            help=('выполнять поиск категорий и товаров параллельно, '
+                  'запросы из потоков не попадают в подсчет')
+        )
+
+    def make_request(self, query, description):
+        params = {'search': query}
+        if description:
+            params['description'] = 'true'
+        request = APIRequestFactory().get(
+            '/api/search/', params, HTTP_HOST=ALLOWED_HOSTS[0]
+        )
+        request.user = AnonymousUser()
+        return request
+
+    def measure(self, name, handler, options):
+        timings = []
+        for _ in range(options['repeat']):
+            request = self.make_request(
+                options['query'], options['description']
+            )
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                handler(request)
+                timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f'{name}: среднее {statistics.mean(timings) * 1000:.1f} мс, '
+            f'медиана {statistics.median(timings) * 1000:.1f} мс, '
+            f'запросов к БД {len(queries)}'
+        )
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        SearchService.concurrent = options['concurrent']
+        old = self.measure('Прежний поиск', dispatch_viewsets, options)
+        new = self.measure('Новый поиск', search_service, options)
+        self.stdout.write(f'Ускорение: {old / new:.2f}x')
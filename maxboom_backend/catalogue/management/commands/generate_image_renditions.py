@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from catalogue.models import ProductImage
+from catalogue.services.images import RenditionRenderer, generate_renditions
+from maxboom.settings import (CATALOGUE_RENDITION_BATCH_SIZE,
+                              CATALOGUE_RENDITION_WORKERS)
+
+
+class Command(BaseCommand):
+    help = ('Построение миниатюр изображений товаров, загруженных '
+            'до появления миниатюр или через админку')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='перестроить миниатюры всех изображений'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=CATALOGUE_RENDITION_WORKERS,
+            help='число процессов построения миниатюр'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=CATALOGUE_RENDITION_BATCH_SIZE,
+            help='число изображений в пакете'
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(renditions={})
+        renderer = RenditionRenderer(workers=options['workers'])
+        batch_size = options['batch_size']
+        report = {'generated': 0, 'failed': 0}
+        last_pk = 0
+        # Пакеты выбираются по первичному ключу, поэтому изображения
+        # с ошибками не выбираются повторно.
+        while True:
+            images = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not images:
+                break
+            last_pk = images[-1].pk
+            batch_report = generate_renditions(images, renderer, batch_size)
+            for key, value in batch_report.items():
+                report[key] += value
+            self.stdout.write(
+                f'Обработано изображений до {last_pk}: '
+                f'{report["generated"] + report["failed"]}'
+            )
+        self.stdout.write(
+            f'Миниатюры изображений построено: {report["generated"]}, '
+            f'с ошибками: {report["failed"]}'
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalogue.models import Category
+
+
+class Command(BaseCommand):
+    help = ('Пересчет счетчиков товаров в категориях, '
+            'выполняется после синхронизации каталога')
+
+    def handle(self, *args, **options):
+        changed = Category.objects.recount_products()
+        self.stdout.write(f'Обновлены счетчики категорий: {changed}')
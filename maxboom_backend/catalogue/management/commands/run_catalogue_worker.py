@@ -0,0 +1,43 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalogue.services.jobs import get_worker_name, process_next_job
+from maxboom.settings import CATALOGUE_JOB_POLL_INTERVAL
+
+
+class Command(BaseCommand):
+    help = ('Обработчик очереди обновлений каталога с WB, '
+            'задачи ставятся в очередь через /api/update/')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='выполнить не больше одной задачи и завершиться'
+        )
+        parser.add_argument(
+            '--poll', type=float, default=CATALOGUE_JOB_POLL_INTERVAL,
+            help='интервал опроса очереди, сек.'
+        )
+
+    def handle(self, *args, **options):
+        self.stopped = False
+        signal.signal(signal.SIGTERM, self.stop)
+        worker = get_worker_name()
+        self.stdout.write(f'Обработчик {worker} запущен')
+        while not self.stopped:
+            job = process_next_job(worker)
+            if job is not None:
+                self.stdout.write(
+                    f'Задача {job.pk}: {job.get_status_display()}'
+                )
+            if options['once']:
+                break
+            if job is None:
+                time.sleep(options['poll'])
+        self.stdout.write(f'Обработчик {worker} остановлен')
+
+    def stop(self, signum, frame):
+        # Текущая задача завершается, новые не захватываются.
+        self.stopped = True
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.3 on 2026-10-18 09:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_category_closure(apps, schema_editor):
+    Category = apps.get_model('catalogue', 'Category')
+    CategoryClosure = apps.get_model('catalogue', 'CategoryClosure')
+    parents = dict(Category.objects.values_list('id', 'root_id'))
+    links = []
+    for category_id in parents:
+        ancestor_id, depth, visited = category_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in visited:
+            visited.add(ancestor_id)
+            links.append(CategoryClosure(
+                ancestor_id=ancestor_id,
+                descendant_id=category_id,
+                depth=depth
+            ))
+            ancestor_id = parents.get(ancestor_id)
+            depth += 1
+    CategoryClosure.objects.bulk_create(links, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0003_product_weight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='Глубина вложенности')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='catalogue.category', verbose_name='Категория-предок')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='catalogue.category', verbose_name='Категория-потомок')),
+            ],
+            options={
+                'verbose_name': 'Связь дерева категорий',
+                'verbose_name_plural': 'Связи дерева категорий',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='categoryclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_category_closure'),
+        ),
+        migrations.RunPython(
+            build_category_closure, migrations.RunPython.noop
+        ),
+    ]
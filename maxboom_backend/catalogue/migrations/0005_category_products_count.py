@@ -0,0 +1,50 @@
+# Generated by Django 3.2.3 on 2026-10-18 09:53
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_category_products(apps, schema_editor):
+    Category = apps.get_model('catalogue', 'Category')
+    CategoryClosure = apps.get_model('catalogue', 'CategoryClosure')
+    subtree_counts = dict(CategoryClosure.objects.filter(
+        descendant__is_prohibited=False
+    ).values('ancestor').annotate(
+        count=Count(
+            'descendant__products',
+            filter=Q(descendant__products__is_deleted=False)
+        )
+    ).values_list('ancestor', 'count').order_by())
+    categories = list(Category.objects.annotate(
+        count=Count('products', filter=Q(products__is_deleted=False))
+    ).order_by())
+    for category in categories:
+        category.products_count = category.count
+        category.subtree_products_count = subtree_counts.get(category.pk, 0)
+    Category.objects.bulk_update(
+        categories, ('products_count', 'subtree_products_count'),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0004_category_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Товары категории, не помеченные удаленными', verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subtree_products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Товары категории и её подкатегорий, разрешенных для публикации', verbose_name='Количество товаров с подкатегориями'),
+        ),
+        migrations.RunPython(
+            count_category_products, migrations.RunPython.noop
+        ),
+    ]
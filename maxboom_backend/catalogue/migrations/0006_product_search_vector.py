@@ -0,0 +1,83 @@
+# Generated by Django 3.2.3 on 2026-10-18 12:40
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+CREATE_SEARCH_SQL = (
+    '''
+    CREATE OR REPLACE FUNCTION catalogue_product_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('simple', NEW.code::text), 'A');
+        NEW.description_vector :=
+            to_tsvector('russian', coalesce(NEW.description, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    ''',
+    '''
+    CREATE TRIGGER catalogue_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, code, description
+    ON catalogue_product
+    FOR EACH ROW EXECUTE PROCEDURE catalogue_product_search_vector_update();
+    ''',
+    '''
+    UPDATE catalogue_product SET
+        search_vector =
+            setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('simple', code::text), 'A'),
+        description_vector = to_tsvector('russian', coalesce(description, ''));
+    ''',
+    'CREATE INDEX catalogue_product_search_vector_gin '
+    'ON catalogue_product USING gin (search_vector);',
+    'CREATE INDEX catalogue_product_description_vector_gin '
+    'ON catalogue_product USING gin (description_vector);',
+    'CREATE INDEX catalogue_product_name_trgm '
+    'ON catalogue_product USING gin (name gin_trgm_ops);',
+)
+
+DROP_SEARCH_SQL = (
+    'DROP INDEX IF EXISTS catalogue_product_name_trgm;',
+    'DROP INDEX IF EXISTS catalogue_product_description_vector_gin;',
+    'DROP INDEX IF EXISTS catalogue_product_search_vector_gin;',
+    'DROP TRIGGER IF EXISTS catalogue_product_search_vector_trigger '
+    'ON catalogue_product;',
+    'DROP FUNCTION IF EXISTS catalogue_product_search_vector_update();',
+)
+
+
+def execute_postgres(statements):
+    def execute(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return execute
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0005_category_products_count'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='description_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор описания'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор названия и кода'),
+        ),
+        migrations.RunPython(
+            execute_postgres(CREATE_SEARCH_SQL),
+            execute_postgres(DROP_SEARCH_SQL),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0006_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 содержимого'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='etag',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='ETag источника'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='source_url',
+            field=models.URLField(blank=True, editable=False, max_length=1000, verbose_name='Адрес источника'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.3 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Уникальный индекс по константе допускает только одну строку,
+# попадающую под условие: одну ожидающую или выполняемую задачу.
+CREATE_INDEX_SQL = (
+    'CREATE UNIQUE INDEX unique_active_catalogue_update_job '
+    'ON catalogue_catalogueupdatejob ((1)) '
+    "WHERE status IN ('pending', 'running');"
+)
+DROP_INDEX_SQL = 'DROP INDEX unique_active_catalogue_update_job;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalogue', '0007_productimage_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueUpdateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Завершена'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('full', models.BooleanField(default=False, verbose_name='Полная загрузка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Запущена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Отметка о работе')),
+                ('worker', models.CharField(blank=True, max_length=255, verbose_name='Обработчик')),
+                ('phase', models.CharField(blank=True, max_length=50, verbose_name='Этап')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано карточек')),
+                ('log_file', models.CharField(blank=True, max_length=1000, verbose_name='Журнал')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='catalogue_update_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Задача обновления каталога',
+                'verbose_name_plural': 'Задачи обновления каталога',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.RunSQL(CREATE_INDEX_SQL, DROP_INDEX_SQL),
+    ]
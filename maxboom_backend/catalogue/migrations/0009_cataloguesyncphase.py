@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0008_catalogueupdatejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueSyncPhase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('cards', 'Список карточек'), ('full_cards', 'Карточки с характеристиками'), ('db_upsert', 'Запись товаров'), ('images', 'Изображения'), ('categories', 'Категории'), ('prices', 'Цены')], max_length=20, verbose_name='Этап')),
+                ('seconds', models.FloatField(default=0, verbose_name='Время, сек.')),
+                ('items', models.PositiveIntegerField(default=0, verbose_name='Обработано элементов')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='Количество запусков')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phases', to='catalogue.catalogueupdatejob', verbose_name='Задача')),
+            ],
+            options={
+                'verbose_name': 'Этап загрузки каталога',
+                'verbose_name_plural': 'Этапы загрузки каталога',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cataloguesyncphase',
+            constraint=models.UniqueConstraint(fields=('job', 'name'), name='unique_catalogue_sync_phase'),
+        ),
+    ]
@@ -1,52 +1,109 @@
 import logging
 import os
+import re
+from collections import defaultdict
+from datetime import timedelta
 
-from django.db import models
-from django.db.models.signals import pre_delete, pre_save
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch.dispatcher import receiver
+from django.utils import timezone
 from django.utils.html import mark_safe
 from pytils.translit import slugify
 from sorl.thumbnail import ImageField, delete
 from sorl.thumbnail.shortcuts import get_thumbnail
 
+from catalogue.cache import bump_catalogue_version
+from maxboom.settings import (CATALOGUE_BATCH_SIZE,
+                              CATALOGUE_JOB_STALE_SECONDS)
+
+User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
-def get_slug(instance):
-    if type(instance) is Brand:
-        name = instance.name.replace('   ', ' ').replace('  ', ' ')
-        slug_n = slugify(name)[:200]
-        i = 1
-        while Brand.objects.filter(slug=slug_n).exists():
-            if len(slug_n) == 200:
-                slug_n = slug_n[:-1]
-            slug_n = slug_n + str(i)
-            i += 1
-        return slug_n
+SLUG_MAX_LENGTH = 200
+# Длина номеров, добавляемых к слагу, при которой занятые варианты
+# еще находятся одним запросом в allocate_slugs.
+SLUG_SUFFIX_RESERVE = 20
 
-    if type(instance) is Category:
-        name = instance.name.replace('   ', ' ').replace('  ', ' ')
-        slug_n = slugify(name)[:200]
-        i = 1
-        while Category.objects.filter(slug=slug_n).exists():
-            if len(slug_n) == 200:
-                slug_n = slug_n[:-1]
-            slug_n = slug_n + str(i)
-            i += 1
-        return slug_n
 
+def get_base_slug(instance):
+    """Слаг по наименованию, для товара с кодом товара в конце."""
+    name = instance.name.replace('   ', ' ').replace('  ', ' ')
     if type(instance) is Product:
-        name = instance.name.replace('   ', ' ').replace('  ', ' ')
         code = str(instance.code)
-        slug_n = (slugify(name)[:199 - len(code)]
-                  + '-' + code)
-        i = 1
-        while Product.objects.filter(slug=slug_n).exists():
-            if len(slug_n) == 200:
-                slug_n = slug_n[:-1]
-            slug_n = slug_n + str(i)
-            i += 1
-        return slug_n
+        return slugify(name)[:SLUG_MAX_LENGTH - 1 - len(code)] + '-' + code
+    return slugify(name)[:SLUG_MAX_LENGTH]
+
+
+def get_slug_candidates(slug):
+    """Слаг и варианты с добавленными номерами: slug, slug1, slug12..."""
+    yield slug
+    i = 1
+    while True:
+        suffix = str(i)
+        slug = slug[:SLUG_MAX_LENGTH - len(suffix)] + suffix
+        yield slug
+        i += 1
+
+
+def get_slug(instance):
+    """Свободный слаг объекта, сам объект при проверке не учитывается."""
+    queryset = type(instance).objects.all()
+    if instance.pk is not None:
+        queryset = queryset.exclude(pk=instance.pk)
+    for slug in get_slug_candidates(get_base_slug(instance)):
+        if not queryset.filter(slug=slug).exists():
+            return slug
+
+
+def allocate_slugs(instances):
+    """
+    Слаги для пакета новых или переименованных объектов одной модели
+    при загрузке каталога. Собственный слаг сохраненного объекта
+    не считается занятым. Занятые слаги, начинающиеся с базовых
+    слагов пакета,
+    выбираются одним запросом, свободные варианты подбираются
+    в памяти с учетом слагов, уже выданных в пакете.
+    Варианты длинных слагов обрезаются, чтобы номер поместился
+    в поле, поэтому запрос выбирает слаги по базовому слагу,
+    обрезанному на SLUG_SUFFIX_RESERVE символов. Варианты короче
+    этого префикса проверяются отдельным запросом.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+    queryset = type(instances[0]).objects.all()
+    bases = [get_base_slug(instance) for instance in instances]
+    prefixes = [
+        base[:SLUG_MAX_LENGTH - SLUG_SUFFIX_RESERVE] for base in bases
+    ]
+    pattern = '^({})'.format('|'.join(
+        re.escape(prefix) for prefix in set(prefixes)
+    ))
+    owners = dict(queryset.filter(
+        slug__regex=pattern
+    ).values_list('slug', 'pk'))
+    taken = set(owners)
+    for instance, base, prefix in zip(instances, bases, prefixes):
+        others = queryset.exclude(pk=instance.pk)
+        for slug in get_slug_candidates(base):
+            if slug in taken and (
+                instance.pk is None or owners.get(slug) != instance.pk
+            ):
+                continue
+            if (
+                slug.startswith(prefix)
+                or not others.filter(slug=slug).exists()
+            ):
+                break
+        instance.slug = slug
+        taken.add(slug)
+    return instances
 
 
 def image_upload_path(instance, filename):
@@ -62,9 +119,58 @@ def image_upload_path(instance, filename):
         )
 
 
-class Brand(models.Model):
+class TrackFieldsMixin:
+    """
+    Запоминает значения полей tracked_fields, загруженные из базы,
+    чтобы определять их изменение без дополнительных запросов.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.get_tracked_values()
+        return instance
+
+    def get_tracked_values(self):
+        values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                value = self.__dict__[attname]
+                # Для файлов запоминается имя: объект файла изменяемый.
+                if isinstance(value, FieldFile):
+                    value = value.name
+                values[name] = value
+        return values
+
+    def get_loaded_value(self, name):
+        """Значение поля на момент загрузки из базы."""
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def has_changed(self, name):
+        """Изменилось ли поле с момента загрузки из базы."""
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return True
+        attname = self._meta.get_field(name).attname
+        if name not in loaded_values:
+            return attname in self.__dict__
+        value = self.__dict__.get(attname)
+        if isinstance(value, FieldFile):
+            value = value.name
+        return loaded_values[name] != value
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = self.get_tracked_values()
+
+
+class Brand(TrackFieldsMixin, models.Model):
     """Модель производителей."""
 
+    tracked_fields = ('name', 'image')
+
     name = models.CharField(
         verbose_name='Наименование',
         max_length=500,
@@ -104,7 +210,8 @@ class Brand(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.slug = get_slug(self)
+        if not self.slug or self.has_changed('name'):
+            self.slug = get_slug(self)
         super().save(*args, **kwargs)
 
     def img_preview(self):
@@ -139,9 +246,77 @@ class Brand(models.Model):
     img_preview.short_description = 'Изображение'
 
 
-class Category(models.Model):
+class CategoryManager(models.Manager):
+    """Обслуживание счетчиков товаров в категориях."""
+
+    def change_products_count(self, category_id, delta):
+        """
+        Изменяет на delta счетчик товаров категории и счетчики
+        поддерева у всех её предков.
+        """
+        self.filter(pk=category_id).update(
+            products_count=F('products_count') + delta
+        )
+        self.filter(pk__in=CategoryClosure.objects.filter(
+            descendant_id=category_id, descendant__is_prohibited=False
+        ).values('ancestor')).update(
+            subtree_products_count=F('subtree_products_count') + delta
+        )
+
+    def recount_products(self, category_ids=None):
+        """
+        Пересчитывает счетчики товаров категорий category_ids
+        (всех категорий по умолчанию). В счетчик поддерева
+        не входят подкатегории, скрытые запретом публикации самой
+        подкатегории или категории между ней и предком.
+        Возвращает количество категорий с изменившимися счетчиками.
+        """
+        categories = self.only(
+            'products_count', 'subtree_products_count'
+        ).annotate(
+            count=Count('products', filter=Q(products__is_deleted=False))
+        ).order_by()
+        hidden = CategoryClosure.objects.filter(
+            descendant=OuterRef('descendant'),
+            depth__lt=OuterRef('depth'),
+            ancestor__is_prohibited=True,
+            ancestor__ancestor_links__ancestor=OuterRef('ancestor'),
+        )
+        links = CategoryClosure.objects.filter(
+            descendant__is_prohibited=False
+        ).exclude(Exists(hidden))
+        if category_ids is not None:
+            categories = categories.filter(pk__in=category_ids)
+            links = links.filter(ancestor_id__in=category_ids)
+        subtree_counts = dict(links.values('ancestor').annotate(
+            count=Count(
+                'descendant__products',
+                filter=Q(descendant__products__is_deleted=False)
+            )
+        ).values_list('ancestor', 'count').order_by())
+        changed = []
+        for category in categories:
+            counts = (category.count, subtree_counts.get(category.pk, 0))
+            if counts != (
+                category.products_count, category.subtree_products_count
+            ):
+                (category.products_count,
+                 category.subtree_products_count) = counts
+                changed.append(category)
+        self.bulk_update(
+            changed, ('products_count', 'subtree_products_count'),
+            batch_size=CATALOGUE_BATCH_SIZE
+        )
+        if changed:
+            bump_catalogue_version()
+        return len(changed)
+
+
+class Category(TrackFieldsMixin, models.Model):
     """Модель категорий."""
 
+    tracked_fields = ('name', 'root', 'is_prohibited', 'image')
+
     name = models.CharField(
         verbose_name='Название',
         max_length=500,
@@ -183,6 +358,21 @@ class Category(models.Model):
         null=True,
         blank=True,
     )
+    products_count = models.PositiveIntegerField(
+        verbose_name='Количество товаров',
+        help_text='Товары категории, не помеченные удаленными',
+        default=0,
+        editable=False,
+    )
+    subtree_products_count = models.PositiveIntegerField(
+        verbose_name='Количество товаров с подкатегориями',
+        help_text=('Товары категории и её подкатегорий, разрешенных '
+                   'для публикации'),
+        default=0,
+        editable=False,
+    )
+
+    objects = CategoryManager()
 
     class Meta:
         verbose_name = 'Категория'
@@ -193,7 +383,8 @@ class Category(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.slug = get_slug(self)
+        if not self.slug or self.has_changed('name'):
+            self.slug = get_slug(self)
         super().save(*args, **kwargs)
 
     def img_preview(self):
@@ -228,9 +419,128 @@ class Category(models.Model):
     img_preview.short_description = 'Эскиз'
 
 
-class Product(models.Model):
+class CategoryClosureManager(models.Manager):
+    """Обслуживание таблицы замыкания дерева категорий."""
+
+    def rebuild(self):
+        """Полностью перестраивает таблицу замыкания по полю root."""
+        parents = dict(Category.objects.values_list('id', 'root_id'))
+        links = []
+        for category_id in parents:
+            ancestor_id, depth, visited = category_id, 0, set()
+            while ancestor_id is not None and ancestor_id not in visited:
+                visited.add(ancestor_id)
+                links.append(self.model(
+                    ancestor_id=ancestor_id,
+                    descendant_id=category_id,
+                    depth=depth
+                ))
+                ancestor_id = parents.get(ancestor_id)
+                depth += 1
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(links, batch_size=CATALOGUE_BATCH_SIZE)
+
+    def add(self, categories):
+        """
+        Добавляет связи новых категорий без подкатегорий, например
+        созданных пакетом при загрузке каталога, без перестройки
+        всей таблицы.
+        """
+        categories = list(categories)
+        root_ids = {category.root_id for category in categories}
+        ancestors = defaultdict(list)
+        for descendant_id, ancestor_id, depth in self.filter(
+            descendant_id__in=root_ids - {None}
+        ).values_list('descendant_id', 'ancestor_id', 'depth'):
+            ancestors[descendant_id].append((ancestor_id, depth))
+        links = []
+        for category in categories:
+            links.append(self.model(
+                ancestor_id=category.pk, descendant_id=category.pk, depth=0
+            ))
+            for ancestor_id, depth in ancestors[category.root_id]:
+                links.append(self.model(
+                    ancestor_id=ancestor_id,
+                    descendant_id=category.pk,
+                    depth=depth + 1
+                ))
+        self.bulk_create(links, batch_size=CATALOGUE_BATCH_SIZE)
+
+    def move(self, category):
+        """
+        Обновляет связи поддерева категории после её создания
+        или смены родительской категории.
+        """
+        with transaction.atomic():
+            subtree = dict(self.filter(ancestor=category).values_list(
+                'descendant_id', 'depth'))
+            if category.root_id in subtree:
+                # Категория перенесена в собственное поддерево.
+                return self.rebuild()
+            links = []
+            if not subtree:
+                subtree = {category.pk: 0}
+                links.append(self.model(
+                    ancestor_id=category.pk,
+                    descendant_id=category.pk,
+                    depth=0
+                ))
+            self.filter(descendant_id__in=subtree).exclude(
+                ancestor_id__in=subtree).delete()
+            ancestors = ()
+            if category.root_id is not None:
+                ancestors = self.filter(
+                    descendant_id=category.root_id
+                ).values_list('ancestor_id', 'depth')
+            for ancestor_id, ancestor_depth in ancestors:
+                for descendant_id, depth in subtree.items():
+                    links.append(self.model(
+                        ancestor_id=ancestor_id,
+                        descendant_id=descendant_id,
+                        depth=ancestor_depth + depth + 1
+                    ))
+            self.bulk_create(links, batch_size=CATALOGUE_BATCH_SIZE)
+
+
+class CategoryClosure(models.Model):
+    """
+    Таблица замыкания дерева категорий: для каждой категории хранит
+    всех её предков, включая саму категорию, и глубину вложенности.
+    """
+    ancestor = models.ForeignKey(
+        Category, related_name='descendant_links', on_delete=models.CASCADE,
+        verbose_name='Категория-предок'
+    )
+    descendant = models.ForeignKey(
+        Category, related_name='ancestor_links', on_delete=models.CASCADE,
+        verbose_name='Категория-потомок'
+    )
+    depth = models.PositiveSmallIntegerField(
+        verbose_name='Глубина вложенности'
+    )
+
+    objects = CategoryClosureManager()
+
+    class Meta:
+        verbose_name = 'Связь дерева категорий'
+        verbose_name_plural = 'Связи дерева категорий'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('ancestor', 'descendant'),
+                name='unique_category_closure'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.ancestor_id} -> {self.descendant_id}'
+
+
+class Product(TrackFieldsMixin, models.Model):
     """Модель товаров."""
 
+    tracked_fields = ('name', 'code', 'category', 'is_deleted')
+
     name = models.CharField(verbose_name='Название', max_length=500)
     slug = models.SlugField(
         verbose_name='Уникальный слаг', unique=True, max_length=200,
@@ -291,6 +601,16 @@ class Product(models.Model):
         decimal_places=3,
         default=0,
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор названия и кода',
+        null=True,
+        editable=False,
+    )
+    description_vector = SearchVectorField(
+        verbose_name='Поисковый вектор описания',
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Товар'
@@ -301,15 +621,19 @@ class Product(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.slug = get_slug(self)
+        if (not self.slug or self.has_changed('name')
+                or self.has_changed('code')):
+            self.slug = get_slug(self)
         if not self.wb_urls:
             self.wb_urls = ('https://www.wildberries.ru/catalog/'
                             f'{self.code}/detail.aspx')
         super().save(*args, **kwargs)
 
 
-class ProductImage(models.Model):
+class ProductImage(TrackFieldsMixin, models.Model):
     """Модель изображений товаров"""
+
+    tracked_fields = ('image', 'renditions')
     product = models.ForeignKey(
         Product, related_name='images', on_delete=models.CASCADE,
         verbose_name='Продукт',
@@ -319,6 +643,30 @@ class ProductImage(models.Model):
         max_length=1000,
         verbose_name='Изображение',
     )
+    source_url = models.URLField(
+        verbose_name='Адрес источника',
+        max_length=1000,
+        blank=True,
+        editable=False,
+    )
+    etag = models.CharField(
+        verbose_name='ETag источника',
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    content_hash = models.CharField(
+        verbose_name='SHA-256 содержимого',
+        max_length=64,
+        blank=True,
+        editable=False,
+    )
+    renditions = models.JSONField(
+        verbose_name='Миниатюры',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Изображение товара'
@@ -327,6 +675,15 @@ class ProductImage(models.Model):
     def __str__(self) -> str:
         return self.image.name
 
+    def save(self, *args, **kwargs):
+        # Миниатюры прежнего файла не подходят к новому, они строятся
+        # заново при загрузке каталога или командой
+        # generate_image_renditions.
+        if (self.pk is not None and self.has_changed('image')
+                and not self.has_changed('renditions')):
+            self.renditions = {}
+        super().save(*args, **kwargs)
+
     def img_preview(self):
         value = self.image
         if value and hasattr(value, 'url'):
@@ -359,20 +716,322 @@ class ProductImage(models.Model):
     img_preview.short_description = 'Изображение'
 
 
+class CatalogueUpdateJobManager(models.Manager):
+    """
+    Очередь обновлений каталога. Активной (ожидающей или выполняемой)
+    может быть только одна задача, что дополнительно обеспечивается
+    условным уникальным индексом unique_active_catalogue_update_job.
+    """
+
+    def active(self):
+        return self.filter(status__in=CatalogueUpdateJob.ACTIVE_STATUSES)
+
+    def enqueue(self, user=None, full=False):
+        """
+        Постановка задачи в очередь. Возвращает None, если активная
+        задача уже есть.
+        """
+        self.fail_stale()
+        if self.active().exists():
+            return None
+        try:
+            with transaction.atomic():
+                return self.create(created_by=user, full=full)
+        except IntegrityError:
+            return None
+
+    def claim(self, worker, pk=None):
+        """
+        Захват самой старой ожидающей задачи обработчиком.
+        Строка блокируется через SELECT ... FOR UPDATE SKIP LOCKED,
+        поэтому одну задачу не возьмут два обработчика.
+        """
+        queryset = self.filter(status=CatalogueUpdateJob.PENDING)
+        if pk is not None:
+            queryset = queryset.filter(pk=pk)
+        now = timezone.now()
+        with transaction.atomic():
+            job = queryset.select_for_update(
+                skip_locked=True
+            ).order_by('created_at', 'pk').first()
+            if job is None or not queryset.filter(pk=job.pk).update(
+                status=CatalogueUpdateJob.RUNNING, worker=worker,
+                started_at=now, heartbeat_at=now
+            ):
+                return None
+        job.refresh_from_db()
+        return job
+
+    def fail_stale(self, timeout=CATALOGUE_JOB_STALE_SECONDS):
+        """
+        Выполняемые задачи без отметки о работе дольше timeout сек.
+        отмечаются прерванными, например после падения обработчика.
+        """
+        now = timezone.now()
+        return self.filter(
+            status=CatalogueUpdateJob.RUNNING,
+            heartbeat_at__lt=now - timedelta(seconds=timeout)
+        ).update(
+            status=CatalogueUpdateJob.FAILED, finished_at=now,
+            error='Обработчик перестал отвечать'
+        )
+
+
+class CatalogueUpdateJob(models.Model):
+    """Задача обновления каталога с WB."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершена'),
+        (FAILED, 'Ошибка'),
+    )
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    status = models.CharField(
+        verbose_name='Статус', max_length=10, choices=STATUSES,
+        default=PENDING
+    )
+    full = models.BooleanField(
+        verbose_name='Полная загрузка', default=False
+    )
+    created_by = models.ForeignKey(
+        User, related_name='catalogue_update_jobs', on_delete=models.SET_NULL,
+        null=True, blank=True, verbose_name='Автор'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Создана', auto_now_add=True
+    )
+    started_at = models.DateTimeField(
+        verbose_name='Запущена', null=True, blank=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Завершена', null=True, blank=True
+    )
+    heartbeat_at = models.DateTimeField(
+        verbose_name='Отметка о работе', null=True, blank=True
+    )
+    worker = models.CharField(
+        verbose_name='Обработчик', max_length=255, blank=True
+    )
+    phase = models.CharField(
+        verbose_name='Этап', max_length=50, blank=True
+    )
+    processed = models.PositiveIntegerField(
+        verbose_name='Обработано карточек', default=0
+    )
+    log_file = models.CharField(
+        verbose_name='Журнал', max_length=1000, blank=True
+    )
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+
+    objects = CatalogueUpdateJobManager()
+
+    class Meta:
+        verbose_name = 'Задача обновления каталога'
+        verbose_name_plural = 'Задачи обновления каталога'
+        # Единственная активная задача обеспечивается уникальным
+        # индексом по константе из миграции 0008: UniqueConstraint
+        # в Django 3.2 не поддерживает выражения.
+        ordering = ('-created_at',)
+
+    def __str__(self) -> str:
+        return f'{self.pk} {self.get_status_display()}'
+
+    def report_progress(self, phase, processed=None):
+        """Сохранение этапа и числа обработанных карточек."""
+        self.phase = phase
+        fields = {'phase': phase, 'heartbeat_at': timezone.now()}
+        if processed is not None:
+            self.processed = fields['processed'] = processed
+        type(self).objects.filter(pk=self.pk).update(**fields)
+
+    def finish(self, status, error=''):
+        self.status = status
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=('status', 'error', 'finished_at'))
+
+    @property
+    def duration(self):
+        """Длительность выполнения задачи, сек."""
+        if self.started_at is None:
+            return None
+        finished_at = self.finished_at or timezone.now()
+        return (finished_at - self.started_at).total_seconds()
+
+    @property
+    def cards_per_second(self):
+        duration = self.duration
+        if not duration:
+            return None
+        return round(self.processed / duration, 2)
+
+
+class CatalogueSyncPhase(models.Model):
+    """
+    Время выполнения этапа загрузки каталога и количество
+    обработанных элементов, суммарно за задачу.
+    """
+    CARDS = 'cards'
+    FULL_CARDS = 'full_cards'
+    DB_UPSERT = 'db_upsert'
+    IMAGES = 'images'
+    CATEGORIES = 'categories'
+    PRICES = 'prices'
+    PHASES = (
+        (CARDS, 'Список карточек'),
+        (FULL_CARDS, 'Карточки с характеристиками'),
+        (DB_UPSERT, 'Запись товаров'),
+        (IMAGES, 'Изображения'),
+        (CATEGORIES, 'Категории'),
+        (PRICES, 'Цены'),
+    )
+
+    job = models.ForeignKey(
+        CatalogueUpdateJob, related_name='phases', on_delete=models.CASCADE,
+        verbose_name='Задача'
+    )
+    name = models.CharField(
+        verbose_name='Этап', max_length=20, choices=PHASES
+    )
+    seconds = models.FloatField(verbose_name='Время, сек.', default=0)
+    items = models.PositiveIntegerField(
+        verbose_name='Обработано элементов', default=0
+    )
+    calls = models.PositiveIntegerField(
+        verbose_name='Количество запусков', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Этап загрузки каталога'
+        verbose_name_plural = 'Этапы загрузки каталога'
+        ordering = ('pk',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('job', 'name'),
+                name='unique_catalogue_sync_phase'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.job_id} {self.name}'
+
+    @property
+    def items_per_second(self):
+        if not self.seconds:
+            return None
+        return round(self.items / self.seconds, 2)
+
+
 @receiver(pre_delete, sender=Category)
 @receiver(pre_delete, sender=Brand)
 @receiver(pre_delete, sender=ProductImage)
 def image_model_delete(sender, instance, **kwargs):
     if instance.image and instance.image.name:
         delete(instance.image)
+    if sender is ProductImage:
+        for name in get_rendition_names(instance.renditions):
+            delete(name)
+
+
+def get_rendition_names(renditions):
+    """Имена файлов миниатюр из ProductImage.renditions."""
+    return [
+        name
+        for rendition in (renditions or {}).values()
+        for name in rendition.get('files', {}).values()
+    ]
+
+
+def delete_files(names):
+    for name in names:
+        delete(name)
+
+
+def delete_files_on_commit(names, using=None):
+    """
+    Удаление файлов изображений вместе с миниатюрами после фиксации
+    транзакции. При откате транзакции или точки сохранения, в которой
+    вызвана функция, файлы не удаляются. Вне транзакции файлы
+    удаляются сразу.
+    """
+    names = sorted({name for name in names if name})
+    if names:
+        transaction.on_commit(lambda: delete_files(names), using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=ProductImage)
+def image_model_update(sender, instance, created, **kwargs):
+    # Имя прежнего файла берется из значений, запомненных при загрузке
+    # объекта, без запроса к базе данных.
+    if not created and instance.has_changed('image'):
+        delete_files_on_commit([instance.get_loaded_value('image')])
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_renditions_update(sender, instance, created, **kwargs):
+    if not created and instance.has_changed('renditions'):
+        delete_files_on_commit(
+            set(get_rendition_names(instance.get_loaded_value('renditions')))
+            - set(get_rendition_names(instance.renditions))
+        )
+
+
+@receiver(post_save, sender=Category)
+def category_tree_update(sender, instance, created, **kwargs):
+    if created:
+        CategoryClosure.objects.move(instance)
+        return
+    root_changed = instance.has_changed('root')
+    if not root_changed and not instance.has_changed('is_prohibited'):
+        return
+    ancestors = CategoryClosure.objects.filter(descendant=instance)
+    affected = set(ancestors.values_list('ancestor_id', flat=True))
+    if root_changed:
+        CategoryClosure.objects.move(instance)
+        affected.update(ancestors.values_list('ancestor_id', flat=True))
+    Category.objects.recount_products(affected)
+
+
+@receiver(post_delete, sender=Category)
+def category_tree_delete(sender, instance, **kwargs):
+    # Дочерние категории удаленной категории становятся корневыми,
+    # а её товары остаются без категории.
+    CategoryClosure.objects.rebuild()
+    Category.objects.recount_products()
+
+
+@receiver(post_save, sender=Product)
+def product_counters_update(sender, instance, created, **kwargs):
+    if not created:
+        if not (instance.has_changed('category')
+                or instance.has_changed('is_deleted')):
+            return
+        category_id = instance.get_loaded_value('category')
+        if (category_id is not None
+                and not instance.get_loaded_value('is_deleted')):
+            Category.objects.change_products_count(category_id, -1)
+    if instance.category_id is not None and not instance.is_deleted:
+        Category.objects.change_products_count(instance.category_id, 1)
+
+
+@receiver(post_delete, sender=Product)
+def product_counters_delete(sender, instance, **kwargs):
+    if instance.category_id is not None and not instance.is_deleted:
+        Category.objects.change_products_count(instance.category_id, -1)
 
 
-@receiver(pre_save, sender=Category)
-@receiver(pre_save, sender=Brand)
-@receiver(pre_save, sender=ProductImage)
-def image_model_update(sender, instance, **kwargs):
-    pk = instance.pk
-    if sender.objects.filter(pk=pk).exists():
-        old_item = sender.objects.get(pk=pk)
-        if old_item.image and old_item.image.name != instance.image.name:
-            delete(old_item.image.name)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Product)
+def catalogue_version_update(sender, **kwargs):
+    bump_catalogue_version()
@@ -0,0 +1,93 @@
+"""
+Цены товаров по уровням покупателей.
+Розничная цена для анонимных пользователей и покупателей без статуса
+продавца, оптовая - для продавцов. Уровень покупателя определяется
+один раз и запоминается на объекте пользователя, корзины или заказа.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Round
+
+from maxboom.settings import DISCOUNT_ANONYM, DISCOUNT_USER
+
+RETAIL = 'retail'
+WHOLESALE = 'wholesale'
+TIER_DISCOUNTS = {
+    RETAIL: DISCOUNT_ANONYM,
+    WHOLESALE: DISCOUNT_USER,
+}
+PRICE_QUANT = Decimal('0.01')
+
+
+def round_price(value):
+    """Округление суммы до копеек."""
+    return Decimal(value).quantize(PRICE_QUANT, rounding=ROUND_HALF_UP)
+
+
+def format_price(value):
+    """Сумма строкой с копейками для чеков ЮKassa."""
+    return str(round_price(value))
+
+
+def get_tier_price(price, tier):
+    """Цена товара для уровня покупателя."""
+    return round_price(price * TIER_DISCOUNTS[tier])
+
+
+def get_price_field(tier):
+    return f'{tier}_price'
+
+
+def tier_price_expression(tier, price_field='price'):
+    """
+    Выражение цены для уровня покупателя, округление совпадает
+    с round_price.
+    """
+    return ExpressionWrapper(
+        Round(F(price_field) * TIER_DISCOUNTS[tier] * 100) / 100,
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def annotate_prices(queryset, price_field='price'):
+    """Добавляет к товарам цены всех уровней: retail_price и т.д."""
+    return queryset.annotate(**{
+        get_price_field(tier): tier_price_expression(tier, price_field)
+        for tier in TIER_DISCOUNTS
+    })
+
+
+def get_product_price(product, tier):
+    """Цена товара из аннотации queryset или вычисленная по цене."""
+    price = getattr(product, get_price_field(tier), None)
+    if price is None:
+        return get_tier_price(product.price, tier)
+    return round_price(price)
+
+
+def get_user_tier(user):
+    """Уровень пользователя, профиль запрашивается один раз."""
+    tier = getattr(user, '_price_tier', None)
+    if tier is None:
+        if user.is_authenticated and user.userprofile.is_vendor:
+            tier = WHOLESALE
+        else:
+            tier = RETAIL
+        user._price_tier = tier
+    return tier
+
+
+def get_owner_tier(owner):
+    """
+    Уровень покупателя корзины или заказа: оптовый только для
+    авторизованного (is_active) продавца.
+    """
+    tier = getattr(owner, '_price_tier', None)
+    if tier is None:
+        if owner.is_active and owner.user_id:
+            tier = get_user_tier(owner.user)
+        else:
+            tier = RETAIL
+        owner._price_tier = tier
+    return tier
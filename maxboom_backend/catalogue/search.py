@@ -0,0 +1,7 @@
+"""
+Полнотекстовый поиск товаров в PostgreSQL. Конфигурация текстового
+поиска должна совпадать с записанной в триггере поисковых векторов
+(миграция 0006): при её изменении триггер и векторы товаров нужно
+пересоздать новой миграцией.
+"""
+SEARCH_CONFIG = 'russian'
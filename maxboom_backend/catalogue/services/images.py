@@ -0,0 +1,516 @@
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import requests
+from django.core.files.base import ContentFile, File
+from django.db import transaction
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+from catalogue.cache import bump_catalogue_version
+from catalogue.models import (ProductImage, delete_files_on_commit,
+                              get_rendition_names)
+from maxboom.settings import (CATALOGUE_BATCH_SIZE, CATALOGUE_IMAGE_PER_HOST,
+                              CATALOGUE_IMAGE_TIMEOUT, CATALOGUE_IMAGE_WORKERS,
+                              CATALOGUE_RENDITION_BATCH_SIZE,
+                              CATALOGUE_RENDITION_QUALITY,
+                              CATALOGUE_RENDITION_WORKERS)
+
+SKIPPED_EXTENSIONS = ('MP4',)
+CHUNK_SIZE = 1024 * 64
+# Миниатюры изображений товаров: наибольшая сторона, пикс.,
+# и форматы файлов миниатюр (расширение: формат Pillow).
+RENDITION_SIZES = {'list': 300, 'card': 800, 'zoom': 1600}
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+FetchResult = namedtuple(
+    'FetchResult', ('url', 'status', 'path', 'etag', 'content_hash')
+)
+NOT_MODIFIED = 'not_modified'
+FETCHED = 'fetched'
+FAILED = 'failed'
+
+
+def get_file_name(image_url):
+    return urlsplit(image_url).path.split('/')[-1]
+
+
+def is_skipped_url(image_url):
+    return get_file_name(image_url).split('.')[-1].upper() in (
+        SKIPPED_EXTENSIONS
+    )
+
+
+class ImageFetcher:
+    """
+    Загрузка изображений пулом потоков через общую сессию requests.
+    Одновременных запросов к одному хосту не больше per_host,
+    при известном ETag отправляется условный запрос If-None-Match.
+    Потоки только скачивают файлы, работа с базой данных выполняется
+    в вызывающем потоке. Ответ записывается во временный файл
+    по частям, удалять временные файлы должен вызывающий код.
+    """
+
+    def __init__(self, max_workers=CATALOGUE_IMAGE_WORKERS,
+                 per_host=CATALOGUE_IMAGE_PER_HOST,
+                 timeout=CATALOGUE_IMAGE_TIMEOUT, session=None):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=max_workers, pool_maxsize=max_workers
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(self.per_host)
+        )
+        self.host_limits_lock = threading.Lock()
+
+    def get_host_limit(self, url):
+        with self.host_limits_lock:
+            return self.host_limits[urlsplit(url).netloc]
+
+    def fetch(self, url, etag=''):
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            with self.get_host_limit(url):
+                with self.session.get(
+                    url, headers=headers, stream=True, timeout=self.timeout
+                ) as response:
+                    if response.status_code == requests.codes.not_modified:
+                        return FetchResult(url, NOT_MODIFIED, None, etag, '')
+                    response.raise_for_status()
+                    path, content_hash = self.download(response)
+                    return FetchResult(
+                        url, FETCHED, path,
+                        response.headers.get('ETag', ''), content_hash
+                    )
+        except requests.RequestException as error:
+            logging.info(f'Не загружено изображение "{url}": {error}')
+            return FetchResult(url, FAILED, None, '', '')
+
+    def download(self, response):
+        """Путь к временному файлу с телом ответа и хэш содержимого."""
+        content_hash = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(
+            prefix='maxboom-image-', delete=False
+        ) as temp_file:
+            try:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    temp_file.write(chunk)
+                    content_hash.update(chunk)
+            except BaseException:
+                os.unlink(temp_file.name)
+                raise
+        return temp_file.name, content_hash.hexdigest()
+
+    def fetch_all(self, urls_etags):
+        """Результаты загрузки в порядке переданных пар (url, etag)."""
+        urls_etags = list(urls_etags)
+        if len(urls_etags) < 2:
+            return [self.fetch(url, etag) for url, etag in urls_etags]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(
+                lambda item: self.fetch(*item), urls_etags
+            ))
+
+
+def atomic_save(storage, name, content):
+    """
+    Запись файла в хранилище, content - байты или открытый файл.
+    Для файлового хранилища файл пишется во временный файл рядом
+    и переименовывается, поэтому частично записанный файл никогда
+    не виден под итоговым именем.
+    """
+    name = storage.get_available_name(name, max_length=1000)
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        if isinstance(content, bytes):
+            return storage.save(name, ContentFile(content))
+        return storage.save(name, File(content))
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix='.tmp-', delete=False
+    ) as temp_file:
+        try:
+            if isinstance(content, bytes):
+                temp_file.write(content)
+            else:
+                shutil.copyfileobj(content, temp_file, CHUNK_SIZE)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        except BaseException:
+            os.unlink(temp_file.name)
+            raise
+    if storage.file_permissions_mode is not None:
+        os.chmod(temp_file.name, storage.file_permissions_mode)
+    os.replace(temp_file.name, path)
+    return name
+
+
+def render_renditions(content, sizes=RENDITION_SIZES,
+                      formats=RENDITION_FORMATS,
+                      quality=CATALOGUE_RENDITION_QUALITY):
+    """
+    Миниатюры изображения по содержимому файла: для каждого размера
+    ширина, высота и содержимое файлов по форматам. Изображения меньше
+    размера миниатюры не увеличиваются. Выполняется в процессах пула,
+    поэтому не обращается к базе данных и хранилищу. Возвращает None,
+    если изображение не удалось прочитать.
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as source:
+            largest = max(sizes.values())
+            # JPEG декодируется сразу в уменьшенном масштабе.
+            source.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(source)
+            has_alpha = (
+                image.mode in ('RGBA', 'LA', 'PA')
+                or 'transparency' in image.info
+            )
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        renditions = {}
+        # Каждая миниатюра уменьшается из предыдущей, большей.
+        for size, side in sorted(
+            sizes.items(), key=lambda item: item[1], reverse=True
+        ):
+            image.thumbnail((side, side), Image.LANCZOS)
+            files = {}
+            for ext, image_format in formats.items():
+                output = image
+                if image_format == 'JPEG' and image.mode == 'RGBA':
+                    output = Image.new('RGB', image.size, (255, 255, 255))
+                    output.paste(image, mask=image.getchannel('A'))
+                buffer = io.BytesIO()
+                output.save(buffer, image_format, quality=quality)
+                files[ext] = buffer.getvalue()
+            renditions[size] = {
+                'width': image.width, 'height': image.height, 'files': files
+            }
+        return renditions
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+class RenditionRenderer:
+    """
+    Построение миниатюр в пуле из workers процессов: сжатие
+    изображений нагружает процессор, и потоки из-за GIL не ускоряют
+    его. Пул не создается для одного изображения или workers < 2.
+    """
+
+    def __init__(self, workers=CATALOGUE_RENDITION_WORKERS,
+                 quality=CATALOGUE_RENDITION_QUALITY):
+        self.workers = workers
+        self.render = partial(render_renditions, quality=quality)
+
+    def render_all(self, contents):
+        """Миниатюры в порядке переданного содержимого файлов."""
+        contents = list(contents)
+        if self.workers < 2 or len(contents) < 2:
+            return [self.render(content) for content in contents]
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(contents))
+        ) as executor:
+            return list(executor.map(self.render, contents))
+
+
+def get_rendition_name(name, size, ext):
+    return f'{os.path.splitext(name)[0]}_{size}.{ext}'
+
+
+def read_image_file(storage, name):
+    try:
+        with storage.open(name, 'rb') as image_file:
+            return image_file.read()
+    except (OSError, ValueError):
+        return None
+
+
+def build_renditions(images, renderer=None,
+                     batch_size=CATALOGUE_RENDITION_BATCH_SIZE):
+    """
+    Построение и запись файлов миниатюр изображений товаров,
+    имена файлов записываются в renditions изображений без сохранения
+    в базу данных. Изображения обрабатываются пакетами по batch_size,
+    чтобы не держать в памяти содержимое всех файлов.
+    Возвращает количество построенных и неудачных миниатюр и имена
+    файлов прежних миниатюр.
+    """
+    if renderer is None:
+        renderer = RenditionRenderer()
+    storage = ProductImage._meta.get_field('image').storage
+    report = {'generated': 0, 'failed': 0}
+    old_names = []
+    images = list(images)
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        contents = [read_image_file(storage, image.image.name)
+                    for image in batch]
+        results = renderer.render_all(
+            content for content in contents if content is not None
+        )
+        results = iter(results)
+        for image, content in zip(batch, contents):
+            rendered = next(results) if content is not None else None
+            if rendered is None:
+                logging.info(
+                    f'Не построены миниатюры изображения "{image.image}"'
+                )
+                report['failed'] += 1
+                continue
+            old_names += get_rendition_names(image.renditions)
+            image.renditions = {
+                size: {
+                    'width': rendition['width'],
+                    'height': rendition['height'],
+                    'files': {
+                        ext: atomic_save(
+                            storage,
+                            get_rendition_name(image.image.name, size, ext),
+                            file_content
+                        )
+                        for ext, file_content in rendition['files'].items()
+                    },
+                }
+                for size, rendition in rendered.items()
+            }
+            report['generated'] += 1
+    report['old_names'] = old_names
+    return report
+
+
+def generate_renditions(images, renderer=None,
+                        batch_size=CATALOGUE_RENDITION_BATCH_SIZE):
+    """
+    Построение миниатюр сохраненных изображений товаров: имена файлов
+    записываются в базу данных, прежние миниатюры удаляются после
+    фиксации транзакции, закэшированные ответы каталога сбрасываются.
+    Возвращает количество построенных
+    и неудачных миниатюр.
+    """
+    images = list(images)
+    report = build_renditions(images, renderer, batch_size)
+    with transaction.atomic():
+        ProductImage.objects.bulk_update(
+            [image for image in images if image.has_changed('renditions')],
+            ('renditions',), batch_size=batch_size
+        )
+        delete_files_on_commit(report.pop('old_names'))
+        if report['generated']:
+            bump_catalogue_version()
+    logging.info(
+        f'Построены миниатюры изображений: {report["generated"]}, '
+        f'с ошибками: {report["failed"]}'
+    )
+    return report
+
+
+def get_existing_images(product_ids):
+    """
+    Изображения товаров одним запросом: по ссылке источника,
+    множества хэшей содержимого и имен файлов.
+    """
+    by_url = {}
+    by_hash = set()
+    by_file_name = set()
+    for image in ProductImage.objects.filter(product__in=product_ids):
+        if image.source_url:
+            by_url[(image.product_id, image.source_url)] = image
+        if image.content_hash:
+            by_hash.add((image.product_id, image.content_hash))
+        by_file_name.add(
+            (image.product_id, os.path.basename(image.image.name))
+        )
+    return by_url, by_hash, by_file_name
+
+
+def get_fetch_jobs(product_urls, report):
+    """
+    Тройки (товар, ссылка, изображение или None) для загрузки
+    и множество хэшей содержимого изображений товаров.
+    Изображения, загруженные ранее без сохранения ссылки,
+    сопоставляются по имени файла и пропускаются.
+    """
+    by_url, by_hash, by_file_name = get_existing_images(
+        [product.pk for product, _ in product_urls]
+    )
+    jobs = []
+    for product, urls in product_urls:
+        for url in dict.fromkeys(urls):
+            if is_skipped_url(url):
+                continue
+            image = by_url.get((product.pk, url))
+            if image is None and (
+                (product.pk, get_file_name(url)) in by_file_name
+            ):
+                report['skipped'] += 1
+                continue
+            jobs.append((product, url, image))
+    return jobs, by_hash
+
+
+def save_image_file(image, url, result):
+    field = ProductImage._meta.get_field('image')
+    with open(result.path, 'rb') as content:
+        image.image = atomic_save(
+            field.storage,
+            field.generate_filename(image, get_file_name(url)),
+            content
+        )
+    image.etag = result.etag
+    image.content_hash = result.content_hash
+
+
+def remove_temp_files(results):
+    for result in results:
+        if result.path:
+            try:
+                os.unlink(result.path)
+            except FileNotFoundError:
+                pass
+
+
+def delete_saved_files(images):
+    """
+    Удаление записанных файлов изображений и их миниатюр,
+    если изображения не удалось сохранить в базу данных.
+    """
+    storage = ProductImage._meta.get_field('image').storage
+    for image in images:
+        for name in [image.image.name, *get_rendition_names(image.renditions)]:
+            storage.delete(name)
+
+
+def sync_image_batch(jobs, by_hash, fetcher, renderer, report,
+                     batch_size):
+    """
+    Загрузка и сохранение пакета изображений. Файлы пишутся
+    в хранилище до транзакции и удаляются, если сохранить изображения
+    в базу данных не удалось. Возвращает созданные изображения
+    и количество изображений без миниатюр.
+    """
+    results = fetcher.fetch_all(
+        (url, image.etag if image else '') for _, url, image in jobs
+    )
+    new_images = []
+    changed_images = []
+    etag_images = []
+    saved_images = []
+    old_names = []
+    try:
+        for (product, url, image), result in zip(jobs, results):
+            if result.status != FETCHED:
+                report['skipped'] += 1
+                continue
+            if (
+                image is not None
+                and image.content_hash == result.content_hash
+            ):
+                # Содержимое не изменилось, сохраняется только новый ETag,
+                # чтобы следующий запрос получил ответ 304.
+                if image.etag != result.etag:
+                    image.etag = result.etag
+                    etag_images.append(image)
+                report['skipped'] += 1
+                continue
+            if (product.pk, result.content_hash) in by_hash:
+                report['skipped'] += 1
+                continue
+            by_hash.add((product.pk, result.content_hash))
+            if image is None:
+                image = ProductImage(product=product, source_url=url)
+                new_images.append(image)
+                report['created'] += 1
+            else:
+                old_names.append(image.image.name)
+                old_names += get_rendition_names(image.renditions)
+                image.renditions = {}
+                changed_images.append(image)
+                report['updated'] += 1
+            save_image_file(image, url, result)
+            saved_images.append(image)
+        renditions = build_renditions(saved_images, renderer)
+        old_names += renditions['old_names']
+        with transaction.atomic():
+            ProductImage.objects.bulk_create(
+                new_images, batch_size=batch_size
+            )
+            ProductImage.objects.bulk_update(
+                changed_images,
+                ('image', 'etag', 'content_hash', 'renditions'),
+                batch_size=batch_size
+            )
+            ProductImage.objects.bulk_update(
+                etag_images, ('etag',), batch_size=batch_size
+            )
+            delete_files_on_commit(old_names)
+    except BaseException:
+        delete_saved_files(saved_images)
+        raise
+    finally:
+        remove_temp_files(results)
+    return new_images, renditions['failed']
+
+
+def sync_product_images(product_urls, fetcher=None,
+                        batch_size=CATALOGUE_BATCH_SIZE, renderer=None):
+    """
+    Добавление и обновление изображений товаров по ссылкам WB.
+    product_urls - пары (товар, список ссылок). Изображения без
+    изменений (ответ 304 или то же содержимое) пропускаются.
+    Для новых и обновленных изображений строятся миниатюры.
+    Изображения загружаются пакетами по batch_size, поэтому
+    во временных файлах одновременно не больше одного пакета.
+    Возвращает словарь с количеством созданных, обновленных
+    и пропущенных изображений.
+    """
+    if fetcher is None:
+        fetcher = get_image_fetcher()
+    report = {'created': 0, 'updated': 0, 'skipped': 0}
+    jobs, by_hash = get_fetch_jobs(list(product_urls), report)
+    failed = 0
+    for start in range(0, len(jobs), batch_size):
+        new_images, batch_failed = sync_image_batch(
+            jobs[start:start + batch_size], by_hash, fetcher, renderer,
+            report, batch_size
+        )
+        failed += batch_failed
+        for image in new_images:
+            logging.info(
+                f'Создано изображение "{image.image.name}" '
+                f'к товару "{image.product.name}"'
+            )
+    logging.info(
+        f'Создано изображений: {report["created"]}, '
+        f'обновлено: {report["updated"]}, '
+        f'пропущено: {report["skipped"]}, '
+        f'без миниатюр: {failed}'
+    )
+    return report
+
+
+_image_fetcher = None
+
+
+def get_image_fetcher():
+    """Общий загрузчик изображений процесса с пулом соединений."""
+    global _image_fetcher
+    if _image_fetcher is None:
+        _image_fetcher = ImageFetcher()
+    return _image_fetcher
@@ -0,0 +1,110 @@
+import logging
+import os
+import socket
+import threading
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from catalogue.models import CatalogueUpdateJob
+from catalogue.services.metrics import SyncMetrics
+from catalogue.services.update_catalogue import update_catalogue
+from maxboom.settings import CATALOGUE_JOB_HEARTBEAT, MEDIA_ROOT
+
+
+def get_worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def get_job_log_path(job):
+    path = os.path.join(MEDIA_ROOT, 'update', 'jobs')
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f'{job.pk}.log')
+
+
+class Heartbeat(threading.Thread):
+    """
+    Отметка о работе задачи раз в interval сек. из отдельного потока,
+    пока задача выполняется. Если процесс обработчика упал, отметка
+    перестает обновляться и задача снимается как прерванная.
+    """
+
+    def __init__(self, job, interval=CATALOGUE_JOB_HEARTBEAT):
+        super().__init__(daemon=True)
+        self.job_pk = job.pk
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                CatalogueUpdateJob.objects.filter(pk=self.job_pk).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_update_job(job, update=update_catalogue,
+                   heartbeat_interval=CATALOGUE_JOB_HEARTBEAT):
+    """
+    Выполнение захваченной задачи. Журнал загрузки пишется в файл
+    задачи, ход загрузки и время этапов сохраняются в задаче при
+    каждом отчете о ходе загрузки.
+    """
+    metrics = SyncMetrics()
+
+    def progress(phase, processed=None):
+        job.report_progress(phase, processed)
+        metrics.save(job)
+
+    job.log_file = get_job_log_path(job)
+    job.save(update_fields=('log_file',))
+    handler = logging.FileHandler(job.log_file, encoding='utf-8')
+    root = logging.getLogger()
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    heartbeat = None
+    if heartbeat_interval:
+        heartbeat = Heartbeat(job, heartbeat_interval)
+        heartbeat.start()
+    try:
+        success = update(full=job.full, progress=progress, metrics=metrics)
+    except Exception as error:
+        logging.exception(f'Ошибка обновления каталога: {error}')
+        job.finish(CatalogueUpdateJob.FAILED, str(error))
+    else:
+        if success:
+            job.finish(CatalogueUpdateJob.DONE)
+        else:
+            job.finish(
+                CatalogueUpdateJob.FAILED,
+                'Обновление каталога прервано, подробности в журнале'
+            )
+    finally:
+        metrics.save(job)
+        if heartbeat is not None:
+            heartbeat.stop()
+        root.removeHandler(handler)
+        root.setLevel(level)
+        handler.close()
+    return job
+
+
+def process_next_job(worker=None, **kwargs):
+    """
+    Снятие зависших задач, захват и выполнение следующей задачи.
+    Возвращает выполненную задачу или None, если очередь пуста.
+    """
+    close_old_connections()
+    CatalogueUpdateJob.objects.fail_stale()
+    job = CatalogueUpdateJob.objects.claim(worker or get_worker_name())
+    if job is None:
+        return None
+    logging.info(f'Запущена задача обновления каталога {job.pk}')
+    return run_update_job(job, **kwargs)
@@ -25,7 +25,7 @@ else:
     from dotenv import load_dotenv
     from requests.auth import AuthBase
 
-    from catalogue.models import Category
+    from catalogue.models import Category, CategoryClosure
 
     load_dotenv()
 
@@ -124,6 +124,7 @@ def update_category_db(data):
                 category.save()
             else:
                 logging.info('Данные не прошли валидацию')
+    CategoryClosure.objects.rebuild()
     return None
 
 
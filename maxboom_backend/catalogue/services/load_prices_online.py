@@ -22,10 +22,13 @@ if result:
     import time
     from http import HTTPStatus
 
+    from django.core.exceptions import ValidationError
+
+    from catalogue.cache import bump_catalogue_version
     from catalogue.models import Product
     from catalogue.services.load_category_online import (APItokenAuth,
-                                                         SaveHeadersSession,
-                                                         is_valid)
+                                                         SaveHeadersSession)
+    from maxboom.settings import CATALOGUE_BATCH_SIZE
 
 
 def get_data_wb(path):
@@ -75,33 +78,72 @@ def load_prices(path):
     #                     encoding='utf-8')
     # print(f'logfile: {log_file}')
     data = get_data_wb(path)
-    update_db(data)
+    return update_db(data)
+
 
+def get_discounted_price(item):
+    price = item.get('price')
+    discount = item.get('discount')
+    return round(Decimal(price * (1 - discount / 100)), 2)
 
-def update_db(data):
+
+def get_prices(data):
+    """Цены со скидкой по коду товара, некорректные цены пропускаются."""
+    price_field = Product._meta.get_field('price')
+    prices = {}
     for item in data:
         code = item.get('nmId')
-        price = item.get('price')
-        discount = item.get('discount')
-        price = round(Decimal(price * (1 - discount / 100)), 2)
+        try:
+            price = get_discounted_price(item)
+            price_field.run_validators(price)
+        except (TypeError, ValidationError):
+            logging.info(f'Некорректная цена товара с кодом: {code}')
+            continue
+        prices[code] = price
+    return prices
 
-        if not Product.objects.filter(code=code).exists():
-            logging.info(f'Нет товара с кодом: {code}')
-        else:
-            product = Product.objects.get(code=code)
 
-            logging.info(
-                f'Получен существующий товар: {product.name} {product.code}')
+def update_db(data, batch_size=CATALOGUE_BATCH_SIZE):
+    """
+    Пакетное обновление цен: товары загружаются по кодам пакетами
+    по batch_size, изменившиеся цены записываются через bulk_update
+    только поля price, без сохранения товаров по одному.
+    Возвращает количество обновленных, неизмененных и ненайденных
+    товаров.
+    """
+    prices = get_prices(data)
+    codes = list(prices)
+    changed_products = []
+    found = 0
+    for i in range(0, len(codes), batch_size):
+        for product in Product.objects.filter(
+            code__in=codes[i:i + batch_size]
+        ).only('id', 'code', 'name', 'price'):
+            found += 1
+            price = prices[product.code]
             if price != product.price:
                 logging.info(
                     f'Заменена цена {product.price} на {price} '
                     f'для товара: {product.name} {product.code}'
                 )
-            product.price = price
-            if is_valid(product):
-                product.save()
-                logging.info(
-                    f'Обновлена цена товара: {product.name} {product.price}')
+                product.price = price
+                changed_products.append(product)
+    Product.objects.bulk_update(
+        changed_products, ('price',), batch_size=batch_size
+    )
+    if changed_products:
+        bump_catalogue_version()
+    report = {
+        'updated': len(changed_products),
+        'skipped': found - len(changed_products),
+        'missing': len(codes) - found,
+    }
+    logging.info(
+        f'Обновлено цен: {report["updated"]}, '
+        f'без изменений: {report["skipped"]}, '
+        f'нет товара с кодом: {report["missing"]}'
+    )
+    return report
 
 
 if __name__ == '__main__':
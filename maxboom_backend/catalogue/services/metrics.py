@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+
+from catalogue.models import CatalogueSyncPhase
+
+
+class SyncMetrics:
+    """
+    Время и количество обработанных элементов по этапам загрузки
+    каталога. Значения этапа суммируются по всем страницам карточек
+    и сохраняются в CatalogueSyncPhase задачи.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def get_phase(self, name):
+        return self.phases.setdefault(
+            name, {'seconds': 0.0, 'items': 0, 'calls': 0}
+        )
+
+    @contextmanager
+    def measure(self, name, items=0):
+        phase = self.get_phase(name)
+        start = time.monotonic()
+        try:
+            yield phase
+        finally:
+            phase['seconds'] += time.monotonic() - start
+            phase['items'] += items
+            phase['calls'] += 1
+
+    def add_items(self, name, items):
+        self.get_phase(name)['items'] += items
+
+    def save(self, job):
+        for name, values in self.phases.items():
+            CatalogueSyncPhase.objects.update_or_create(
+                job=job, name=name, defaults=values
+            )
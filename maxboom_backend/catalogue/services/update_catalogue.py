@@ -4,33 +4,49 @@ import logging
 import os
 import tempfile
 import time
+from decimal import Decimal
 from http import HTTPStatus
 
 import requests
-from django.core import files
 from django.core.exceptions import ValidationError
-from requests.auth import AuthBase
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from catalogue.models import Brand, Category, Product, ProductImage
+from catalogue.cache import bump_catalogue_version, catalogue_version_batch
+from catalogue.models import (Brand, CatalogueSyncPhase, Category,
+                              CategoryClosure, Product, allocate_slugs)
+from catalogue.services.images import sync_product_images
 from catalogue.services.load_category_online import load_categories
 from catalogue.services.load_prices_online import load_prices
-from maxboom.settings import MEDIA_ROOT, WB_API
+from catalogue.services.metrics import SyncMetrics
+from catalogue.services.wb_api import (APItokenAuth, FullCardsFetcher,
+                                       RateLimiter, SaveHeadersSession,
+                                       WBAPIError, get_backoff)
+from maxboom.settings import (CATALOGUE_BATCH_SIZE, CATALOGUE_FULL_SYNC_DAYS,
+                              MEDIA_ROOT, WB_API, WB_API_RETRIES,
+                              WB_API_TIMEOUT)
 
-
-class SaveHeadersSession(requests.Session):
-    def rebuild_auth(self, prepared_request, response):
-        pass
-
-
-class APItokenAuth(AuthBase):
-    """Attaches HTTP APItoken Authentication to the given Request object."""
-
-    def __init__(self, username):
-        self.username = username
-
-    def __call__(self, r):
-        r.headers['Authorization'] = self.username
-        return r
+# Количество карточек на странице списка номенклатур WB
+CARDS_PAGE_LIMIT = 1000
+# Курсор незавершенной загрузки карточек WB
+CARDS_CHECKPOINT_PATH = os.path.join(MEDIA_ROOT, 'update', 'cards_cursor.json')
+# Отметка времени последней загрузки карточек WB
+CARDS_WATERMARK_PATH = os.path.join(
+    MEDIA_ROOT, 'update', 'cards_watermark.json'
+)
+# Поля товара, которые перезаписываются при пакетном обновлении
+PRODUCT_UPDATE_FIELDS = (
+    'name', 'slug', 'category', 'brand', 'description', 'wb_urls',
+    'imt_id', 'vendor_code', 'is_deleted',
+)
+# Характеристики карточки WB, которые переносятся в товар
+CARD_CHARACTERISTICS = {
+    'Бренд': 'brand_name',
+    'Наименование': 'name',
+    'Описание': 'description',
+}
 
 
 def is_valid(obj):
@@ -43,132 +59,288 @@ def is_valid(obj):
     return answer
 
 
-def card_data(s, url, headers, auth, nm_id=None, updated_at=None):
+def is_valid_in_memory(obj, exclude=None):
+    """
+    Проверка объекта без запросов к базе данных: уникальность
+    и связанные объекты проверяются по предзагруженным данным.
+    """
+    try:
+        obj.full_clean(exclude=exclude, validate_unique=False)
+    except ValidationError:
+        logging.error(f'{type(obj)}, {obj.name}', exc_info=True)
+        return False
+    return True
+
+
+class JSONStateFile:
+    """Состояние загрузки каталога в JSON-файле, запись атомарная."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logging.info(f'Поврежден файл состояния {self.path}')
+            return None
+
+    def save(self, state):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', dir=directory, delete=False, encoding='utf-8'
+        ) as f:
+            json.dump(state, f)
+        os.replace(f.name, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CardCursorCheckpoint(JSONStateFile):
+    """
+    Курсор постраничного получения карточек WB, сохраненный на диск
+    после записи страницы в базу данных. Если загрузка прервалась,
+    следующий запуск продолжается с сохраненного курсора.
+    """
+
+    def __init__(self, path=CARDS_CHECKPOINT_PATH):
+        super().__init__(path)
+
+
+class CardsWatermark(JSONStateFile):
+    """
+    Время изменения (updatedAt) самой новой карточки, полученной
+    последней успешной загрузкой, и время последней полной загрузки.
+    При наличии отметки загружаются только карточки, измененные
+    после нее. Полная загрузка выполняется, если отметки нет
+    или с полной загрузки прошло CATALOGUE_FULL_SYNC_DAYS дней.
+    """
+
+    def __init__(self, path=CARDS_WATERMARK_PATH):
+        super().__init__(path)
+        self.latest = None
+        self.incomplete = False
+
+    def get_updated_after(self):
+        state = self.load() or {}
+        full_sync_at = parse_datetime(state.get('full_sync_at') or '')
+        if not state.get('updatedAt') or full_sync_at is None:
+            return None
+        if timezone.now() - full_sync_at > datetime.timedelta(
+            days=CATALOGUE_FULL_SYNC_DAYS
+        ):
+            return None
+        return state['updatedAt']
+
+    def observe(self, cards):
+        for card in cards:
+            updated_at = get_card_updated_at(card)
+            if updated_at is not None and (
+                self.latest is None or updated_at > self.latest
+            ):
+                self.latest = updated_at
+
+    def commit(self, full):
+        """
+        Сохранение отметки после успешной загрузки. Если часть карточек
+        не получена (incomplete), отметка не сдвигается, и следующая
+        загрузка получит эти карточки снова.
+        """
+        if self.incomplete:
+            logging.info('Отметка загрузки не обновлена: получены не все'
+                         ' карточки')
+            return
+        state = self.load() or {}
+        previous = parse_datetime(state.get('updatedAt') or '')
+        if self.latest is not None and (
+            previous is None or self.latest > previous
+        ):
+            state['updatedAt'] = self.latest.isoformat()
+        if full:
+            state['full_sync_at'] = timezone.now().isoformat()
+        self.save(state)
+
+
+def get_card_updated_at(card):
+    return parse_datetime(card.get('updatedAt') or card.get('updateAt') or '')
+
+
+def get_cards_page_data(response):
+    """
+    Данные страницы списка номенклатур или None, если тело ответа
+    не JSON или в нем нет данных: такой ответ считается неудачной
+    попыткой и повторяется.
+    """
+    try:
+        data = response.json().get('data')
+    except (ValueError, AttributeError) as e:
+        logging.info('Неверный ответ со списком номенклатур товара'
+                     f' Ошибка: {e}')
+        return None
+    if not isinstance(data, dict):
+        logging.info('Нет данных в ответе со списком номенклатур товара')
+        return None
+    logging.info('Получен список номенклатур товара')
+    return data
+
+
+def request_cards_page(s, url, headers, auth, cursor,
+                       limit=CARDS_PAGE_LIMIT, rate_limiter=None):
+    """
+    Страница списка номенклатур после курсора, WB_API_RETRIES попыток
+    с экспоненциальной задержкой между ними.
+    """
     query_data = {
-        "sort": {
-            "cursor": {
-                "updatedAt": updated_at,
-                "nmID": nm_id,
-                "limit": 1000
-            },
-            "filter": {
-                "withPhoto": -1
+        'sort': {
+            'cursor': {**cursor, 'limit': limit},
+            'filter': {
+                'withPhoto': -1
             }
         }
     }
-    if nm_id is None:
-        query_data.get('sort').get('cursor').pop('nmID')
-    if updated_at is None:
-        query_data.get('sort').get('cursor').pop('updatedAt')
-    i = 0
-    while i < 3:
-        i += 1
+    for attempt in range(WB_API_RETRIES):
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        retry_after = None
         try:
             response = s.post(
                 url=url, data=json.dumps(query_data), headers=headers,
-                auth=APItokenAuth(auth), allow_redirects=True
+                auth=APItokenAuth(auth), allow_redirects=True,
+                timeout=WB_API_TIMEOUT
             )
-        except Exception as e:
+        except requests.RequestException as e:
             logging.info('Не получен список номенклатур товара'
                          f' Ошибка: {e}')
         else:
             if response.status_code == HTTPStatus.OK:
-                logging.info('Получен список номенклатур товара')
-                data = response.json().get('data')
-                if data.get('cursor').get('total') >= 1000:
-                    nm_id = data.get('cursor').get('nmID')
-                    updated_at = data.get('cursor').get('updatedAt')
-                    temp = card_data(
-                        s, url, headers, auth, nm_id, updated_at
-                    )
-                    data['cards'] = data.get('cards') + temp.get('cards')
-                return data
-            elif response.status_code == HTTPStatus.UNAUTHORIZED:
-                logging.info('Не получен список номенклатур товара'
+                data = get_cards_page_data(response)
+                if data is not None:
+                    return data
+            else:
+                logging.info('Не получен список номенклатур товара.'
                              f'Код ответа: {response.status_code}'
                              f'Текст ответа: {response.text}')
-                exit()
-            logging.info('Не получен список номенклатур товара.'
-                         f'Код ответа: {response.status_code}'
-                         f'Текст ответа: {response.text}')
-            time.sleep(1)
-    logging.info('Превышено количество попыток получить номенклатуры товара')
-    exit()
+                if response.status_code == HTTPStatus.UNAUTHORIZED:
+                    raise WBAPIError('Неверный WB API token')
+                retry_after = response.headers.get('Retry-After')
+        if attempt + 1 < WB_API_RETRIES:
+            time.sleep(get_backoff(attempt, retry_after))
+    raise WBAPIError(
+        'Превышено количество попыток получить номенклатуры товара'
+    )
 
 
-def get_full_cards(s, headers, auth, vendor_code_part):
-    query_data = {
-        'vendorCodes': vendor_code_part,
-        "allowedCategoriesOnly": False
-    }
-    url = 'https://suppliers-api.wildberries.ru/content/v1/cards/filter'
-    i = 0
-    while i < 3:
-        i += 1
-        try:
-            response = s.post(
-                url=url, data=json.dumps(query_data), headers=headers,
-                auth=APItokenAuth(auth), allow_redirects=True
-            )
-        except Exception as e:
-            logging.info('Не получен список с характеристиками'
-                         f' Ошибка: {e}')
+def iter_card_pages(s, url, headers, auth, checkpoint=None,
+                    limit=CARDS_PAGE_LIMIT, updated_after=None,
+                    rate_limiter=None):
+    """
+    Страницы списка номенклатур по курсору updatedAt/nmID.
+    Курсор сохраняется после того, как потребитель обработал
+    страницу и запросил следующую, после последней страницы
+    сохраненный курсор удаляется.
+    WB отдает карточки от новых к старым, поэтому при заданном
+    updated_after (загрузка изменений) получение страниц
+    заканчивается на первой карточке не новее этой отметки.
+    """
+    state = {'cursor': {}, 'updated_after': updated_after}
+    saved = checkpoint.load() if checkpoint is not None else None
+    if saved and saved.get('updated_after') == updated_after:
+        state = saved
+        logging.info(
+            f'Загрузка карточек продолжена с курсора {state["cursor"]}'
+        )
+    threshold = parse_datetime(updated_after or '')
+    while True:
+        data = request_cards_page(
+            s, url, headers, auth, state['cursor'], limit, rate_limiter
+        )
+        cards = data.get('cards') or []
+        if threshold is not None:
+            fresh_cards = [
+                card for card in cards
+                if get_card_updated_at(card) is None
+                or get_card_updated_at(card) > threshold
+            ]
+            finished = len(fresh_cards) < len(cards)
+            cards = fresh_cards
         else:
-            if response.status_code == HTTPStatus.OK:
-                logging.info('Получен список с характеристиками')
-                return response.json().get('data')
-            elif response.status_code == HTTPStatus.UNAUTHORIZED:
-                logging.info('Не получен список с характеристиками'
-                             f' {response.status_code}')
-                exit()
-            else:
-                logging.info('Не получен список с характеристиками'
-                             f' {response.status_code}')
-                time.sleep(1)
-    logging.info('Превышено количество попыток получить характеристики товара')
-    exit()
+            finished = False
+        yield cards
+        page_cursor = data.get('cursor') or {}
+        if finished or page_cursor.get('total', 0) < limit:
+            break
+        state['cursor'] = {
+            'updatedAt': page_cursor.get('updatedAt'),
+            'nmID': page_cursor.get('nmID'),
+        }
+        if checkpoint is not None:
+            checkpoint.save(state)
+    if checkpoint is not None:
+        checkpoint.clear()
 
 
-def get_data_wb(path):
+def get_data_wb(path, checkpoint=None, watermark=None, updated_after=None,
+                metrics=None):
+    """
+    Карточки с характеристиками постранично: одна страница списка
+    номенклатур за раз, поэтому расход памяти не зависит от размера
+    каталога. При заданном updated_after - только карточки,
+    измененные после этой отметки.
+    """
+    if metrics is None:
+        metrics = SyncMetrics()
     auth = WB_API
-    logging.info(f'Получен WB API token {auth}')
-    if auth is False:
-        logging.info('Необходимо добавить в .env WB API token'
-                     '"AUTHORIZATION="')
-        exit()
+    if not auth:
+        raise WBAPIError('Необходимо добавить в .env WB API token'
+                         '"AUTHORIZATION="')
     headers = {
         'Content-Type': 'application/json'
     }
     url = ('https://suppliers-api.wildberries.ru/content/v1/cards/cursor/list')
     s = SaveHeadersSession()
-    data = card_data(s, url, headers, auth)
-    cards = data.get('cards')[:22]
-    # cards = data.get('cards')
-    f_name = os.path.join(path, 'cards_nm_online_wb.json')
-    with open(f_name, 'w', encoding='utf-8') as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
-    cards_with_description = []
-    # for i in range(0, len(cards), 5):
-    for i in range(0, len(cards), 100):
-        vendor_code_part = []
-        # finish = i + 5
-        finish = i + 100
-        if finish > len(cards):
-            finish = len(cards)
-        for j in range(i, finish):
-            vendor_code_part.append(cards[j].get('vendorCode'))
-        cards_with_description += get_full_cards(
-            s, headers, auth, vendor_code_part)
-        # time.sleep(1)
-    name = 'cards_full_online_wb.json'
-    save_cards(cards=cards_with_description, path=path, name=name)
-    return cards_with_description
+    rate_limiter = RateLimiter()
+    fetcher = FullCardsFetcher(auth, rate_limiter=rate_limiter)
+    pages = iter_card_pages(
+        s, url, headers, auth, checkpoint, updated_after=updated_after,
+        rate_limiter=rate_limiter
+    )
+    while True:
+        with metrics.measure(CatalogueSyncPhase.CARDS):
+            cards = next(pages, None)
+        if cards is None:
+            break
+        metrics.add_items(CatalogueSyncPhase.CARDS, len(cards))
+        if watermark is not None:
+            watermark.observe(cards)
+        save_cards(cards=cards, path=path, name='cards_nm_online_wb.jsonl')
+        with metrics.measure(CatalogueSyncPhase.FULL_CARDS):
+            cards_with_description, failed_codes = fetcher.fetch_all(
+                [card.get('vendorCode') for card in cards]
+            )
+        if failed_codes and watermark is not None:
+            watermark.incomplete = True
+        metrics.add_items(
+            CatalogueSyncPhase.FULL_CARDS, len(cards_with_description)
+        )
+        save_cards(
+            cards=cards_with_description, path=path,
+            name='cards_full_online_wb.jsonl'
+        )
+        yield cards_with_description
 
 
 def save_cards(cards, path, name):
+    """Дописывает карточки в файл, по одной карточке JSON на строку."""
     full_filename = os.path.join(path, name)
-    with open(full_filename, 'w', encoding='utf-8') as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
+    with open(full_filename, 'a', encoding='utf-8') as f:
+        for card in cards:
+            f.write(json.dumps(card, ensure_ascii=False) + '\n')
 
 
 def update_db(data):
@@ -283,64 +455,264 @@ def update_db(data):
                              ' Данные не прошли валидацию')
 
 
-def add_image(image_url, product):
-    if product.images.all().exists():
-        img_name = (
-            '/'.join(product.images.all()[0].image.name.split(
-                '/')[:-1]) + '/' + image_url.split('/')[-1]
+def parse_card(item):
+    """Извлекает из карточки WB данные для записи товара в базу."""
+    code = item.get('nmID')
+    sizes = item.get('sizes') or [{}]
+    price = sizes[0].get('price')
+    card = {
+        'category_name': item.get('object'),
+        'wb_category_id': item.get('objectID'),
+        'price': None if price is None else Decimal(str(price)),
+        'brand_name': None,
+        'name': None,
+        'description': None,
+        'code': code,
+        'vendor_code': item.get('vendorCode'),
+        'imt_id': item.get('imtID'),
+        'is_deleted': bool(item.get('isProhibited')),
+        'wb_urls': f'https://www.wildberries.ru/catalog/{code}/detail.aspx',
+        'media_files': item.get('mediaFiles') or [],
+    }
+    for characteristic in item.get('characteristics') or []:
+        for key, value in characteristic.items():
+            if key in CARD_CHARACTERISTICS:
+                card[CARD_CHARACTERISTICS[key]] = value
+    return card
+
+
+def get_categories(cards, batch_size):
+    """
+    Возвращает категории карточек по наименованию.
+    Существующие категории загружаются одним запросом по наименованию
+    и wb_category_id, недостающие создаются пакетом.
+    """
+    names = {card['category_name'] for card in cards}
+    wb_ids = {card['wb_category_id'] for card in cards}
+    categories = {}
+    categories_by_wb_id = {}
+    for category in Category.objects.filter(
+        Q(name__in=names) | Q(wb_category_id__in=wb_ids)
+    ):
+        categories[category.name] = category
+        categories_by_wb_id[category.wb_category_id] = category
+    new_categories = []
+    for card in cards:
+        name = card['category_name']
+        wb_id = card['wb_category_id']
+        if name in categories:
+            continue
+        if wb_id in categories_by_wb_id:
+            categories[name] = categories_by_wb_id[wb_id]
+            continue
+        category = Category(name=name, wb_category_id=wb_id)
+        if not is_valid_in_memory(category):
+            logging.info(f'Не создана категория: {name}'
+                         ' Данные не прошли валидацию')
+            categories[name] = None
+            continue
+        new_categories.append(category)
+        categories[name] = category
+        categories_by_wb_id[wb_id] = category
+    if new_categories:
+        allocate_slugs(new_categories)
+        Category.objects.bulk_create(new_categories, batch_size=batch_size)
+        created = Category.objects.in_bulk(
+            [category.name for category in new_categories],
+            field_name='name'
         )
-        if ProductImage.objects.filter(
-            product=product, image=img_name
-        ).exists():
-            logging.info(
-                f'Изображение "{img_name}" ранее'
-                f' добавлено к товару "{product.name}"')
-            return None
+        CategoryClosure.objects.add(created.values())
+        for name, category in categories.items():
+            if category is not None and category.pk is None:
+                categories[name] = created.get(category.name)
+        for category in new_categories:
+            logging.info(f'Создана категория: {category.name}')
+    return categories
 
-    # Stream the image from the url
-    response = requests.get(image_url, stream=True)
-
-    # Was the request OK?
-    if response.status_code != requests.codes.ok:
-        # Nope, error handling, skip file etc etc etc
-        return
-    # Get the filename from the url, used for saving later
-    file_name = image_url.split('/')[-1]
-    file_type = file_name.split('.')[-1]
-    if file_type.upper() == 'MP4':
-        return None
-    # Create a temporary file
-    lf = tempfile.NamedTemporaryFile()
-    # Read the streamed image in sections
-    for block in response.iter_content(1024 * 8):
-        # If no more file then stop
-        if not block:
-            break
-        # Write image block to temporary file
-        lf.write(block)
-    image = ProductImage()
-    image.product = product
-    image.image.save(file_name, files.File(lf))
-    image.save()
+
+def get_brands(cards, batch_size):
+    """
+    Возвращает производителей карточек по наименованию,
+    недостающие производители создаются пакетом.
+    """
+    names = {card['brand_name'] for card in cards if card['brand_name']}
+    brands = Brand.objects.in_bulk(names, field_name='name')
+    new_brands = []
+    for name in names - set(brands):
+        brand = Brand(name=name)
+        if not is_valid_in_memory(brand):
+            logging.info(f'Не создан производитель: {name}'
+                         ' Данные не прошли валидацию')
+            continue
+        new_brands.append(brand)
+    if new_brands:
+        allocate_slugs(new_brands)
+        Brand.objects.bulk_create(new_brands, batch_size=batch_size)
+        brands.update(Brand.objects.in_bulk(
+            [brand.name for brand in new_brands], field_name='name'
+        ))
+        for brand in new_brands:
+            logging.info(f'Создан производитель: {brand.name}')
+    return brands
+
+
+def fill_product(product, card, category, brand):
+    """
+    Переносит данные карточки в товар.
+    Цена из карточки без скидки записывается только новому товару,
+    цену со скидкой существующих товаров обновляет load_prices.
+    Возвращает True, если значения полей товара изменились.
+    """
+    values = {
+        'name': card['name'],
+        'brand_id': brand.pk if brand else None,
+        'description': card['description'],
+        'wb_urls': card['wb_urls'],
+        'imt_id': card['imt_id'],
+        'vendor_code': card['vendor_code'],
+        'is_deleted': card['is_deleted'],
+    }
+    if product.pk is None:
+        values['price'] = card['price']
+    if product.category_id is None:
+        values['category_id'] = category.pk if category else None
+    elif category is not None and product.category_id != category.pk:
+        logging.info(
+            'Не совпала категория '
+            f'{product.category_id} != {category.pk}'
+        )
+    changed = False
+    for field, value in values.items():
+        if getattr(product, field) != value:
+            setattr(product, field, value)
+            changed = True
+    return changed
+
+
+def is_duplicate_card(card, codes, vendor_codes):
+    """
+    Проверяет, что код товара не встречался в пакете и артикул
+    продавца не занят другим товаром.
+    """
+    code = card['code']
+    if code in codes:
+        return True
+    if vendor_codes.setdefault(card['vendor_code'], code) != code:
+        return True
+    codes.add(code)
+    return False
+
+
+@transaction.atomic
+def upsert_products(cards, report, batch_size=CATALOGUE_BATCH_SIZE):
+    """
+    Запись товаров по разобранным карточкам в одной транзакции.
+    Категории, производители и товары загружаются в словари одним
+    запросом на модель, изменения записываются через bulk_create
+    и bulk_update пакетами по batch_size объектов.
+    Возвращает коды записанных товаров.
+    """
+    processed_codes = set()
+    categories = get_categories(cards, batch_size)
+    brands = get_brands(cards, batch_size)
+    products = Product.objects.in_bulk(
+        [card['code'] for card in cards], field_name='code'
+    )
+    vendor_codes = dict(Product.objects.filter(
+        vendor_code__in=[card['vendor_code'] for card in cards]
+    ).values_list('vendor_code', 'code'))
+    new_products = []
+    changed_products = []
+    for card in cards:
+        if is_duplicate_card(card, processed_codes, vendor_codes):
+            logging.info(f'Пропущен товар {card["code"]}: повторяется'
+                         f' код или артикул {card["vendor_code"]}')
+            report['skipped'] += 1
+            continue
+        product = products.get(card['code'], Product(code=card['code']))
+        changed = fill_product(
+            product, card,
+            category=categories.get(card['category_name']),
+            brand=brands.get(card['brand_name'])
+        )
+        if not is_valid_in_memory(product, exclude=('category', 'brand')):
+            logging.info(f'Не записан товар: {product.code}'
+                         ' Данные не прошли валидацию')
+            processed_codes.discard(product.code)
+            report['skipped'] += 1
+        elif product.pk is None:
+            new_products.append(product)
+        elif changed:
+            changed_products.append(product)
+        else:
+            report['skipped'] += 1
+    # bulk_update не вызывает Product.save, поэтому слаги
+    # переименованных товаров подбираются вместе со слагами новых.
+    allocate_slugs(new_products + [
+        product for product in changed_products
+        if product.has_changed('name')
+    ])
+    Product.objects.bulk_create(new_products, batch_size=batch_size)
+    Product.objects.bulk_update(
+        changed_products, PRODUCT_UPDATE_FIELDS, batch_size=batch_size
+    )
+    report['created'] = len(new_products)
+    report['updated'] = len(changed_products)
+    return processed_codes
+
+
+def bulk_update_db(data, batch_size=CATALOGUE_BATCH_SIZE, metrics=None):
+    """
+    Пакетное обновление каталога по карточкам WB: товары записываются
+    в одной транзакции, затем загружаются изображения.
+    Возвращает количество созданных, обновленных и пропущенных товаров.
+    """
+    if metrics is None:
+        metrics = SyncMetrics()
+    report = {'created': 0, 'updated': 0, 'skipped': 0}
+    cards = [parse_card(item) for item in data]
+    with metrics.measure(CatalogueSyncPhase.DB_UPSERT, len(cards)):
+        processed_codes = upsert_products(cards, report, batch_size)
+    bump_catalogue_version()
+    with metrics.measure(CatalogueSyncPhase.IMAGES) as phase:
+        products = Product.objects.in_bulk(
+            processed_codes, field_name='code'
+        )
+        images = sync_product_images(
+            (products[card['code']], card['media_files'])
+            for card in cards if card['code'] in products
+        )
+        phase['items'] += images['created'] + images['updated']
     logging.info(
-        f'Создано изображение "{image.image.name}" к товару "{product.name}"')
-    # time.sleep(0.25)
+        f'Создано товаров: {report["created"]}, '
+        f'обновлено: {report["updated"]}, '
+        f'пропущено: {report["skipped"]}'
+    )
+    return report
+
+
+def add_image(image_url, product):
+    sync_product_images([(product, [image_url])])
 
 
 def get_path():
     date = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
-    if not os.path.exists(os.path.join(MEDIA_ROOT)):
-        os.mkdir(os.path.join(MEDIA_ROOT))
-    if not os.path.exists(os.path.join(MEDIA_ROOT, 'update')):
-        os.mkdir(os.path.join(MEDIA_ROOT, 'update'))
-    if not os.path.exists(os.path.join(MEDIA_ROOT, 'update', date)):
-        os.mkdir(os.path.join(MEDIA_ROOT, 'update', date))
-    if os.path.exists(os.path.join(MEDIA_ROOT, 'update', date)):
-        return os.path.join(MEDIA_ROOT, 'update', date)
-    exit()
-
-
-def update_catalogue():
+    path = os.path.join(MEDIA_ROOT, 'update', date)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def update_catalogue(bulk=True, full=False, progress=None, metrics=None):
+    """
+    Загрузка каталога с WB. progress - необязательная функция
+    progress(этап, обработано карточек) для отчета о ходе загрузки,
+    в metrics (SyncMetrics) собирается время этапов загрузки.
+    """
+    if progress is None:
+        def progress(phase, processed=None):
+            pass
+    if metrics is None:
+        metrics = SyncMetrics()
     log_file = 'load_catalogue.log'
     path = get_path()
     full_name = os.path.join(path, log_file)
@@ -348,11 +720,42 @@ def update_catalogue():
                         filename=full_name, filemode="w",
                         encoding='utf-8')
     print(f'logfile: {full_name}')
-    data = get_data_wb(path=path)
-    update_db(data)
-    load_categories(path)
-    load_categories(path)
-    load_prices(path)
+    watermark = CardsWatermark()
+    updated_after = None if full else watermark.get_updated_after()
+    if updated_after is None:
+        logging.info('Полная загрузка каталога')
+    else:
+        logging.info(f'Загрузка карточек, измененных после {updated_after}')
+    processed = 0
+    progress('cards', processed)
+    try:
+        for data in get_data_wb(
+            path, CardCursorCheckpoint(), watermark, updated_after, metrics
+        ):
+            if bulk:
+                bulk_update_db(data, metrics=metrics)
+            else:
+                with metrics.measure(
+                    CatalogueSyncPhase.DB_UPSERT, len(data)
+                ), catalogue_version_batch():
+                    update_db(data)
+            processed += len(data)
+            progress('cards', processed)
+    except WBAPIError as error:
+        logging.error(f'Обновление каталога прервано: {error}')
+        return False
+    watermark.commit(full=updated_after is None)
+    progress('categories')
+    with metrics.measure(
+        CatalogueSyncPhase.CATEGORIES
+    ), catalogue_version_batch():
+        load_categories(path)
+        load_categories(path)
+    progress('prices')
+    with metrics.measure(CatalogueSyncPhase.PRICES) as phase:
+        phase['items'] += load_prices(path)['updated']
+    progress('counters')
+    Category.objects.recount_products()
     return True
 
 
@@ -0,0 +1,197 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+
+from maxboom.settings import (WB_API_BACKOFF, WB_API_BACKOFF_MAX,
+                              WB_API_RATE_LIMIT, WB_API_RETRIES,
+                              WB_API_TIMEOUT, WB_FULL_CARDS_WORKERS)
+
+FULL_CARDS_URL = 'https://suppliers-api.wildberries.ru/content/v1/cards/filter'
+# Количество артикулов в одном запросе карточек с характеристиками
+FULL_CARDS_CHUNK_SIZE = 100
+# Ответы WB API, после которых запрос повторяется
+RETRY_STATUSES = (
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+)
+
+FullCardsResult = namedtuple('FullCardsResult', ('cards', 'failed_codes'))
+
+
+class WBAPIError(Exception):
+    """Ошибка получения данных из WB API."""
+
+
+class SaveHeadersSession(requests.Session):
+    def rebuild_auth(self, prepared_request, response):
+        pass
+
+
+class APItokenAuth(AuthBase):
+    """Attaches HTTP APItoken Authentication to the given Request object."""
+
+    def __init__(self, username):
+        self.username = username
+
+    def __call__(self, r):
+        r.headers['Authorization'] = self.username
+        return r
+
+
+def get_backoff(attempt, retry_after=None, base=WB_API_BACKOFF,
+                maximum=WB_API_BACKOFF_MAX):
+    """
+    Задержка перед повтором запроса номер attempt (с нуля):
+    экспоненциальная со случайным разбросом, чтобы потоки
+    не повторяли запросы одновременно. Заголовок Retry-After
+    ответа WB имеет приоритет.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), maximum)
+        except ValueError:
+            pass
+    delay = min(base * 2 ** attempt, maximum)
+    return random.uniform(delay / 2, delay)
+
+
+class RateLimiter:
+    """
+    Не больше per_minute запросов в минуту на все потоки:
+    запросы разносятся равномерно по времени.
+    """
+
+    def __init__(self, per_minute=WB_API_RATE_LIMIT):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + self.interval
+        time.sleep(start - now)
+
+
+class FullCardsFetcher:
+    """
+    Загрузка карточек с характеристиками по артикулам продавца
+    частями по chunk_size артикулов в пуле из workers потоков.
+    Неудачные части не прерывают загрузку: их артикулы возвращаются
+    в failed_codes. Неверный токен прерывает загрузку WBAPIError.
+    """
+
+    def __init__(self, auth, session=None, url=FULL_CARDS_URL,
+                 workers=WB_FULL_CARDS_WORKERS, rate_limiter=None,
+                 retries=WB_API_RETRIES, backoff=WB_API_BACKOFF,
+                 timeout=WB_API_TIMEOUT, chunk_size=FULL_CARDS_CHUNK_SIZE):
+        self.auth = auth
+        self.url = url
+        self.workers = workers
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        if session is None:
+            session = SaveHeadersSession()
+            adapter = HTTPAdapter(
+                pool_connections=workers, pool_maxsize=workers
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.unauthorized = threading.Event()
+
+    def post(self, vendor_codes):
+        return self.session.post(
+            url=self.url,
+            data=json.dumps({
+                'vendorCodes': vendor_codes,
+                'allowedCategoriesOnly': False
+            }),
+            headers={'Content-Type': 'application/json'},
+            auth=APItokenAuth(self.auth), allow_redirects=True,
+            timeout=self.timeout
+        )
+
+    def get_cards(self, response):
+        """
+        Карточки из ответа или None, если тело ответа не JSON:
+        такой ответ считается неудачной попыткой и повторяется.
+        """
+        try:
+            cards = response.json().get('data') or []
+        except (ValueError, AttributeError) as e:
+            logging.info('Неверный ответ со списком с характеристиками'
+                         f' Ошибка: {e}')
+            return None
+        logging.info('Получен список с характеристиками')
+        return cards
+
+    def fetch_chunk(self, vendor_codes):
+        """Карточки части артикулов или None, если попытки исчерпаны."""
+        for attempt in range(self.retries):
+            if self.unauthorized.is_set():
+                return None
+            self.rate_limiter.wait()
+            retry_after = None
+            try:
+                response = self.post(vendor_codes)
+            except requests.RequestException as e:
+                logging.info('Не получен список с характеристиками'
+                             f' Ошибка: {e}')
+            else:
+                if response.status_code == HTTPStatus.OK:
+                    cards = self.get_cards(response)
+                    if cards is not None:
+                        return cards
+                else:
+                    logging.info('Не получен список с характеристиками'
+                                 f' {response.status_code}')
+                    if response.status_code == HTTPStatus.UNAUTHORIZED:
+                        self.unauthorized.set()
+                        raise WBAPIError('Неверный WB API token')
+                    if response.status_code not in RETRY_STATUSES:
+                        return None
+                    retry_after = response.headers.get('Retry-After')
+            if attempt + 1 < self.retries:
+                time.sleep(get_backoff(attempt, retry_after, self.backoff))
+        return None
+
+    def fetch_all(self, vendor_codes):
+        """Карточки в порядке частей и артикулы неудачных частей."""
+        chunks = [
+            vendor_codes[i:i + self.chunk_size]
+            for i in range(0, len(vendor_codes), self.chunk_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.fetch_chunk, chunks))
+        cards = []
+        failed_codes = []
+        for chunk, chunk_cards in zip(chunks, results):
+            if chunk_cards is None:
+                failed_codes += chunk
+            else:
+                cards += chunk_cards
+        if failed_codes:
+            logging.error(
+                'Не получены характеристики товаров с артикулами: '
+                f'{", ".join(map(str, failed_codes))}'
+            )
+        return FullCardsResult(cards, failed_codes)
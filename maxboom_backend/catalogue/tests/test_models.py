@@ -1,13 +1,18 @@
 import os
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, transaction
 from django.test import TestCase, override_settings
 from pytils.translit import slugify
 
-from catalogue.models import Brand, Category, Product, ProductImage
+from catalogue.models import (SLUG_MAX_LENGTH, Brand, Category,
+                              CategoryClosure, Product, ProductImage,
+                              allocate_slugs)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -92,7 +97,8 @@ class BrandModelTest(TestCase):
                 image_exists), 'Не существует файла изображения до обновления'
         )
         brand_item.image = new_image
-        brand_item.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            brand_item.save()
         image_new = brand_item.image.path
         self.assertTrue(
             os.path.exists(image_new),
@@ -170,6 +176,25 @@ class CategoryModelTest(TestCase):
             category_new.slug, slugify(category_new.name)[:200]
         )
 
+    def test_allocate_long_slugs(self):
+        '''занятые обрезанные slug длинных наименований учитываются'''
+        name = 'к' * SLUG_MAX_LENGTH
+        categories = [
+            Category(name=f'{name} {number}', wb_category_id=12350 + number)
+            for number in range(4)
+        ]
+        categories.pop().save()
+        with self.assertNumQueries(1):
+            allocate_slugs(categories[:1])
+        categories[0].save()
+        allocate_slugs(categories[1:])
+        Category.objects.bulk_create(categories[1:])
+        slugs = list(Category.objects.filter(
+            name__startswith=name
+        ).values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), 4)
+        self.assertTrue(all(len(slug) == SLUG_MAX_LENGTH for slug in slugs))
+
     def test_create_model(self):
         '''корректное значение полей созданной модели'''
         self.assertTrue(Category.objects.filter(name='Категория1').exists())
@@ -219,6 +244,189 @@ class CategoryModelTest(TestCase):
         super().tearDownClass()
 
 
+class CategoryClosureTest(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(
+            name='Корень', wb_category_id=22001
+        )
+        self.branch = Category.objects.create(
+            name='Ветка', root=self.root, wb_category_id=22002
+        )
+        self.leaf = Category.objects.create(
+            name='Лист', root=self.branch, wb_category_id=22003
+        )
+        self.other_root = Category.objects.create(
+            name='Другой корень', wb_category_id=22004
+        )
+
+    def get_ancestors(self, category):
+        return dict(CategoryClosure.objects.filter(
+            descendant=category
+        ).values_list('ancestor__name', 'depth'))
+
+    def test_create_category(self):
+        '''связи новой категории со всеми предками'''
+        self.assertEqual(
+            self.get_ancestors(self.leaf),
+            {'Лист': 0, 'Ветка': 1, 'Корень': 2}
+        )
+
+    def test_move_category(self):
+        '''перенос поддерева при смене родительской категории'''
+        branch = Category.objects.get(pk=self.branch.pk)
+        branch.root = self.other_root
+        branch.save()
+        self.assertEqual(
+            self.get_ancestors(self.leaf),
+            {'Лист': 0, 'Ветка': 1, 'Другой корень': 2}
+        )
+        self.assertFalse(CategoryClosure.objects.filter(
+            ancestor=self.root, descendant=self.leaf).exists())
+
+    def test_move_category_into_own_subtree(self):
+        '''перенос категории в собственное поддерево'''
+        root = Category.objects.get(pk=self.root.pk)
+        root.root = self.leaf
+        root.save()
+        self.assertEqual(
+            self.get_ancestors(self.branch),
+            {'Ветка': 0, 'Корень': 1, 'Лист': 2}
+        )
+
+    def test_save_without_root_change(self):
+        '''сохранение без смены родителя не меняет таблицу замыкания'''
+        branch = Category.objects.get(pk=self.branch.pk)
+        branch.is_visible_on_main = True
+        links_before = list(CategoryClosure.objects.values_list('pk'))
+        branch.save()
+        self.assertEqual(
+            links_before, list(CategoryClosure.objects.values_list('pk'))
+        )
+
+    def test_delete_category(self):
+        '''дочерние категории удаленной категории становятся корневыми'''
+        self.branch.delete()
+        self.assertEqual(self.get_ancestors(self.leaf), {'Лист': 0})
+
+    def test_rebuild(self):
+        '''полная перестройка таблицы замыкания'''
+        CategoryClosure.objects.all().delete()
+        CategoryClosure.objects.rebuild()
+        self.assertEqual(
+            self.get_ancestors(self.leaf),
+            {'Лист': 0, 'Ветка': 1, 'Корень': 2}
+        )
+        self.assertEqual(CategoryClosure.objects.count(), 7)
+
+    def test_add_categories(self):
+        '''связи категорий, созданных пакетом, без перестройки'''
+        Category.objects.bulk_create([
+            Category(name='Пакет', root=self.leaf, wb_category_id=22005),
+            Category(name='Пакет корень', wb_category_id=22006),
+        ])
+        created = list(Category.objects.filter(name__startswith='Пакет'))
+        with self.assertNumQueries(2):
+            CategoryClosure.objects.add(created)
+        self.assertEqual(
+            self.get_ancestors(created[0]),
+            {'Пакет': 0, 'Лист': 1, 'Ветка': 2, 'Корень': 3}
+        )
+        self.assertEqual(
+            self.get_ancestors(created[1]),
+            {'Пакет корень': 0}
+        )
+
+
+class CategoryProductsCountTest(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(
+            name='Корень', wb_category_id=23001
+        )
+        self.branch = Category.objects.create(
+            name='Ветка', root=self.root, wb_category_id=23002
+        )
+        self.product = Product.objects.create(
+            name='Товар', description='Описание', price=100,
+            category=self.branch, code=2300001, vendor_code='артикул 23'
+        )
+        Product.objects.create(
+            name='Удаленный товар', description='Описание', price=100,
+            category=self.branch, code=2300002, vendor_code='артикул 24',
+            is_deleted=True
+        )
+
+    def assertCounts(self, category, products_count, subtree_count):
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.products_count, category.subtree_products_count),
+            (products_count, subtree_count),
+            f'Ошибка в счетчиках категории {category}'
+        )
+
+    def test_create_product(self):
+        '''учитываются только не удаленные товары'''
+        self.assertCounts(self.branch, 1, 1)
+        self.assertCounts(self.root, 0, 1)
+
+    def test_change_product_category(self):
+        '''перенос товара в другую категорию'''
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = self.root
+        product.save()
+        self.assertCounts(self.branch, 0, 0)
+        self.assertCounts(self.root, 1, 1)
+
+    def test_delete_product(self):
+        '''пометка товара удаленным и удаление товара'''
+        product = Product.objects.get(pk=self.product.pk)
+        product.is_deleted = True
+        product.save()
+        self.assertCounts(self.root, 0, 0)
+        product.is_deleted = False
+        product.save()
+        self.assertCounts(self.root, 0, 1)
+        product.delete()
+        self.assertCounts(self.branch, 0, 0)
+        self.assertCounts(self.root, 0, 0)
+
+    def test_prohibit_and_move_category(self):
+        '''запрет публикации и перенос подкатегории'''
+        branch = Category.objects.get(pk=self.branch.pk)
+        branch.is_prohibited = True
+        branch.save()
+        self.assertCounts(self.root, 0, 0)
+        branch.is_prohibited = False
+        branch.root = None
+        branch.save()
+        self.assertCounts(self.root, 0, 0)
+        self.assertCounts(self.branch, 1, 1)
+
+    def test_prohibited_intermediate_category(self):
+        '''товары под запрещенной промежуточной категорией не учитываются'''
+        leaf = Category.objects.create(
+            name='Лист', root=self.branch, wb_category_id=23003
+        )
+        Product.objects.create(
+            name='Товар листа', description='Описание', price=100,
+            category=leaf, code=2300003, vendor_code='артикул 25'
+        )
+        self.assertCounts(self.root, 0, 2)
+        branch = Category.objects.get(pk=self.branch.pk)
+        branch.is_prohibited = True
+        branch.save()
+        self.assertCounts(self.root, 0, 0)
+        self.assertCounts(leaf, 1, 1)
+        Category.objects.recount_products()
+        self.assertCounts(self.root, 0, 0)
+
+    def test_recount_command(self):
+        '''пересчет счетчиков после массовой записи товаров'''
+        Product.objects.filter(pk=self.product.pk).update(is_deleted=True)
+        call_command('recount_category_products', stdout=StringIO())
+        self.assertCounts(self.branch, 0, 0)
+        self.assertCounts(self.root, 0, 0)
+
+
 class ProductModelTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -284,6 +492,34 @@ class ProductModelTest(TestCase):
             f'{slugify(product.name)}-{slugify(product.code)}'
         )
 
+    def test_keep_slug_without_name_change(self):
+        '''slug не пересчитывается, если наименование не изменилось'''
+        product = Product.objects.get(pk=ProductModelTest.product.pk)
+        slug = product.slug
+        product.price = 200
+        with self.assertNumQueries(1):
+            product.save(update_fields=('price', 'slug', 'wb_urls'))
+        product.refresh_from_db()
+        self.assertEqual(product.slug, slug)
+        product.name = 'Новое устройство'
+        product.save()
+        self.assertEqual(product.slug, f'novoe-ustrojstvo-{product.code}')
+
+    def test_allocate_slugs(self):
+        '''уникальные slug для пакета товаров одним запросом'''
+        products = [
+            Product(name='Пусковое зарядное устройство 2', code=169110394),
+            Product(name='Пусковое зарядное устройство 2', code=169110394),
+            Product(name='Другое устройство', code=1),
+        ]
+        with self.assertNumQueries(1):
+            allocate_slugs(products)
+        slug = ProductModelTest.product.slug
+        self.assertEqual(
+            [product.slug for product in products],
+            [f'{slug}1', f'{slug}12', 'drugoe-ustrojstvo-1']
+        )
+
     def test_models_have_correct_object_name(self):
         '''корректное строчное представление объекта модели'''
         product = ProductModelTest.product
@@ -385,7 +621,8 @@ class ProductImageModelTest(TestCase):
                 image_exists), 'Не существует файла изображения до обновления'
         )
         prod_image_item.image = new_image
-        prod_image_item.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            prod_image_item.save()
         image_new = prod_image_item.image.path
         self.assertTrue(
             os.path.exists(image_new),
@@ -395,6 +632,60 @@ class ProductImageModelTest(TestCase):
             os.path.exists(image_exists), 'Старый файл изображения не удален'
         )
 
+    def test_save_without_image_lookup(self):
+        '''сохранение изображения без запросов прежнего файла'''
+        image = ProductImage.objects.get(pk=ProductImageModelTest.image.pk)
+        with self.assertNumQueries(1):
+            image.save()
+
+    def create_images(self, prefix, count):
+        return [
+            ProductImage.objects.create(
+                product=ProductImageModelTest.product,
+                image=SimpleUploadedFile(
+                    name=f'{prefix}{i}.gif',
+                    content=ProductImageModelTest.small_gif,
+                    content_type='image/gif'
+                )
+            )
+            for i in range(count)
+        ]
+
+    def replace_image(self, image, name):
+        image.image = SimpleUploadedFile(
+            name=name,
+            content=ProductImageModelTest.small_gif,
+            content_type='image/gif'
+        )
+        image.save()
+
+    def test_delete_on_commit(self):
+        '''старые файлы удаляются после фиксации транзакции'''
+        images = self.create_images('batch', 2)
+        old_paths = [image.image.path for image in images]
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for i, image in enumerate(images):
+                    self.replace_image(image, f'batch_new{i}.gif')
+                self.assertTrue(all(map(os.path.exists, old_paths)))
+        self.assertFalse(any(map(os.path.exists, old_paths)))
+
+    def test_keep_file_on_savepoint_rollback(self):
+        '''файл не удаляется, если замена откачена в точке сохранения'''
+        kept, replaced = self.create_images('savepoint', 2)
+        kept_path, replaced_path = kept.image.path, replaced.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.replace_image(replaced, 'savepoint_new.gif')
+                try:
+                    with transaction.atomic():
+                        self.replace_image(kept, 'savepoint_rollback.gif')
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+        self.assertTrue(os.path.exists(kept_path))
+        self.assertFalse(os.path.exists(replaced_path))
+
     def test_delete_image_file_(self):
         '''удаление файла изображения при удалении объекта модели'''
         product = Product.objects.create(
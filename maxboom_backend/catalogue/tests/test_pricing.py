@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+
+from cart.models import Cart
+from catalogue.models import Category, Product
+from catalogue.pricing import (RETAIL, WHOLESALE, annotate_prices,
+                               format_price, get_owner_tier,
+                               get_product_price, get_tier_price,
+                               get_user_tier, round_price)
+
+User = get_user_model()
+
+
+class PricingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.vendor = User.objects.create_user(
+            email='vendor@test.test', password='testpassword1'
+        )
+        cls.vendor.userprofile.is_vendor = True
+        cls.vendor.userprofile.save()
+        cls.category = Category.objects.create(
+            name='Категория цен',
+            wb_category_id=424001
+        )
+        cls.prices = (
+            Decimal('100'), Decimal('0.01'), Decimal('123.457'),
+            Decimal('99.995'),
+        )
+        for code, price in enumerate(cls.prices, start=1):
+            Product.objects.create(
+                name=f'Товар {code}',
+                description='Описание',
+                price=price,
+                category=cls.category,
+                code=code,
+                vendor_code=f'артикул {code}',
+            )
+
+    def test_round_price(self):
+        '''округление до копеек половины вверх'''
+        self.assertEqual(round_price(Decimal('0.005')), Decimal('0.01'))
+        self.assertEqual(round_price(Decimal('80')), Decimal('80.00'))
+        self.assertEqual(format_price(80), '80.00')
+
+    def test_annotated_prices_match_tier_prices(self):
+        '''цены из queryset совпадают с вычисленными'''
+        products = annotate_prices(Product.objects.all())
+        for product in products:
+            for tier in (RETAIL, WHOLESALE):
+                self.assertEqual(
+                    get_product_price(product, tier),
+                    get_tier_price(product.price, tier)
+                )
+        product = products.get(code=1)
+        self.assertEqual(product.retail_price, Decimal('80.00'))
+        self.assertEqual(product.wholesale_price, Decimal('50.00'))
+
+    def test_user_tier_resolved_once(self):
+        '''уровень пользователя запрашивается из профиля один раз'''
+        user = User.objects.get(pk=PricingTest.vendor.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_tier(user), WHOLESALE)
+            self.assertEqual(get_user_tier(user), WHOLESALE)
+        self.assertEqual(get_user_tier(AnonymousUser()), RETAIL)
+
+    def test_owner_tier(self):
+        '''оптовая цена только в корзине авторизованного продавца'''
+        cart = Cart.objects.create(user=PricingTest.vendor, is_active=True)
+        self.assertEqual(get_owner_tier(cart), WHOLESALE)
+        anonymous_cart = Cart.objects.create(session_id='session')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_owner_tier(anonymous_cart), RETAIL)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
@@ -0,0 +1,935 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from copy import deepcopy
+from datetime import timedelta
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from catalogue.models import (Brand, CatalogueSyncPhase, CatalogueUpdateJob,
+                              Category, CategoryClosure, Product,
+                              ProductImage)
+from catalogue.services.jobs import process_next_job
+from catalogue.services.load_prices_online import (
+    update_db as update_prices_db
+)
+from catalogue.services.metrics import SyncMetrics
+from catalogue.services.wb_api import (FullCardsFetcher, RateLimiter,
+                                       get_backoff)
+from catalogue.services.images import (ImageFetcher, RenditionRenderer,
+                                       generate_renditions,
+                                       sync_product_images)
+from catalogue.services.update_catalogue import (CardCursorCheckpoint,
+                                                 CardsWatermark,
+                                                 SaveHeadersSession,
+                                                 WBAPIError, bulk_update_db,
+                                                 iter_card_pages)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(width, height, mode='RGB', image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def make_card(code, name, brand='Бренд', category='Категория', price=100):
+    return {
+        'object': category,
+        'objectID': 1000 + len(category),
+        'nmID': code,
+        'imtID': code + 1,
+        'vendorCode': f'артикул {code}',
+        'isProhibited': False,
+        'sizes': [{'price': price}],
+        'mediaFiles': [],
+        'characteristics': [
+            {'Бренд': brand},
+            {'Наименование': name},
+            {'Описание': f'Описание {name}'},
+        ],
+    }
+
+
+class BulkUpdateDbTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = Category.objects.create(
+            name='Категория',
+            wb_category_id=1009
+        )
+        cls.brand = Brand.objects.create(name='Бренд')
+        cls.product = Product.objects.create(
+            name='Товар 1',
+            description='Описание Товар 1',
+            price=100,
+            brand=cls.brand,
+            category=cls.category,
+            code=1,
+            imt_id=2,
+            vendor_code='артикул 1',
+            wb_urls='https://www.wildberries.ru/catalog/1/detail.aspx',
+        )
+        cls.cards = [
+            make_card(1, 'Товар 1'),
+            make_card(2, 'Товар 2', brand='Новый бренд'),
+            make_card(3, 'Товар 3', category='Новая категория'),
+        ]
+
+    def test_create_and_skip_unchanged(self):
+        '''создание новых товаров, неизмененный товар пропускается'''
+        with self.assertLogs(level='INFO'):
+            report = bulk_update_db(BulkUpdateDbTest.cards, batch_size=2)
+        self.assertEqual(
+            report, {'created': 2, 'updated': 0, 'skipped': 1}
+        )
+        self.assertTrue(Brand.objects.filter(name='Новый бренд').exists())
+        product = Product.objects.get(code=3)
+        self.assertEqual(product.category.name, 'Новая категория')
+        self.assertEqual(
+            list(CategoryClosure.objects.filter(
+                descendant=product.category
+            ).values_list('ancestor', 'depth')),
+            [(product.category_id, 0)]
+        )
+        self.assertEqual(product.brand, BulkUpdateDbTest.brand)
+        self.assertTrue(product.slug)
+
+    def test_metrics(self):
+        '''время и количество элементов этапов записи товаров'''
+        metrics = SyncMetrics()
+        with self.assertLogs(level='INFO'):
+            bulk_update_db(BulkUpdateDbTest.cards, metrics=metrics)
+            bulk_update_db(BulkUpdateDbTest.cards[:1], metrics=metrics)
+        upsert = metrics.phases[CatalogueSyncPhase.DB_UPSERT]
+        self.assertEqual((upsert['items'], upsert['calls']), (4, 2))
+        self.assertGreater(upsert['seconds'], 0)
+        self.assertEqual(metrics.phases[CatalogueSyncPhase.IMAGES]['calls'], 2)
+
+    def test_update_changed_product(self):
+        '''обновление изменившихся товаров'''
+        cards = deepcopy(BulkUpdateDbTest.cards[:1])
+        cards[0]['characteristics'][2]['Описание'] = 'Новое описание'
+        with self.assertLogs(level='INFO'):
+            report = bulk_update_db(cards)
+        self.assertEqual(
+            report, {'created': 0, 'updated': 1, 'skipped': 0}
+        )
+        self.assertEqual(
+            Product.objects.get(code=1).description, 'Новое описание'
+        )
+
+    def test_rename_product(self):
+        '''при переименовании товара пересчитывается slug'''
+        slug = Product.objects.get(code=1).slug
+        cards = deepcopy(BulkUpdateDbTest.cards[:1])
+        cards[0]['characteristics'][1]['Наименование'] = 'ТОВАР 1'
+        with self.assertLogs(level='INFO'):
+            bulk_update_db(cards)
+        self.assertEqual(Product.objects.get(code=1).slug, slug)
+        cards[0]['characteristics'][1]['Наименование'] = 'Новое имя'
+        with self.assertLogs(level='INFO'):
+            report = bulk_update_db(cards)
+        self.assertEqual(report['updated'], 1)
+        self.assertEqual(Product.objects.get(code=1).slug, 'novoe-imya-1')
+
+    def test_keep_discounted_price(self):
+        '''цена со скидкой не считается изменением карточки'''
+        cards = [make_card(6, 'Товар 6', price=200)]
+        with self.assertLogs(level='INFO'):
+            bulk_update_db(cards)
+            update_prices_db([{'nmId': 6, 'price': 200, 'discount': 10}])
+            report = bulk_update_db(cards)
+        self.assertEqual(
+            report, {'created': 0, 'updated': 0, 'skipped': 1}
+        )
+        self.assertEqual(Product.objects.get(code=6).price, Decimal('180'))
+
+    def test_skip_invalid_and_duplicate_cards(self):
+        '''пропуск повторяющихся и не прошедших валидацию карточек'''
+        invalid_card = make_card(4, 'Товар 4')
+        invalid_card['characteristics'] = []
+        cards = [
+            make_card(5, 'Товар 5'),
+            make_card(5, 'Товар 5'),
+            invalid_card,
+        ]
+        with self.assertLogs(level='INFO'):
+            report = bulk_update_db(cards)
+        self.assertEqual(
+            report, {'created': 1, 'updated': 0, 'skipped': 2}
+        )
+        self.assertFalse(Product.objects.filter(code=4).exists())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    """Изображения по адресу /<имя файла>, ETag - хэш содержимого."""
+    images = {}
+    delay = 0
+    conditional = True
+    lock = threading.Lock()
+    requests = []
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append(self.path)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(cls.delay)
+            content = cls.images.get(self.path.lstrip('/'))
+            if content is None:
+                self.send_response(HTTPStatus.NOT_FOUND)
+                self.end_headers()
+                return
+            etag = f'"{hashlib.md5(content).hexdigest()}"'
+            if (
+                cls.conditional
+                and self.headers.get('If-None-Match') == etag
+            ):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.end_headers()
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UpdatePricesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.products = [
+            Product.objects.create(
+                name=f'Товар {code}',
+                description=f'Описание Товар {code}',
+                price=100,
+                code=code,
+                vendor_code=f'артикул {code}',
+                wb_urls=f'https://www.wildberries.ru/catalog/{code}/',
+            )
+            for code in (1, 2, 3)
+        ]
+
+    def test_update_changed_prices(self):
+        '''записываются только изменившиеся цены одним запросом'''
+        data = [
+            {'nmId': 1, 'price': 200, 'discount': 10},
+            {'nmId': 2, 'price': 100, 'discount': 0},
+            {'nmId': 3, 'price': 150.5, 'discount': 50},
+            {'nmId': 4, 'price': 100, 'discount': 0},
+            {'nmId': 5, 'price': None, 'discount': 0},
+        ]
+        slugs = dict(Product.objects.values_list('code', 'slug'))
+        with self.assertLogs(level='INFO'):
+            with CaptureQueriesContext(connection) as queries:
+                report = update_prices_db(data, batch_size=2)
+        self.assertEqual(report, {'updated': 2, 'skipped': 1, 'missing': 1})
+        self.assertEqual(
+            dict(Product.objects.values_list('code', 'price')),
+            {1: Decimal('180'), 2: Decimal('100'), 3: Decimal('75.25')}
+        )
+        self.assertEqual(
+            dict(Product.objects.values_list('code', 'slug')), slugs
+        )
+        updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SyncProductImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+        cls.server_thread = threading.Thread(
+            target=cls.server.serve_forever, daemon=True
+        )
+        cls.server_thread.start()
+        cls.base_url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        cls.product = Product.objects.create(
+            name='Товар с изображениями',
+            description='Описание',
+            price=100,
+            code=101,
+            vendor_code='артикул 101',
+        )
+
+    def setUp(self):
+        StubImageHandler.images = {
+            '1.jpg': b'first image',
+            '2.jpg': b'second image',
+            'copy.jpg': b'first image',
+        }
+        StubImageHandler.delay = 0
+        StubImageHandler.conditional = True
+        StubImageHandler.requests = []
+        StubImageHandler.max_active = 0
+        self.fetcher = ImageFetcher(max_workers=4, per_host=2, timeout=5)
+
+    def sync(self, *names):
+        urls = [self.base_url + name for name in names]
+        with self.assertLogs(level='INFO'):
+            with self.captureOnCommitCallbacks(execute=True):
+                return sync_product_images(
+                    [(SyncProductImagesTest.product, urls)],
+                    fetcher=self.fetcher
+                )
+
+    def test_create_images(self):
+        '''загрузка новых изображений, видео и ошибки пропускаются'''
+        report = self.sync('1.jpg', '2.jpg', 'video.mp4', 'missing.jpg')
+        self.assertEqual(
+            report, {'created': 2, 'updated': 0, 'skipped': 1}
+        )
+        images = ProductImage.objects.filter(
+            product=SyncProductImagesTest.product
+        ).order_by('source_url')
+        self.assertEqual(images[0].image.read(), b'first image')
+        self.assertEqual(
+            images[0].content_hash,
+            hashlib.sha256(b'first image').hexdigest()
+        )
+        self.assertTrue(images[0].etag)
+        self.assertNotIn('/video.mp4', StubImageHandler.requests)
+
+    def test_skip_unchanged_images(self):
+        '''неизмененные изображения пропускаются по ETag и хэшу'''
+        self.sync('1.jpg')
+        report = self.sync('1.jpg', 'copy.jpg')
+        self.assertEqual(
+            report, {'created': 0, 'updated': 0, 'skipped': 2}
+        )
+        self.assertEqual(ProductImage.objects.count(), 1)
+
+    def test_skip_same_content_without_update(self):
+        '''изображение с тем же содержимым не перезаписывается в базе'''
+        StubImageHandler.conditional = False
+        self.sync('1.jpg')
+        with CaptureQueriesContext(connection) as queries:
+            report = self.sync('1.jpg')
+        self.assertEqual(
+            report, {'created': 0, 'updated': 0, 'skipped': 1}
+        )
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE') for query in queries
+        ))
+
+    def test_temp_files_removed(self):
+        '''загрузка пакетами, временные файлы удаляются'''
+        results = []
+        fetch_all = self.fetcher.fetch_all
+
+        def fetch_and_keep(urls_etags):
+            batch = fetch_all(urls_etags)
+            results.append(batch)
+            return batch
+
+        urls = [self.base_url + name for name in ('1.jpg', '2.jpg')]
+        with mock.patch.object(self.fetcher, 'fetch_all', fetch_and_keep):
+            with self.assertLogs(level='INFO'):
+                report = sync_product_images(
+                    [(SyncProductImagesTest.product, urls)],
+                    fetcher=self.fetcher, batch_size=1
+                )
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([len(batch) for batch in results], [1, 1])
+        for batch in results:
+            for result in batch:
+                self.assertFalse(os.path.exists(result.path))
+
+    def test_no_files_on_failed_save(self):
+        '''файлы не остаются, если изображения не сохранены в базу'''
+        def media_files():
+            return {
+                os.path.join(root, name)
+                for root, _, names in os.walk(TEMP_MEDIA_ROOT)
+                for name in names
+            }
+
+        StubImageHandler.images['big.png'] = make_image(500, 500)
+        before = media_files()
+        with mock.patch.object(
+            ProductImage.objects, 'bulk_create', side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                sync_product_images(
+                    [(SyncProductImagesTest.product,
+                      [self.base_url + 'big.png'])],
+                    fetcher=self.fetcher
+                )
+        self.assertEqual(media_files(), before)
+        self.assertFalse(ProductImage.objects.exists())
+
+    def test_update_changed_image(self):
+        '''измененное изображение перезаписывается, старый файл удаляется'''
+        self.sync('1.jpg')
+        image = ProductImage.objects.get()
+        old_path = image.image.path
+        StubImageHandler.images['1.jpg'] = b'changed image'
+        report = self.sync('1.jpg')
+        self.assertEqual(
+            report, {'created': 0, 'updated': 1, 'skipped': 0}
+        )
+        image.refresh_from_db()
+        self.assertEqual(image.image.read(), b'changed image')
+        self.assertNotEqual(image.image.path, old_path)
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_per_host_limit(self):
+        '''одновременных запросов к хосту не больше заданного'''
+        StubImageHandler.delay = 0.1
+        StubImageHandler.images.update(
+            {f'{number}.png': f'{number}'.encode() for number in range(6)}
+        )
+        self.sync(*(f'{number}.png' for number in range(6)))
+        self.assertLessEqual(StubImageHandler.max_active, 2)
+        self.assertEqual(ProductImage.objects.count(), 6)
+
+    def test_create_renditions(self):
+        '''для новых изображений строятся миниатюры WebP и JPEG'''
+        StubImageHandler.images.update({
+            'big.png': make_image(1000, 500),
+            'alpha.png': make_image(200, 400, 'RGBA'),
+        })
+        self.sync('big.png', 'alpha.png')
+        image = ProductImage.objects.get(source_url__endswith='big.png')
+        self.assertEqual(
+            {size: (rendition['width'], rendition['height'])
+             for size, rendition in image.renditions.items()},
+            {'list': (300, 150), 'card': (800, 400), 'zoom': (1000, 500)}
+        )
+        storage = image.image.storage
+        for rendition in image.renditions.values():
+            self.assertEqual(set(rendition['files']), {'webp', 'jpeg'})
+            for ext, name in rendition['files'].items():
+                with Image.open(storage.path(name)) as rendered:
+                    self.assertEqual(rendered.format, ext.upper())
+        image = ProductImage.objects.get(source_url__endswith='alpha.png')
+        self.assertEqual(image.renditions['list']['height'], 300)
+
+    def test_update_renditions(self):
+        '''при замене изображения старые миниатюры удаляются'''
+        StubImageHandler.images['1.jpg'] = make_image(500, 500)
+        self.sync('1.jpg')
+        image = ProductImage.objects.get()
+        old_path = image.image.storage.path(
+            image.renditions['list']['files']['webp']
+        )
+        StubImageHandler.images['1.jpg'] = make_image(400, 400)
+        self.sync('1.jpg')
+        image.refresh_from_db()
+        self.assertEqual(image.renditions['zoom']['width'], 400)
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_broken_image_without_renditions(self):
+        '''нечитаемое изображение сохраняется без миниатюр'''
+        report = self.sync('1.jpg')
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(ProductImage.objects.get().renditions, {})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateRenditionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = Product.objects.create(
+            name='Товар без миниатюр',
+            description='Описание',
+            price=100,
+            code=102,
+            vendor_code='артикул 102',
+        )
+
+    def create_image(self, name, content):
+        image = ProductImage(product=GenerateRenditionsTest.product)
+        image.image.save(name, io.BytesIO(content), save=False)
+        image.save()
+        return image
+
+    def test_process_pool(self):
+        '''миниатюры пакета строятся в пуле процессов'''
+        images = [
+            self.create_image(f'{number}.png', make_image(900, 300))
+            for number in range(3)
+        ]
+        with self.assertLogs(level='INFO'):
+            with self.captureOnCommitCallbacks(execute=True):
+                report = generate_renditions(
+                    images, RenditionRenderer(workers=2), batch_size=2
+                )
+        self.assertEqual(report, {'generated': 3, 'failed': 0})
+        for image in images:
+            image.refresh_from_db()
+            self.assertEqual(image.renditions['card']['height'], 267)
+
+    def test_backfill_command(self):
+        '''команда строит миниатюры только для изображений без них'''
+        first = self.create_image('first.png', make_image(100, 100))
+        second = self.create_image('second.png', b'broken')
+        with self.assertLogs(level='INFO'):
+            call_command(
+                'generate_image_renditions', '--workers', '1',
+                stdout=io.StringIO()
+            )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        names = first.renditions['list']['files']
+        self.assertEqual(second.renditions, {})
+        out = io.StringIO()
+        call_command('generate_image_renditions', '--workers', '1',
+                     stdout=out)
+        self.assertIn('построено: 0, с ошибками: 1', out.getvalue())
+        first.refresh_from_db()
+        self.assertEqual(first.renditions['list']['files'], names)
+
+    def test_reset_on_image_change(self):
+        '''при замене файла в админке миниатюры сбрасываются'''
+        image = self.create_image('old.png', make_image(100, 100))
+        with self.assertLogs(level='INFO'):
+            with self.captureOnCommitCallbacks(execute=True):
+                generate_renditions([image], RenditionRenderer(workers=1))
+        image = ProductImage.objects.get(pk=image.pk)
+        path = image.image.storage.path(
+            image.renditions['zoom']['files']['jpeg']
+        )
+        image.image.save('new.png', io.BytesIO(make_image(50, 50)),
+                         save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertEqual(
+            ProductImage.objects.get(pk=image.pk).renditions, {}
+        )
+        self.assertFalse(os.path.exists(path))
+
+
+def make_list_card(code):
+    return {'nmID': code, 'updatedAt': f'2024-01-0{code}T00:00:00Z'}
+
+
+class StubCardsHandler(BaseHTTPRequestHandler):
+    """
+    Список номенклатур WB по курсору nmID, карточки с nmID 5..1
+    от новых к старым. Тела из invalid_bodies отдаются
+    с ответом 200 перед правильными ответами.
+    """
+    codes = [5, 4, 3, 2, 1]
+    unauthorized_after = None
+    invalid_bodies = []
+    cursors = []
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])
+        ))
+        cursor = query['sort']['cursor']
+        type(self).cursors.append(cursor)
+        after = cursor.get('nmID')
+        if after is not None and after == type(self).unauthorized_after:
+            self.send_response(HTTPStatus.UNAUTHORIZED)
+            self.end_headers()
+            return
+        if type(self).invalid_bodies:
+            content = type(self).invalid_bodies.pop(0)
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        start = 0 if after is None else self.codes.index(after) + 1
+        page = self.codes[start:start + cursor['limit']]
+        data = {
+            'cards': [make_list_card(code) for code in page],
+            'cursor': {
+                'updatedAt': f'2024-01-0{page[-1] if page else 0}',
+                'nmID': page[-1] if page else after,
+                'total': len(page),
+            }
+        }
+        content = json.dumps({'data': data}).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CardPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCardsHandler)
+        cls.server_thread = threading.Thread(
+            target=cls.server.serve_forever, daemon=True
+        )
+        cls.server_thread.start()
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        cls.checkpoint_dir = tempfile.mkdtemp()
+
+    def setUp(self):
+        StubCardsHandler.unauthorized_after = None
+        StubCardsHandler.invalid_bodies = []
+        StubCardsHandler.cursors = []
+        self.checkpoint = CardCursorCheckpoint(
+            os.path.join(CardPagesTest.checkpoint_dir, 'cursor.json')
+        )
+        self.checkpoint.clear()
+
+    def iter_pages(self, updated_after=None):
+        return iter_card_pages(
+            SaveHeadersSession(), CardPagesTest.url, {}, 'token',
+            self.checkpoint, limit=2, updated_after=updated_after
+        )
+
+    def test_pages(self):
+        '''постраничное получение карточек без накопления в памяти'''
+        with self.assertLogs(level='INFO'):
+            pages = self.iter_pages()
+            self.assertEqual(
+                next(pages), [make_list_card(5), make_list_card(4)]
+            )
+            self.assertIsNone(self.checkpoint.load())
+            self.assertEqual(
+                next(pages), [make_list_card(3), make_list_card(2)]
+            )
+            self.assertEqual(self.checkpoint.load()['cursor']['nmID'], 4)
+            self.assertEqual(list(pages), [[make_list_card(1)]])
+        self.assertIsNone(self.checkpoint.load())
+
+    @mock.patch(
+        'catalogue.services.update_catalogue.get_backoff', return_value=0
+    )
+    def test_retry_invalid_page(self, get_backoff):
+        '''ответ не в формате JSON или без данных повторяется'''
+        StubCardsHandler.invalid_bodies = [b'<html>', b'{"data": null}']
+        with self.assertLogs(level='INFO'):
+            pages = list(self.iter_pages())
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(get_backoff.call_count, 2)
+        self.assertEqual(len(StubCardsHandler.cursors), 5)
+
+    def test_resume_from_checkpoint(self):
+        '''после ошибки загрузка продолжается с сохраненного курсора'''
+        StubCardsHandler.unauthorized_after = 2
+        with self.assertLogs(level='INFO'):
+            pages = self.iter_pages()
+            next(pages)
+            next(pages)
+            with self.assertRaises(WBAPIError):
+                next(pages)
+        self.assertEqual(self.checkpoint.load(), {
+            'cursor': {'updatedAt': '2024-01-02', 'nmID': 2},
+            'updated_after': None,
+        })
+        StubCardsHandler.unauthorized_after = None
+        with self.assertLogs(level='INFO'):
+            pages = list(self.iter_pages())
+        self.assertEqual(pages, [[make_list_card(1)]])
+        self.assertEqual(StubCardsHandler.cursors[-1]['nmID'], 2)
+        self.assertIsNone(self.checkpoint.load())
+
+    def test_delta_pages(self):
+        '''загрузка изменений заканчивается на карточке не новее отметки'''
+        with self.assertLogs(level='INFO'):
+            pages = list(self.iter_pages('2024-01-03T00:00:00Z'))
+        self.assertEqual(
+            pages, [[make_list_card(5), make_list_card(4)], []]
+        )
+        self.assertEqual(len(StubCardsHandler.cursors), 2)
+
+    def test_watermark(self):
+        '''отметка последней загрузки и возврат к полной загрузке'''
+        watermark = CardsWatermark(
+            os.path.join(CardPagesTest.checkpoint_dir, 'watermark.json')
+        )
+        watermark.clear()
+        self.assertIsNone(watermark.get_updated_after())
+        watermark.observe([make_list_card(2), make_list_card(4)])
+        watermark.commit(full=True)
+        self.assertEqual(
+            watermark.get_updated_after(), '2024-01-04T00:00:00+00:00'
+        )
+        watermark = CardsWatermark(watermark.path)
+        watermark.observe([make_list_card(3)])
+        watermark.commit(full=False)
+        self.assertEqual(
+            watermark.get_updated_after(), '2024-01-04T00:00:00+00:00'
+        )
+        watermark = CardsWatermark(watermark.path)
+        watermark.observe([make_list_card(5)])
+        watermark.incomplete = True
+        with self.assertLogs(level='INFO'):
+            watermark.commit(full=False)
+        self.assertEqual(
+            watermark.get_updated_after(), '2024-01-04T00:00:00+00:00'
+        )
+        state = watermark.load()
+        state['full_sync_at'] = '2024-01-01T00:00:00+00:00'
+        watermark.save(state)
+        self.assertIsNone(watermark.get_updated_after())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.checkpoint_dir, ignore_errors=True)
+        super().tearDownClass()
+
+
+class StubFullCardsHandler(BaseHTTPRequestHandler):
+    """
+    Карточки с характеристиками по артикулам. Первый запрос получает
+    429, артикул "сбой" всегда дает 500, артикул "токен" - 401,
+    артикул "html" - 200 с телом не в формате JSON.
+    """
+    requests = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])
+        ))
+        codes = query['vendorCodes']
+        with self.lock:
+            type(self).requests.append(codes)
+            first = len(type(self).requests) == 1
+        if first:
+            self.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if 'токен' in codes:
+            self.send_response(HTTPStatus.UNAUTHORIZED)
+            self.end_headers()
+            return
+        if 'сбой' in codes:
+            self.send_response(HTTPStatus.INTERNAL_SERVER_ERROR)
+            self.end_headers()
+            return
+        if 'html' in codes:
+            content = b'<html>'
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        content = json.dumps({
+            'data': [{'vendorCode': code} for code in codes]
+        }).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FullCardsFetcherTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), StubFullCardsHandler
+        )
+        cls.server_thread = threading.Thread(
+            target=cls.server.serve_forever, daemon=True
+        )
+        cls.server_thread.start()
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+
+    def setUp(self):
+        StubFullCardsHandler.requests = []
+
+    def get_fetcher(self):
+        return FullCardsFetcher(
+            'token', url=FullCardsFetcherTest.url, workers=3,
+            rate_limiter=RateLimiter(0), retries=3, backoff=0, chunk_size=2
+        )
+
+    def test_partial_results(self):
+        '''части загружаются параллельно, неудачные части возвращаются'''
+        codes = ['a1', 'a2', 'a3', 'сбой', 'a5']
+        with self.assertLogs(level='INFO'):
+            cards, failed_codes = self.get_fetcher().fetch_all(codes)
+        self.assertEqual(
+            cards,
+            [{'vendorCode': code} for code in ('a1', 'a2', 'a5')]
+        )
+        self.assertEqual(failed_codes, ['a3', 'сбой'])
+        # 500 повторяется до исчерпания попыток
+        self.assertEqual(
+            StubFullCardsHandler.requests.count(['a3', 'сбой']), 3
+        )
+
+    def test_invalid_json(self):
+        '''ответ 200 не в формате JSON повторяется, затем часть неудачна'''
+        codes = ['a1', 'a2', 'html', 'a4']
+        with self.assertLogs(level='INFO'):
+            cards, failed_codes = self.get_fetcher().fetch_all(codes)
+        self.assertEqual(
+            cards, [{'vendorCode': code} for code in ('a1', 'a2')]
+        )
+        self.assertEqual(failed_codes, ['html', 'a4'])
+        self.assertEqual(
+            StubFullCardsHandler.requests.count(['html', 'a4']), 3
+        )
+
+    def test_unauthorized(self):
+        '''неверный токен прерывает загрузку'''
+        with self.assertLogs(level='INFO'), self.assertRaises(WBAPIError):
+            self.get_fetcher().fetch_all(['a1', 'токен'])
+
+    def test_backoff(self):
+        '''экспоненциальная задержка с учетом Retry-After'''
+        self.assertEqual(get_backoff(0, retry_after='3'), 3)
+        self.assertEqual(get_backoff(0, retry_after='100', maximum=10), 10)
+        delay = get_backoff(3, base=1, maximum=60)
+        self.assertTrue(4 <= delay <= 8)
+        self.assertTrue(5 <= get_backoff(10, base=1, maximum=10) <= 10)
+
+    def test_rate_limiter(self):
+        '''запросы разносятся по времени согласно ограничению'''
+        rate_limiter = RateLimiter(per_minute=600)
+        start = time.monotonic()
+        for _ in range(3):
+            rate_limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+@mock.patch('catalogue.services.jobs.MEDIA_ROOT', TEMP_MEDIA_ROOT)
+class UpdateJobTest(TestCase):
+    def fake_update(self, full, progress, metrics):
+        progress('cards', 0)
+        with metrics.measure(CatalogueSyncPhase.CARDS, 100):
+            pass
+        progress('cards', 100)
+        with metrics.measure(CatalogueSyncPhase.PRICES):
+            pass
+        progress('prices')
+        return True
+
+    def test_enqueue_single_active_job(self):
+        '''активной может быть только одна задача обновления'''
+        job = CatalogueUpdateJob.objects.enqueue(full=True)
+        self.assertEqual(job.status, CatalogueUpdateJob.PENDING)
+        self.assertIsNone(CatalogueUpdateJob.objects.enqueue())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CatalogueUpdateJob.objects.create()
+
+    def test_process_next_job(self):
+        '''обработчик выполняет задачу и сохраняет ход загрузки'''
+        job = CatalogueUpdateJob.objects.enqueue(full=True)
+        with self.assertLogs(level='INFO'):
+            processed = process_next_job(
+                'worker', update=self.fake_update, heartbeat_interval=0
+            )
+        self.assertEqual(processed.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CatalogueUpdateJob.DONE)
+        self.assertEqual(job.worker, 'worker')
+        self.assertEqual(job.phase, 'prices')
+        self.assertEqual(job.processed, 100)
+        self.assertIsNotNone(job.finished_at)
+        self.assertTrue(os.path.exists(job.log_file))
+        self.assertEqual(
+            list(job.phases.values_list('name', 'items', 'calls')),
+            [('cards', 100, 1), ('prices', 0, 1)]
+        )
+        self.assertIsNone(process_next_job('worker'))
+        self.assertIsNotNone(CatalogueUpdateJob.objects.enqueue())
+
+    def test_failed_job(self):
+        '''ошибка загрузки завершает задачу со статусом ошибки'''
+        CatalogueUpdateJob.objects.enqueue()
+
+        def broken_update(full, progress, metrics):
+            raise ValueError('нет ответа WB')
+
+        with self.assertLogs(level='INFO'):
+            job = process_next_job(
+                'worker', update=broken_update, heartbeat_interval=0
+            )
+        self.assertEqual(job.status, CatalogueUpdateJob.FAILED)
+        self.assertEqual(job.error, 'нет ответа WB')
+
+    def test_no_pending_while_running(self):
+        '''задача не ставится в очередь, пока выполняется другая'''
+        running = CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.RUNNING, heartbeat_at=timezone.now()
+        )
+        self.assertIsNone(CatalogueUpdateJob.objects.enqueue())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CatalogueUpdateJob.objects.create()
+        running.finish(CatalogueUpdateJob.DONE)
+        pending = CatalogueUpdateJob.objects.enqueue()
+        job = CatalogueUpdateJob.objects.claim('worker')
+        self.assertEqual(job.pk, pending.pk)
+        self.assertEqual(job.status, CatalogueUpdateJob.RUNNING)
+
+    def test_stale_job(self):
+        '''задача без отметки о работе снимается как прерванная'''
+        stale = CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.RUNNING,
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+        job = CatalogueUpdateJob.objects.enqueue()
+        self.assertIsNotNone(job)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, CatalogueUpdateJob.FAILED)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
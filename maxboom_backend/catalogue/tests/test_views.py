@@ -1,18 +1,35 @@
+import json
 import shutil
 import tempfile
-# from http import HTTPStatus
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+from unittest import mock, skipUnless
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, override_settings
-from rest_framework.test import APIClient
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
 
-from catalogue.models import Brand, Category, Product, ProductImage
+from api.services.search import SearchService
+from api.views.catalogue import SEARCH_SECTIONS
+
+from catalogue.cache import catalogue_version_batch, get_catalogue_version
+from catalogue.models import (Brand, CatalogueSyncPhase, CatalogueUpdateJob,
+                              Category, Product, ProductImage)
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_CACHE_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -195,7 +212,6 @@ class CatalogueViewsTests(TestCase):
                     'name': 'Пусковое зарядное устройство 2 для поиска',
                     'slug': ('puskovoe-zaryadnoe-ustrojstvo-2-dlya-p'
                              'oiska-169110394'),
-                    'description': 'Хороший продукт для description search',
                     'code': 169110394,
                     'wb_urls': ('https://www.wildberries.ru/catalog/16911'
                                 '0394/detail.aspx'),
@@ -213,7 +229,6 @@ class CatalogueViewsTests(TestCase):
                     'price': 144.0,
                     'name': 'Пусковое зарядное устройство 4',
                     'slug': 'puskovoe-zaryadnoe-ustrojstvo-4-1691103959',
-                    'description': 'Хороший продукт для 4',
                     'code': 1691103959,
                     'wb_urls': ('https://www.wildberries.ru/catalog/16911'
                                 '03959/detail.aspx'),
@@ -232,7 +247,6 @@ class CatalogueViewsTests(TestCase):
                     'price': 144.0,
                     'name': 'Пусковое зарядное устройство 5',
                     'slug': 'puskovoe-zaryadnoe-ustrojstvo-5-1691103945',
-                    'description': 'Хороший продукт для',
                     'code': 1691103945,
                     'wb_urls': ('https://www.wildberries.ru/catalog/16911'
                                 '03945/detail.aspx'),
@@ -281,6 +295,20 @@ class CatalogueViewsTests(TestCase):
         self.assertEqual(1, products_count,
                          'Не найден товар по фразе из описания')
 
+    def test_products_search_backend_fallback(self):
+        """
+        полнотекстовый поиск вне PostgreSQL заменяется поиском DRF
+        """
+        address = ('/api/catalogue/?search='
+                   'description%20search&description=true')
+        with mock.patch(
+            'api.filters.catalogue.CATALOGUE_SEARCH_BACKEND', 'postgres'
+        ):
+            response = self.user_client.get(address)
+        products_count = len(response.data.get('results'))
+        self.assertEqual(1, products_count,
+                         'Не найден товар по фразе из описания')
+
     def test_common_search(self):
         """
         поиск товаров по наименованию
@@ -295,6 +323,47 @@ class CatalogueViewsTests(TestCase):
         self.assertEqual(3, products_count,
                          'Пользователь не получил товары')
 
+    def test_common_search_invalid_params(self):
+        """
+        неверные параметры одного раздела не мешают поиску в другом
+        """
+        address = '/api/search/?search=ка&category=0'
+        response = self.user_client.get(address)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(2, len(response.data.get('category')))
+        self.assertEqual(response.data.get('product'), {
+            'count': 0,
+            'next': None,
+            'previous': None,
+            'results': []
+        })
+
+    def test_common_search_invalid_pagination(self):
+        """
+        подделанный курсор раздела товаров не прерывает поиск
+        """
+        for cursor in ('bad', 'e30='):
+            with self.subTest(cursor=cursor):
+                response = self.user_client.get(
+                    f'/api/search/?search=ка&cursor={cursor}')
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(2, len(response.data.get('category')))
+                self.assertEqual(response.data.get('product'), {
+                    'count': 0,
+                    'next': None,
+                    'previous': None,
+                    'results': []
+                })
+
+    def test_common_search_benchmark(self):
+        """
+        сравнение прежнего и нового поиска выводит оба замера
+        """
+        out = StringIO()
+        call_command('benchmark_search', 'ка', repeat=2, stdout=out)
+        self.assertIn('Прежний поиск', out.getvalue())
+        self.assertIn('Новый поиск', out.getvalue())
+
     def test_search_in_description_(self):
         """
         поиск товаров по наименованию и описанию
@@ -379,6 +448,7 @@ class CatalogueViewsTests(TestCase):
                 'id': 1,
                 'name': 'Корневая категория',
                 'slug': 'kornevaya-kategoriya',
+                'total_count': 3,
                 'branches': [
                     {
                         'id': 3,
@@ -390,7 +460,7 @@ class CatalogueViewsTests(TestCase):
                                 'id': 4,
                                 'name': 'Категория1',
                                 'slug': 'kategoriya1',
-                                'products_count': 2,
+                                'products_count': 1,
                                 'branches': []
                             }
                         ]
@@ -518,7 +588,6 @@ class CatalogueViewsTests(TestCase):
                 'name': 'Пусковое зарядное устройство 2 для поиска',
                 'slug': 'puskovoe-zaryadnoe-ustrojstvo-2'
                         '-dlya-poiska-169110394',
-                'description': 'Хороший продукт для description search',
                 'code': 169110394,
                 'wb_urls': 'https://www.wildberries.ru/'
                            'catalog/169110394/detail.aspx',
@@ -533,7 +602,6 @@ class CatalogueViewsTests(TestCase):
                 'price': price,
                 'name': 'Пусковое зарядное устройство 4',
                 'slug': 'puskovoe-zaryadnoe-ustrojstvo-4-1691103959',
-                'description': 'Хороший продукт для 4',
                 'code': 1691103959,
                 'wb_urls': 'https://www.wildberries.ru/'
                            'catalog/1691103959/detail.aspx',
@@ -548,7 +616,6 @@ class CatalogueViewsTests(TestCase):
                 'price': price,
                 'name': 'Пусковое зарядное устройство 5',
                 'slug': 'puskovoe-zaryadnoe-ustrojstvo-5-1691103945',
-                'description': 'Хороший продукт для',
                 'code': 1691103945,
                 'wb_urls': 'https://www.wildberries.ru/'
                            'catalog/1691103945/detail.aspx',
@@ -623,6 +690,38 @@ class CatalogueViewsTests(TestCase):
         }
         self.check_fields(response=response.data, expected_data=expected_data)
 
+    def test_get_product_image_srcset(self):
+        """ссылки на миниатюры изображений товара"""
+        product = CatalogueViewsTests.product
+        ProductImage.objects.filter(product=product).update(
+            renditions={
+                size: {
+                    'width': width,
+                    'height': width,
+                    'files': {
+                        ext: f'product-images/p/img_{size}.{ext}'
+                        for ext in ('webp', 'jpeg')
+                    },
+                }
+                for size, width in (('card', 800), ('list', 300))
+            }
+        )
+        response = self.user_client.get(f'/api/catalogue/{product.slug}/')
+        image = response.data['images'][0]
+        url = 'http://testserver/media/product-images/p/img_'
+        self.assertEqual(
+            image['renditions']['list'],
+            {'width': 300, 'height': 300,
+             'webp': f'{url}list.webp', 'jpeg': f'{url}list.jpeg'}
+        )
+        self.assertEqual(
+            image['srcset'],
+            {
+                'webp': f'{url}list.webp 300w, {url}card.webp 800w',
+                'jpeg': f'{url}list.jpeg 300w, {url}card.jpeg 800w',
+            }
+        )
+
     def check_fields(self, response, expected_data):
         if type(expected_data) is list and expected_data:
             for i in range(len(expected_data)):
@@ -656,3 +755,431 @@ class CatalogueViewsTests(TestCase):
     def tearDownClass(cls):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
         super().tearDownClass()
+
+
+class SearchServiceTests(TransactionTestCase):
+    def setUp(self):
+        category = Category.objects.create(
+            name='Кабели',
+            wb_category_id=323101
+        )
+        for code in range(1, 4):
+            Product.objects.create(
+                name=f'Кабель {code}',
+                description='Описание',
+                price=100,
+                category=category,
+                code=code,
+                vendor_code=f'артикул {code}',
+            )
+
+    def test_concurrent_search(self):
+        '''параллельный поиск возвращает те же данные, что и поочередный'''
+        factory = APIRequestFactory()
+        results = []
+        for concurrent in (False, True):
+            request = APIView().initialize_request(
+                factory.get('/api/search/', {'search': 'Каб'})
+            )
+            results.append(
+                SearchService(request, SEARCH_SECTIONS, concurrent).search()
+            )
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[1]['category']), 1)
+        self.assertEqual(results[1]['product']['count'], 3)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'полнотекстовый поиск работает только в PostgreSQL')
+@mock.patch('api.filters.catalogue.CATALOGUE_SEARCH_BACKEND', 'postgres')
+class PostgresProductSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        category = Category.objects.create(
+            name='Кухня',
+            wb_category_id=323201
+        )
+        for code, name, description in (
+            (1, 'Нож кухонный', 'Стальное лезвие'),
+            (2, 'Доска разделочная', 'Не тупит нож'),
+            (3, 'Овощерезка ручная', 'Пластик'),
+        ):
+            Product.objects.create(
+                name=name,
+                description=description,
+                price=100,
+                category=category,
+                code=code,
+                vendor_code=f'артикул {code}',
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get(f'/api/catalogue/?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [item['name'] for item in response.data['results']]
+
+    def test_rank(self):
+        '''совпадение в названии выше совпадения в описании'''
+        self.assertEqual(
+            self.search('search=нож&description=true'),
+            ['Нож кухонный', 'Доска разделочная']
+        )
+        self.assertEqual(self.search('search=нож'), ['Нож кухонный'])
+
+    def test_stemming(self):
+        '''слова находятся в других формах'''
+        self.assertEqual(self.search('search=ножи'), ['Нож кухонный'])
+        self.assertEqual(
+            self.search('search=разделочной доски'), ['Доска разделочная']
+        )
+
+    def test_typo_fallback(self):
+        '''с опечаткой товар находится триграммным поиском'''
+        self.assertEqual(
+            self.search('search=овошерезка'), ['Овощерезка ручная']
+        )
+
+    def test_no_fallback_with_matches(self):
+        '''триграммный поиск не добавляет товары к найденным'''
+        self.assertEqual(self.search('search=ручная'), ['Овощерезка ручная'])
+
+    def test_search_query_count(self):
+        '''поиск с опечаткой не выполняет отдельных запросов'''
+        with CaptureQueriesContext(connection) as queries:
+            self.search('search=овошерезка')
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT (1) AS "a"')
+            for query in queries
+        ))
+
+
+class ProductListQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = Category.objects.create(
+            name='Категория запросы',
+            wb_category_id=323301
+        )
+        cls.brand = Brand.objects.create(name='Бренд запросы')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_products(self, start, count):
+        for code in range(start, start + count):
+            product = Product.objects.create(
+                name=f'Товар {code}',
+                description='Длинное описание товара',
+                price=100,
+                brand=ProductListQueriesTests.brand,
+                category=ProductListQueriesTests.category,
+                code=code,
+                vendor_code=f'артикул {code}',
+            )
+            ProductImage.objects.create(
+                product=product, image=f'product-images/{code}.jpg'
+            )
+
+    def test_list_queries(self):
+        '''число запросов списка товаров не зависит от числа товаров'''
+        for start, count in ((1, 1), (2, 10)):
+            self.create_products(start, count)
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/catalogue/?limit=100')
+            self.assertEqual(len(response.data['results']), start + count - 1)
+        item = response.data['results'][0]
+        self.assertEqual(item['brand'], 'Бренд запросы')
+        self.assertEqual(item['category'], 'Категория запросы')
+        self.assertEqual(len(item['images']), 1)
+        self.assertNotIn('description', item)
+
+    def test_list_defers_description(self):
+        '''описание товаров не загружается для списка'''
+        self.create_products(1, 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/catalogue/')
+        self.assertFalse(any(
+            '"catalogue_product"."description"' in query['sql']
+            for query in queries
+        ))
+        product = Product.objects.get(code=1)
+        response = self.client.get(f'/api/catalogue/{product.slug}/')
+        self.assertEqual(
+            response.data['description'], 'Длинное описание товара'
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = Category.objects.create(
+            name='Категория курсор',
+            wb_category_id=323201
+        )
+        cls.products = [
+            Product.objects.create(
+                name=f'Товар {code}',
+                description='Описание',
+                price=price,
+                category=cls.category,
+                code=code,
+                vendor_code=f'артикул {code}',
+            )
+            for code, price in ((1, 300), (2, 100), (3, 200), (4, 100),
+                                (5, 200))
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_pages(self, address):
+        pages = []
+        while address:
+            response = self.client.get(address)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            pages.append(response.data)
+            address = response.data['next']
+        return pages
+
+    def test_keyset_pages(self):
+        '''обход всех страниц по курсору с сортировкой по цене'''
+        pages = self.get_pages(
+            '/api/catalogue/?cursor=&limit=2&ordering=-price')
+        self.assertEqual(len(pages), 3)
+        codes = [item['code'] for page in pages for item in page['results']]
+        self.assertEqual(codes, [1, 5, 3, 4, 2])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertTrue(all(page['count'] == 5 for page in pages))
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[0]['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_keyset_queries(self):
+        '''страница по курсору без COUNT после первого запроса'''
+        address = '/api/catalogue/?cursor=&limit=2'
+        address = self.client.get(address).data['next']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(address)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] or 'OFFSET' in query['sql']
+            for query in queries
+        ))
+        self.assertEqual(
+            [item['code'] for item in response.data['results']], [3, 4]
+        )
+
+    def test_keyset_category_name(self):
+        '''название категории берется из фильтра без отдельного запроса'''
+        address = (f'/api/catalogue/?cursor=&limit=2'
+                   f'&category={KeysetPaginationTests.category.pk}')
+        response = self.client.get(address)
+        self.assertEqual(
+            response.data['category_name'], 'Категория курсор'
+        )
+        self.assertEqual(response.data['count'], 5)
+
+    def test_invalid_cursor(self):
+        '''неверный курсор'''
+        response = self.client.get('/api/catalogue/?cursor=неверно')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_tampered_cursor_value(self):
+        '''подделанное значение ключа в курсоре'''
+        for ordering, value in (('price', 'дорого'), ('price', [1]),
+                                ('code', {'a': 1}), ('name', None),
+                                ('code', '1.5')):
+            cursor = urlsafe_b64encode(
+                json.dumps({'v': value, 'id': 1}).encode()).decode()
+            with self.subTest(ordering=ordering, value=value):
+                response = self.client.get(
+                    f'/api/catalogue/?cursor={cursor}&ordering={ordering}')
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class CatalogueCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = Category.objects.create(
+            name='Категория кэш',
+            wb_category_id=323001
+        )
+        cls.brand = Brand.objects.create(name='Бренд кэш')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def check_cached_response(self, address):
+        response = self.client.get(address)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(address)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['ETag'], etag)
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        return etag
+
+    def test_category_tree_cached(self):
+        """повторный запрос дерева категорий отдается из кэша"""
+        self.check_cached_response(
+            '/api/catalogue/category/?category_tree=true')
+
+    def test_brand_list_cached(self):
+        """повторный запрос списка производителей отдается из кэша"""
+        self.check_cached_response('/api/catalogue/brand/')
+
+    def test_cache_invalidated_on_write(self):
+        """изменение каталога меняет версию закэшированного ответа"""
+        address = '/api/catalogue/category/'
+        etag = self.check_cached_response(address)
+        category = Category.objects.get(pk=CatalogueCacheTests.category.pk)
+        category.name = 'Категория кэш новая'
+        category.save()
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data[0]['name'], 'Категория кэш новая')
+
+    def test_version_bumped_once_per_batch(self):
+        """пакет изменений каталога увеличивает версию один раз"""
+        version = get_catalogue_version()
+        with catalogue_version_batch():
+            Brand.objects.create(name='Бренд кэш пакет')
+            Product.objects.create(
+                name='Товар кэш пакет',
+                description='Описание',
+                price=100,
+                brand=CatalogueCacheTests.brand,
+                category=CatalogueCacheTests.category,
+                code=323002,
+                vendor_code='артикул кэш',
+            )
+            self.assertEqual(get_catalogue_version(), version)
+        self.assertEqual(get_catalogue_version(), version + 1)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': TEMP_CACHE_ROOT,
+        }
+    })
+    def test_file_based_cache(self):
+        """кэширование с файловым бэкендом кэша"""
+        cache.clear()
+        address = '/api/catalogue/brand/'
+        etag = self.check_cached_response(address)
+        Brand.objects.create(name='Бренд кэш 2')
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.data), 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_CACHE_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+class CatalogueUpdateJobViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin_update@example.com', 'admin1')
+        cls.user = User.objects.create_user(
+            'user_update@example.com', 'test_pass')
+
+    def setUp(self):
+        self.admin_client = APIClient()
+        self.admin_client.force_login(CatalogueUpdateJobViewsTests.admin)
+
+    def test_update_enqueues_job(self):
+        """запуск обновления ставит задачу в очередь один раз"""
+        response = self.admin_client.post('/api/update/?full=true')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        job = CatalogueUpdateJob.objects.get()
+        self.assertTrue(job.full)
+        self.assertEqual(job.created_by, CatalogueUpdateJobViewsTests.admin)
+        self.assertEqual(response.data['job']['id'], job.pk)
+        response = self.admin_client.get('/api/update/')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(CatalogueUpdateJob.objects.count(), 1)
+
+    def test_update_status(self):
+        """состояние последней задачи обновления"""
+        response = self.admin_client.get('/api/update/status/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.DONE, processed=10
+        )
+        job = CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.RUNNING, phase='cards', processed=5,
+            heartbeat_at=timezone.now()
+        )
+        response = self.admin_client.get('/api/update/status/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['id'], job.pk)
+        self.assertEqual(response.data['status'], 'running')
+        self.assertEqual(response.data['phase'], 'cards')
+        self.assertEqual(response.data['processed'], 5)
+        response = self.admin_client.get(
+            f'/api/update/status/?id={job.pk - 1}')
+        self.assertEqual(response.data['status'], 'done')
+
+    def test_update_status_read_only(self):
+        """запрос состояния не снимает зависшие задачи"""
+        job = CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.RUNNING,
+            heartbeat_at=timezone.now() - timedelta(days=1)
+        )
+        response = self.admin_client.get('/api/update/status/')
+        self.assertEqual(response.data['status'], 'running')
+        job.refresh_from_db()
+        self.assertEqual(job.status, CatalogueUpdateJob.RUNNING)
+
+    def test_update_runs(self):
+        """история обновлений со временем этапов и скоростью загрузки"""
+        now = timezone.now()
+        job = CatalogueUpdateJob.objects.create(
+            status=CatalogueUpdateJob.DONE, processed=500,
+            started_at=now - timedelta(seconds=100), finished_at=now
+        )
+        job.phases.create(
+            name=CatalogueSyncPhase.FULL_CARDS, seconds=40, items=500,
+            calls=1
+        )
+        CatalogueUpdateJob.objects.create(status=CatalogueUpdateJob.FAILED)
+        response = self.admin_client.get('/api/update/runs/?limit=1')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.data), 1)
+        response = self.admin_client.get('/api/update/runs/')
+        self.assertEqual(len(response.data), 2)
+        data = response.data[1]
+        self.assertEqual(data['duration'], 100)
+        self.assertEqual(data['cards_per_second'], 5)
+        self.assertEqual(data['phases'], [{
+            'name': 'full_cards', 'seconds': 40, 'items': 500, 'calls': 1,
+            'items_per_second': 12.5
+        }])
+        response = self.admin_client.get('/api/update/runs/?limit=x')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_update_status_forbidden(self):
+        """состояние обновления доступно только администратору"""
+        client = APIClient()
+        client.force_authenticate(CatalogueUpdateJobViewsTests.user)
+        for address in (
+            '/api/update/', '/api/update/status/', '/api/update/runs/'
+        ):
+            with self.subTest(address=address):
+                response = client.get(address)
+                self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
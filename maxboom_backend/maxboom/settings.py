@@ -53,6 +53,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -167,6 +168,35 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Кэш. Версия каталога в ключах кэша должна быть общей для всех
+# процессов (gunicorn, worker синхронизации каталога), поэтому
+# по умолчанию используется файловый кэш в каталоге cache,
+# в docker-compose - на общем томе backend и worker. Кэш в памяти
+# процесса (LocMemCache) допустим только для одного процесса.
+# Каталог media для кэша не подходит: его раздаёт nginx.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    }
+}
+# Время хранения ответов каталога в кэше, сек.
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv('CATALOGUE_CACHE_TIMEOUT', 600))
+# Поиск товаров: 'default' - поиск DRF по вхождению подстроки,
+# 'postgres' - полнотекстовый поиск PostgreSQL (только для PostgreSQL).
+CATALOGUE_SEARCH_BACKEND = os.getenv('CATALOGUE_SEARCH_BACKEND', 'default')
+# Подсчет общего количества товаров при постраничном выводе по ключу.
+CATALOGUE_KEYSET_COUNT = bool(int(os.getenv('CATALOGUE_KEYSET_COUNT', 1)))
+# Параллельный поиск категорий и товаров в /api/search/.
+CATALOGUE_SEARCH_CONCURRENT = bool(
+    int(os.getenv('CATALOGUE_SEARCH_CONCURRENT', 0))
+)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -254,6 +284,52 @@ VAT_CODE = '1'
 
 # WB API
 WB_API = os.getenv('AUTHORIZATION')
+# Ограничение частоты запросов к WB API в минуту на все потоки,
+# число попыток запроса, начальная и наибольшая задержка перед
+# повтором, сек., таймаут запроса, сек.
+WB_API_RATE_LIMIT = int(os.getenv('WB_API_RATE_LIMIT', 100))
+WB_API_RETRIES = int(os.getenv('WB_API_RETRIES', 5))
+WB_API_BACKOFF = float(os.getenv('WB_API_BACKOFF', 1))
+WB_API_BACKOFF_MAX = float(os.getenv('WB_API_BACKOFF_MAX', 60))
+WB_API_TIMEOUT = int(os.getenv('WB_API_TIMEOUT', 60))
+# Число потоков загрузки карточек с характеристиками
+WB_FULL_CARDS_WORKERS = int(os.getenv('WB_FULL_CARDS_WORKERS', 4))
+# Размер пакета при массовой записи каталога в базу данных
+CATALOGUE_BATCH_SIZE = int(os.getenv('CATALOGUE_BATCH_SIZE', 500))
+# Интервал полной загрузки каталога WB, дней, между полными
+# загрузками загружаются только измененные карточки.
+CATALOGUE_FULL_SYNC_DAYS = int(os.getenv('CATALOGUE_FULL_SYNC_DAYS', 7))
+# Загрузка изображений товаров: число потоков, одновременных запросов
+# к одному хосту и таймаут запроса, сек.
+CATALOGUE_IMAGE_WORKERS = int(os.getenv('CATALOGUE_IMAGE_WORKERS', 8))
+CATALOGUE_IMAGE_PER_HOST = int(os.getenv('CATALOGUE_IMAGE_PER_HOST', 4))
+CATALOGUE_IMAGE_TIMEOUT = int(os.getenv('CATALOGUE_IMAGE_TIMEOUT', 30))
+# Миниатюры изображений товаров: число процессов построения,
+# качество сжатия WebP/JPEG и число изображений в пакете.
+CATALOGUE_RENDITION_WORKERS = int(
+    os.getenv('CATALOGUE_RENDITION_WORKERS', 2)
+)
+CATALOGUE_RENDITION_QUALITY = int(
+    os.getenv('CATALOGUE_RENDITION_QUALITY', 80)
+)
+CATALOGUE_RENDITION_BATCH_SIZE = int(
+    os.getenv('CATALOGUE_RENDITION_BATCH_SIZE', 100)
+)
+# Очередь обновлений каталога: интервал опроса очереди обработчиком
+# и отметки о работе задачи, сек., задача без отметки дольше
+# CATALOGUE_JOB_STALE_SECONDS считается прерванной.
+CATALOGUE_JOB_POLL_INTERVAL = float(
+    os.getenv('CATALOGUE_JOB_POLL_INTERVAL', 1)
+)
+CATALOGUE_JOB_HEARTBEAT = int(os.getenv('CATALOGUE_JOB_HEARTBEAT', 30))
+CATALOGUE_JOB_STALE_SECONDS = int(
+    os.getenv('CATALOGUE_JOB_STALE_SECONDS', 300)
+)
+# Неавторизованные корзины без изменений дольше CART_ANONYMOUS_TTL_DAYS
+# дней удаляются командой delete_expired_carts пакетами по
+# CART_CLEANUP_BATCH_SIZE корзин.
+CART_ANONYMOUS_TTL_DAYS = int(os.getenv('CART_ANONYMOUS_TTL_DAYS', 30))
+CART_CLEANUP_BATCH_SIZE = int(os.getenv('CART_CLEANUP_BATCH_SIZE', 1000))
 CORS_ALLOW_CREDENTIALS = True
 SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = True
@@ -5,7 +5,8 @@ from django.db import models
 from phonenumber_field.modelfields import PhoneNumberField
 
 from catalogue.models import Product
-from maxboom.settings import DISCOUNT_ANONYM, DISCOUNT_USER, MIN_AMOUNT_PRODUCT
+from catalogue.pricing import get_owner_tier, get_tier_price
+from maxboom.settings import MIN_AMOUNT_PRODUCT
 
 User = get_user_model()
 REASONS = (
@@ -163,13 +164,11 @@ class OrderRefund(models.Model):
 
     @property
     def value(self, *args, **kwargs):
-        value = 0
-        commodities = self.commodities.all()
-        if commodities.exists():
-            for item in commodities:
-                value += item.quantity * item.commodity.price
-        type(value)
-        return value
+        # Товары возврата берутся из prefetch_related, если загружены.
+        return sum(
+            item.quantity * item.commodity.price
+            for item in self.commodities.all()
+        )
     value.fget.short_description = 'Стоимость'
 
     @property
@@ -258,22 +257,17 @@ class Order(models.Model):
 
     @property
     def value(self, *args, **kwargs):
-        value = 0
-        if getattr(self, 'commodities', False):
-            commodities = self.commodities.all()
-            if commodities.exists():
-                for item in commodities:
-                    value += item.quantity * item.price
-        return value
+        # Товары заказа берутся из prefetch_related, если загружены.
+        return sum(
+            item.quantity * item.price for item in self.commodities.all()
+        )
     value.fget.short_description = 'Стоимость'
 
     @property
     def is_paid(self, *args, **kwargs):
-        if getattr(self, 'payments', False):
-            payments = self.payments.exclude(status='canceled')
-            for payment in payments:
-                if payment.is_paid:
-                    return True
+        for payment in self.payments.all():
+            if payment.status != 'canceled' and payment.is_paid:
+                return True
         return False
     is_paid.fget.short_description = 'Заказ оплачен'
 
@@ -322,19 +316,15 @@ class Commodity(models.Model):
     def save(self, *args, **kwargs):
         if self.price:
             return super().save(*args, **kwargs)
-        if self.order.is_active and self.order.user.userprofile.is_vendor:
-            discount = DISCOUNT_USER
-        else:
-            discount = DISCOUNT_ANONYM
-        self.price = round(self.product.price * discount, 2)
+        self.price = get_tier_price(
+            self.product.price, get_owner_tier(self.order)
+        )
         self.full_clean()
         super().save(*args, **kwargs)
 
     @property
     def rest(self):
-        if not self.refunds.all().exists():
-            return self.quantity
-        rest = self.quantity
-        for obj in self.refunds.all():
-            rest -= obj.quantity
-        return rest
+        # Возвраты берутся из prefetch_related, если загружены.
+        return self.quantity - sum(
+            refund.quantity for refund in self.refunds.all()
+        )
@@ -6,7 +6,9 @@ from http import HTTPStatus
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from cart.models import Cart, ProductCart
@@ -701,6 +703,44 @@ class OrderViewsTests(TestCase):
         self.assertEqual(resp.status_code, HTTPStatus.CREATED,
                          'Не создан возврат')
 
+    def post_order_queries(self, products_count):
+        user = User.objects.create_user(
+            f'buyer{products_count}@example.com', 'test_pass'
+        )
+        cart = Cart.objects.create(user=user, is_active=True)
+        for number in range(products_count):
+            product = Product.objects.create(
+                name=f'Товар {products_count} {number}',
+                price=100 + number,
+                code=products_count * 1000 + number,
+                vendor_code=f'артикул {products_count} {number}',
+            )
+            ProductImage.objects.create(
+                product=product, image='product-images/prod_img.gif'
+            )
+            ProductCart.objects.create(cart=cart, product=product, amount=2)
+        client = APIClient()
+        client.force_authenticate(user)
+        data_order = {
+            'address': 'г.Москва, ул. Ленина, д. 41, к. 2',
+            'phone': '+79991243584',
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = client.post('/api/order/', data=data_order)
+        self.assertEquals(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(response.data['commodities']), products_count)
+        self.assertEqual(
+            Order.objects.get(pk=response.data['id']).commodities.count(),
+            products_count
+        )
+        return len(context)
+
+    def test_post_order_queries(self):
+        """Число запросов при оформлении заказа не зависит от корзины"""
+        self.assertEqual(
+            self.post_order_queries(1), self.post_order_queries(10)
+        )
+
     def check_fields(self, response, expected_data):
         if type(expected_data) is list and expected_data:
             for i in range(len(expected_data)):
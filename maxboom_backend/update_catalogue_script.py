@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Django's command-line utility for administrative tasks."""
 import os
+import sys
 import django
 import logging
 
@@ -16,9 +17,9 @@ def main():
     else:
         logging.info("Успешно прошел запуск django")
     try:
-        from catalogue.services.update_catalogue import (
-            update_catalogue, get_path
-        )
+        from catalogue.models import CatalogueUpdateJob
+        from catalogue.services.jobs import get_worker_name, run_update_job
+        from catalogue.services.update_catalogue import get_path
     except ImportError as exc:
         raise ImportError(
             "Couldn't import Django. Are you sure it's installed and "
@@ -26,7 +27,7 @@ def main():
             "forget to activate a virtual environment?"
         ) from exc
     else:
-        logging.info("Успешно импортирован update_catalogue, get_path")
+        logging.info("Успешно импортирован run_update_job, get_path")
     log_file = 'load_catalogue_script.log'
     path = get_path()
     full_name = os.path.join(path, log_file)
@@ -34,7 +35,18 @@ def main():
                         filename=full_name, filemode="w",
                         encoding='utf-8')
     print(f'logfile: {full_name}')
-    update_catalogue()
+    # Запуск через очередь задач исключает одновременную загрузку
+    # со страницы администратора или обработчиком очереди.
+    job = CatalogueUpdateJob.objects.enqueue(full='--full' in sys.argv)
+    if job is None:
+        print('Обновление запущено, дождитесь окончания запущенного процесса.')
+        return
+    job = CatalogueUpdateJob.objects.claim(get_worker_name(), pk=job.pk)
+    if job is None:
+        print('Задача обновления передана обработчику очереди')
+        return
+    job = run_update_job(job)
+    print(f'Задача {job.pk}: {job.get_status_display()}')
 
 
 if __name__ == '__main__':